@@ -1,27 +1,90 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
-from llm_parser import parse_to_workflow
-from workflow_executor import execute_workflow
-from typing import Dict, List, Any, Optional
+from llm_parser import parse_to_workflow_async, parse_to_workflow_stream
+from llm_gateway import get_llm_gateway
+from parse_cache import get_parse_cache
+from workflow_templates import get_template_store
+from intent_rules import get_rule_stats
+from checkpoint_store import get_checkpoint_store
+from step_cache import get_step_cache
+from upload_index import get_upload_index
+from http_cache import get_http_cache
+from sql_cache import get_sql_cache
+from sql_rules import get_sql_rule_stats
+from workflow_executor import get_executor
+from mcp_client import get_client
+from async_runner import run_async
+from typing import Awaitable, Dict, List, Any, Optional
+
+# 检测客户端断开连接的轮询间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
+async def _startup(app: FastAPI):
+    """在后台事件循环上创建共享资源"""
+    await get_llm_gateway().start()
+    
+    client = get_client()
+    await client.start()
+    app.state.executor = get_executor()
+    
+    # 数据库引擎为可选资源，驱动缺失或配置错误时不影响工作流服务
+    app.state.db_client = None
+    try:
+        from database_mcp_client import get_default_client
+        app.state.db_client = get_default_client()
+    except Exception as e:
+        print(f"数据库客户端初始化失败，数据库功能不可用: {str(e)}")
+    if app.state.db_client is not None:
+        try:
+            await app.state.db_client.warm_up()
+            # 一次查询加载所有已配置表的结构
+            await app.state.db_client.schema_catalog.load()
+        except Exception as e:
+            print(f"数据库连接预热失败: {str(e)}")
+
+async def _shutdown(app: FastAPI):
+    """释放共享资源"""
+    if app.state.db_client is not None:
+        await app.state.db_client.registry.dispose_all()
+    await get_client().close()
+    await get_llm_gateway().close()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：资源只创建一次，并全部运行在常驻后台事件循环上"""
+    await run_async(_startup(app))
+    try:
+        yield
+    finally:
+        await run_async(_shutdown(app))
 
 app = FastAPI(
     title="MCP 自然语言工作流系统",
     description="将自然语言转换为可执行的工作流，并调用 MCP 能力执行",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 class WorkflowRequest(BaseModel):
     query: str
     parallel: Optional[bool] = False
     stop_on_error: Optional[bool] = True
+    # 流式解析：步骤生成一个执行一个，解析与执行重叠
+    stream: Optional[bool] = False
+    # 工作流整体超时和单步超时（秒）
+    timeout: Optional[float] = None
+    step_timeout: Optional[float] = None
     
     class Config:
         schema_extra = {
             "example": {
                 "query": "部署 my-app 到生产环境，然后发送钉钉通知",
                 "parallel": False,
-                "stop_on_error": True
+                "stop_on_error": True,
+                "stream": False
             }
         }
 
@@ -58,7 +121,11 @@ def root():
         "status": "running",
         "endpoints": {
             "workflow": "/workflow",
+            "resume": "/workflow/{run_id}/resume",
+            "runs": "/workflow/runs",
+            "notifications": "/notifications/{message_id}",
             "health": "/health",
+            "stats": "/stats",
             "docs": "/docs"
         }
     }
@@ -71,8 +138,112 @@ def health_check():
         "service": "mcp-workflow"
     }
 
+async def _run_workflow(query: str, parallel: Optional[bool] = None,
+                        stop_on_error: Optional[bool] = None,
+                        stream: bool = False,
+                        timeout: Optional[float] = None,
+                        step_timeout: Optional[float] = None) -> WorkflowResponse:
+    """解析并执行工作流"""
+    if stream:
+        # 边解析边执行
+        step_stream = parse_to_workflow_stream(query)
+        workflow = step_stream.workflow
+    else:
+        # 1. 调用大模型解析为工作流
+        workflow = await parse_to_workflow_async(query)
+    
+    # 添加用户指定的执行选项
+    if parallel is not None:
+        workflow["parallel"] = parallel
+    if stop_on_error is not None:
+        workflow["stop_on_error"] = stop_on_error
+    if timeout is not None:
+        workflow["timeout"] = timeout
+    if step_timeout is not None:
+        workflow["step_timeout"] = step_timeout
+        
+    # 2. 执行工作流
+    if stream:
+        result, steps = await app.state.executor.execute_workflow_stream(step_stream, workflow)
+    else:
+        result, steps = await app.state.executor.execute_workflow_async(workflow)
+    
+    return WorkflowResponse(result=result, steps=steps)
+
+async def _run_until_disconnect(request: Request, coro: Awaitable[Any]) -> Any:
+    """
+    在后台事件循环上执行协程，客户端断开连接时取消仍在进行的工作
+    """
+    task = asyncio.ensure_future(run_async(coro))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                # 客户端已断开，响应不会被读取
+                return JSONResponse(status_code=499, content={"error": "Client Closed Request"})
+    finally:
+        if not task.done():
+            task.cancel()
+
+@app.get("/stats")
+def stats():
+    """运行时统计：连接池、大模型调用和解析缓存"""
+    checkpoints = get_checkpoint_store()
+    return {
+        "http_pool": get_client().get_pool_stats(),
+        "executor": app.state.executor.get_stats(),
+        "llm": get_llm_gateway().get_stats(),
+        "parse_cache": get_parse_cache().get_stats(),
+        "sql_cache": get_sql_cache().get_stats(),
+        "sql_rules": get_sql_rule_stats(),
+        "step_cache": get_step_cache().get_stats(),
+        "upload_index": get_upload_index().get_stats(),
+        "http_cache": get_http_cache().get_stats(),
+        "dingtalk": get_client().dingtalk.get_stats(),
+        "templates": get_template_store().get_stats(),
+        "rules": get_rule_stats(),
+        "checkpoints": checkpoints.get_stats() if checkpoints is not None else None,
+        "db_pools": app.state.db_client.registry.get_stats() if app.state.db_client is not None else None,
+        "schema_catalog": app.state.db_client.schema_catalog.get_stats() if app.state.db_client is not None else None
+    }
+
+@app.get("/templates")
+def list_templates():
+    """查看已学习的工作流模板"""
+    return {"templates": get_template_store().list_templates()}
+
+@app.delete("/templates/{template_id}")
+def delete_template(template_id: str):
+    """删除指定的工作流模板"""
+    if not get_template_store().remove(template_id):
+        raise HTTPException(status_code=404, detail=f"模板不存在: {template_id}")
+    return {"status": "success", "template_id": template_id}
+
+@app.post("/templates/prune")
+def prune_templates(min_hits: int = 0, max_idle_seconds: Optional[float] = None):
+    """清理命中过少或长期未使用的工作流模板"""
+    removed = get_template_store().prune(min_hits, max_idle_seconds)
+    return {"status": "success", "removed": removed}
+
+@app.delete("/cache/steps")
+def invalidate_step_cache(action: Optional[str] = None):
+    """清除步骤结果缓存，可只清除指定动作"""
+    removed = get_step_cache().invalidate(action)
+    return {"status": "success", "removed": removed}
+
+@app.delete("/cache/schema")
+def invalidate_schema_cache(table: Optional[str] = None):
+    """数据库迁移后让表结构在下次访问时重新加载"""
+    if app.state.db_client is None:
+        raise HTTPException(status_code=503, detail="数据库功能不可用")
+    app.state.db_client.schema_catalog.invalidate(table)
+    return {"status": "success"}
+
 @app.post("/workflow", response_model=WorkflowResponse, summary="执行工作流")
-def workflow_endpoint(req: WorkflowRequest):
+async def workflow_endpoint(req: WorkflowRequest, request: Request):
     """
     将自然语言查询转换为工作流并执行
     
@@ -87,33 +258,59 @@ def workflow_endpoint(req: WorkflowRequest):
     - "上传日志文件到文档服务"
     """
     try:
-        # 1. 调用大模型解析为工作流
-        workflow = parse_to_workflow(req.query)
+        return await _run_until_disconnect(
+            request, _run_workflow(req.query, req.parallel, req.stop_on_error, bool(req.stream),
+                                   req.timeout, req.step_timeout)
+        )
         
-        # 添加用户指定的执行选项
-        if req.parallel is not None:
-            workflow["parallel"] = req.parallel
-        if req.stop_on_error is not None:
-            workflow["stop_on_error"] = req.stop_on_error
-            
-        # 2. 执行工作流
-        result, steps = execute_workflow(workflow)
-        
-        return WorkflowResponse(result=result, steps=steps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"系统错误: {str(e)}")
+
+@app.post("/workflow/{run_id}/resume", response_model=WorkflowResponse, summary="恢复工作流")
+async def resume_workflow_endpoint(run_id: str, request: Request):
+    """
+    从检查点恢复一次运行：已成功的步骤复用结果，从第一个未完成的步骤继续执行，不重新解析查询
+    """
+    try:
+        result = await _run_until_disconnect(request, app.state.executor.resume_workflow_async(run_id))
+        if isinstance(result, JSONResponse):
+            return result
+        summary, steps = result
+        return WorkflowResponse(result=summary, steps=steps)
         
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"运行不存在: {run_id}")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"系统错误: {str(e)}")
 
+@app.get("/workflow/runs")
+def list_workflow_runs(limit: int = 50):
+    """最近的工作流运行"""
+    store = get_checkpoint_store()
+    if store is None:
+        return {"runs": []}
+    return {"runs": store.list_runs(limit)}
+
+@app.get("/notifications/{message_id}")
+def get_notification(message_id: str):
+    """查询钉钉通知的投递结果"""
+    delivery = get_client().dingtalk.get_delivery(message_id)
+    if delivery is None:
+        raise HTTPException(status_code=404, detail=f"通知不存在或结果已过期: {message_id}")
+    return delivery
+
 @app.get("/test")
-def test_workflow():
+async def test_workflow(request: Request):
     """测试端点，运行一个示例工作流"""
     sample_query = "发送钉钉消息说测试成功"
     try:
-        workflow = parse_to_workflow(sample_query)
-        result, steps = execute_workflow(workflow)
-        return WorkflowResponse(result=result, steps=steps)
+        return await _run_until_disconnect(request, _run_workflow(sample_query))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -125,7 +322,7 @@ async def not_found_handler(request, exc):
         content={
             "error": "Not Found",
             "message": f"路径 {request.url.path} 不存在",
-            "available_endpoints": ["/", "/workflow", "/health", "/docs"]
+            "available_endpoints": ["/", "/workflow", "/health", "/stats", "/docs"]
         }
     )
 
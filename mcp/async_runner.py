@@ -0,0 +1,135 @@
+# async_runner.py
+"""
+后台事件循环运行器
+为同步入口提供一个进程级常驻事件循环，使连接池、数据库引擎和缓存在多次调用之间得以复用
+"""
+
+import asyncio
+import atexit
+import threading
+from typing import Any, Awaitable, Optional
+
+
+class BackgroundLoopRunner:
+    """在独立线程中运行的常驻事件循环"""
+
+    def __init__(self, name: str = "mcp-async-runner"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """获取后台事件循环（必要时启动）"""
+        self.start()
+        return self._loop
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        """启动后台线程，重复调用是安全的"""
+        if self.is_running():
+            return
+        with self._lock:
+            if self.is_running():
+                return
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            thread = threading.Thread(target=_run, name=self.name, daemon=True)
+            thread.start()
+            started.wait()
+            self._loop = loop
+            self._thread = thread
+
+    def in_runner_thread(self) -> bool:
+        """当前线程是否就是后台事件循环线程"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable[Any]):
+        """提交协程到后台循环，返回 concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """同步执行协程并阻塞等待结果（线程安全）"""
+        if self.in_runner_thread():
+            # 在后台循环线程里同步等待自己会造成死锁
+            coro.close()
+            raise RuntimeError("不能在后台事件循环线程中同步等待协程")
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    async def run_async(self, coro: Awaitable[Any]) -> Any:
+        """在任意事件循环中等待协程在后台循环上执行完成"""
+        if self.in_runner_thread():
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stop(self, timeout: Optional[float] = 5) -> None:
+        """停止后台循环，取消未完成的任务"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            if loop is None or thread is None or not thread.is_alive():
+                return
+
+            async def _cancel_pending():
+                current = asyncio.current_task()
+                tasks = [t for t in asyncio.all_tasks() if t is not current]
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await loop.shutdown_asyncgens()
+
+            try:
+                asyncio.run_coroutine_threadsafe(_cancel_pending(), loop).result(timeout)
+            except Exception as e:
+                print(f"关闭后台事件循环时出错: {str(e)}")
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            loop.close()
+            self._loop = None
+            self._thread = None
+
+
+# 全局运行器实例
+_runner = BackgroundLoopRunner()
+
+def get_runner() -> BackgroundLoopRunner:
+    """获取全局后台运行器"""
+    return _runner
+
+def run_sync(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """
+    同步接口：在全局后台事件循环上执行协程并返回结果
+    """
+    return _runner.run(coro, timeout)
+
+async def run_async(coro: Awaitable[Any]) -> Any:
+    """
+    异步接口：从任意事件循环把协程交给全局后台事件循环执行
+    """
+    return await _runner.run_async(coro)
+
+def register_shutdown(coro_factory) -> None:
+    """注册进程退出时在后台循环上执行的清理协程"""
+    def _cleanup():
+        if _runner.is_running():
+            try:
+                _runner.run(coro_factory(), timeout=5)
+            except Exception as e:
+                print(f"执行退出清理时出错: {str(e)}")
+    # atexit 按注册的逆序执行，保证清理先于 stop 运行
+    atexit.register(_cleanup)
+
+atexit.register(_runner.stop)
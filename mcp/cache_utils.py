@@ -0,0 +1,278 @@
+# cache_utils.py
+"""
+通用缓存工具
+提供查询归一化、带 TTL 的 LRU 内存缓存、SQLite 持久化缓存层和 single-flight 请求合并
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import asyncio
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 本地状态文件（上传索引、执行检查点等）的默认目录，不放在当前工作目录下
+MCP_DATA_DIR = os.path.expanduser(os.getenv("MCP_DATA_DIR") or "~/.cache/mcp")
+
+# NFKC 不会处理的中文标点
+_PUNCTUATION_MAP = str.maketrans({
+    "。": ".",
+    "、": ",",
+    "“": '"',
+    "”": '"',
+    "‘": "'",
+    "’": "'",
+    "「": '"',
+    "」": '"',
+    "『": '"',
+    "』": '"',
+    "【": "[",
+    "】": "]",
+    "《": "<",
+    "》": ">",
+    "～": "~",
+})
+_WHITESPACE_RE = re.compile(r"\s+")
+
+def normalize_query(text: str, casefold: bool = True) -> str:
+    """
+    归一化自然语言查询：全角转半角、统一标点、合并空白，casefold 为 True 时忽略大小写
+    """
+    text = unicodedata.normalize("NFKC", text or "").translate(_PUNCTUATION_MAP)
+    if casefold:
+        text = text.casefold()
+    text = _WHITESPACE_RE.sub(" ", text).strip()
+    # 末尾的句号、感叹号等不影响语义
+    return text.rstrip(".!?;,~ ")
+
+def stable_hash(*parts: Any) -> str:
+    """对任意可 JSON 序列化的内容计算稳定的 sha256"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """分块计算文件内容的 sha256，不把整个文件读入内存"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# 文件哈希按 (路径, 大小, 修改时间) 缓存，同一文件在一次工作流中只计算一次
+_file_digests: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_FILE_DIGESTS_MAX = 1024
+_file_digests_lock = threading.Lock()
+
+def cached_file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件 sha256，文件未变化时复用上次的结果"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _file_digests_lock:
+        digest = _file_digests.get(key)
+        if digest is not None:
+            _file_digests.move_to_end(key)
+            return digest
+    digest = file_sha256(path, chunk_size)
+    with _file_digests_lock:
+        _file_digests[key] = digest
+        while len(_file_digests) > _FILE_DIGESTS_MAX:
+            _file_digests.popitem(last=False)
+    return digest
+
+
+class TTLCache:
+    """带过期时间的 LRU 内存缓存"""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = 3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str) -> bool:
+        return self._data.pop(key, None) is not None
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+def data_path(name: str) -> str:
+    """MCP_DATA_DIR 下的文件路径"""
+    return os.path.join(MCP_DATA_DIR, name)
+
+
+def ensure_parent_dir(path: str) -> None:
+    """创建数据库文件所在的目录"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+
+class SQLiteCacheStore:
+    """基于 SQLite 的持久化键值缓存，值以 JSON 存储"""
+
+    def __init__(self, path: str, table: str = "cache_entries"):
+        if not re.match(r"^[A-Za-z_][A-Za-z0-9_]*$", table):
+            raise ValueError(f"无效的表名: {table}")
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        ensure_parent_dir(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL, updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= time.time():
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, payload, expires_at, now)
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                (time.time(),)
+            )
+            self._conn.commit()
+            return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SingleFlight:
+    """合并同一个键上并发的重复调用，只执行一次"""
+
+    def __init__(self):
+        self._inflight: Dict[str, "asyncio.Future[Any]"] = {}
+        # 每个共享调用上仍在等待的调用方数量
+        self._waiters: Dict["asyncio.Future[Any]", int] = {}
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def in_flight(self, key: str) -> bool:
+        return key in self._inflight
+
+    def _forget(self, key: str, task: "asyncio.Future[Any]") -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        self._waiters.pop(task, None)
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        执行 factory 并返回 (结果, 是否复用了他人的调用)
+        单个调用方被取消不会中断共享的调用；最后一个等待的调用方被取消时取消共享调用
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+        if shared:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task), shared
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters.get(task) == 1:
+                # 没有其他调用方在等待结果，停止共享调用并释放其占用的连接
+                self._forget(key, task)
+                task.cancel()
+                self.cancelled += 1
+            raise
+        finally:
+            if task in self._waiters:
+                self._waiters[task] -= 1
@@ -0,0 +1,244 @@
+# checkpoint_store.py
+"""
+工作流执行检查点
+每次运行的工作流定义、每个步骤的执行信息和最终汇总以事件形式追加写入本地 SQLite（WAL），
+失败后可以从第一个未完成的步骤继续执行，无需重新解析和重跑已成功的步骤。
+事件在调用方线程中序列化，写入由后台线程批量完成，不占用步骤的执行时间。
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from cache_utils import data_path, ensure_parent_dir
+
+# 加载环境变量
+load_dotenv()
+
+WORKFLOW_CHECKPOINT_ENABLED = os.getenv("WORKFLOW_CHECKPOINT_ENABLED", "true").lower() == "true"
+WORKFLOW_CHECKPOINT_DB = os.getenv("WORKFLOW_CHECKPOINT_DB", data_path("workflow_checkpoints.db"))
+# 后台写入线程攒批的最长等待时间（秒）和单批最大事件数
+WORKFLOW_CHECKPOINT_FLUSH_INTERVAL = float(os.getenv("WORKFLOW_CHECKPOINT_FLUSH_INTERVAL", "0.2"))
+WORKFLOW_CHECKPOINT_BATCH_SIZE = int(os.getenv("WORKFLOW_CHECKPOINT_BATCH_SIZE", "200"))
+# 恢复运行前等待未写盘事件的最长时间（秒），超时后读取已提交的事件
+WORKFLOW_CHECKPOINT_READ_TIMEOUT = float(os.getenv("WORKFLOW_CHECKPOINT_READ_TIMEOUT", "2"))
+
+# 事件类型
+EVENT_WORKFLOW = "workflow"
+EVENT_STEP = "step"
+EVENT_FINISH = "finish"
+
+_STOP = object()
+
+
+def new_run_id() -> str:
+    """生成运行 id"""
+    return uuid.uuid4().hex
+
+
+class CheckpointStore:
+    """只追加的检查点事件表"""
+
+    def __init__(self, path: str = WORKFLOW_CHECKPOINT_DB,
+                 flush_interval: float = WORKFLOW_CHECKPOINT_FLUSH_INTERVAL,
+                 batch_size: int = WORKFLOW_CHECKPOINT_BATCH_SIZE):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        ensure_parent_dir(path)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoint_events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT NOT NULL, kind TEXT NOT NULL, "
+            "step_index INTEGER, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_checkpoint_events_run ON checkpoint_events (run_id, id)"
+        )
+        self._conn.commit()
+
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        # 每个运行已入队但尚未写完的事件数，读取单个运行时只等待它自己的事件
+        self._pending: Counter = Counter()
+        self._pending_cond = threading.Condition()
+        self._closed = False
+        self.events_written = 0
+        self.batches_written = 0
+        self.write_errors = 0
+        self._writer = threading.Thread(target=self._write_loop, name="checkpoint-writer", daemon=True)
+        self._writer.start()
+
+    def record(self, run_id: str, kind: str, payload: Dict[str, Any],
+               step_index: Optional[int] = None) -> None:
+        """
+        追加一条事件，只入队不等待写盘。
+        payload 在这里序列化，之后调用方修改其中的字典不会影响已记录的内容
+        """
+        if self._closed:
+            return
+        try:
+            data = json.dumps(payload, ensure_ascii=False, default=str)
+        except Exception as e:
+            self.write_errors += 1
+            print(f"检查点事件序列化失败: {str(e)}")
+            return
+        with self._pending_cond:
+            self._pending[run_id] += 1
+        self._queue.put((run_id, kind, step_index, data, time.time()))
+
+    def _write_loop(self) -> None:
+        """后台线程：攒批后在一个事务中写入"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while batch[-1] is not _STOP and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            stop = batch[-1] is _STOP
+            events = batch[:-1] if stop else batch
+            if events:
+                self._write(events)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, rows: List[Any]) -> None:
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT INTO checkpoint_events (run_id, kind, step_index, payload, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self._conn.commit()
+            self.events_written += len(rows)
+            self.batches_written += 1
+        except Exception as e:
+            self.write_errors += 1
+            print(f"检查点写入失败: {str(e)}")
+        finally:
+            with self._pending_cond:
+                for row in rows:
+                    self._pending[row[0]] -= 1
+                    if self._pending[row[0]] <= 0:
+                        del self._pending[row[0]]
+                self._pending_cond.notify_all()
+
+    def flush(self, timeout: Optional[float] = None, run_id: Optional[str] = None) -> bool:
+        """
+        等待已入队的事件写盘，返回是否在超时前写完；
+        指定 run_id 时只等待该运行的事件，不受其他运行写入的影响
+        """
+        with self._pending_cond:
+            if run_id is None:
+                return self._pending_cond.wait_for(lambda: not self._pending, timeout)
+            return self._pending_cond.wait_for(lambda: not self._pending[run_id], timeout)
+
+    def load_run(self, run_id: str,
+                 flush_timeout: float = WORKFLOW_CHECKPOINT_READ_TIMEOUT) -> Optional[Dict[str, Any]]:
+        """
+        重放一次运行的事件，返回最新的工作流定义、每个步骤的最新执行信息和汇总。
+        读取前最多等待 flush_timeout 秒让该运行未写盘的事件落盘
+        """
+        if not self.flush(flush_timeout, run_id=run_id):
+            print(f"检查点事件未在 {flush_timeout} 秒内写完，读取已提交的事件")
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, step_index, payload, created_at FROM checkpoint_events "
+                "WHERE run_id = ? ORDER BY id",
+                (run_id,)
+            ).fetchall()
+        if not rows:
+            return None
+
+        run = {"run_id": run_id, "workflow": None, "steps": {}, "summary": None,
+               "created_at": rows[0][3], "updated_at": rows[-1][3]}
+        for kind, step_index, payload, _ in rows:
+            data = json.loads(payload)
+            if kind == EVENT_WORKFLOW:
+                run["workflow"] = data
+            elif kind == EVENT_STEP:
+                run["steps"][step_index] = data
+            elif kind == EVENT_FINISH:
+                run["summary"] = data.get("summary")
+                if data.get("workflow") is not None:
+                    run["workflow"] = data["workflow"]
+        return run
+
+    def list_runs(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """最近的运行及其最终状态（只读取已提交的事件，不等待写盘）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT run_id, MIN(created_at), MAX(created_at), "
+                "(SELECT payload FROM checkpoint_events f WHERE f.run_id = e.run_id AND f.kind = ? "
+                " ORDER BY f.id DESC LIMIT 1) "
+                "FROM checkpoint_events e GROUP BY run_id ORDER BY MAX(id) DESC LIMIT ?",
+                (EVENT_FINISH, limit)
+            ).fetchall()
+        runs = []
+        for run_id, created_at, updated_at, finish in rows:
+            summary = json.loads(finish).get("summary") if finish else None
+            runs.append({
+                "run_id": run_id,
+                "created_at": created_at,
+                "updated_at": updated_at,
+                "status": summary.get("status") if summary else "incomplete"
+            })
+        return runs
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "pending": self._queue.qsize(),
+            "events_written": self.events_written,
+            "batches_written": self.batches_written,
+            "write_errors": self.write_errors
+        }
+
+    def close(self) -> None:
+        """写完剩余事件后关闭"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        with self._lock:
+            self._conn.close()
+
+
+# 全局检查点存储，首次使用时创建
+_checkpoint_store: Optional[CheckpointStore] = None
+_checkpoint_store_lock = threading.Lock()
+
+def get_checkpoint_store() -> Optional[CheckpointStore]:
+    """获取全局检查点存储，未启用或初始化失败时返回 None"""
+    global _checkpoint_store
+    if not WORKFLOW_CHECKPOINT_ENABLED:
+        return None
+    if _checkpoint_store is None:
+        with _checkpoint_store_lock:
+            if _checkpoint_store is None:
+                try:
+                    _checkpoint_store = CheckpointStore()
+                    atexit.register(_checkpoint_store.close)
+                except Exception as e:
+                    print(f"检查点存储初始化失败，工作流将无法恢复: {str(e)}")
+                    return None
+    return _checkpoint_store
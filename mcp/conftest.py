@@ -0,0 +1,57 @@
+# conftest.py
+"""
+pytest 公共夹具：在后台线程中启动 mock_services，测试通过真实的 HTTP 请求访问
+"""
+
+import socket
+import asyncio
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+import pytest
+import uvicorn
+
+import mock_services
+from mcp_client import MCPClient
+from upload_index import UploadIndex
+
+# 需要手动启动服务和数据库的示例脚本，不作为 pytest 用例收集
+collect_ignore = ["test_workflow.py", "test_database_client.py"]
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def mock_server() -> str:
+    """启动模拟服务，返回基础 URL"""
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(mock_services.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("模拟服务启动超时")
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+@pytest.fixture
+def run_with_client(mock_server: str) -> Callable[[Callable[[MCPClient], Awaitable[Any]]], Any]:
+    """在新的事件循环中用指向模拟服务的客户端执行场景；上传索引只使用内存"""
+    def _run(scenario: Callable[[MCPClient], Awaitable[Any]]) -> Any:
+        async def _main():
+            client = MCPClient(upload_index=UploadIndex(db_path=""))
+            client.file_upload_api_url = mock_server
+            client.deploy_api_url = mock_server
+            async with client:
+                return await scenario(client)
+        return asyncio.run(_main())
+    return _run
@@ -0,0 +1,372 @@
+# data_process.py
+"""
+data_process 动作
+对步骤之间传递的 JSON 数组执行固定的一组操作：filter、project、group_by、sort、top_k、dedupe。
+数据先转换为列式结构（字段 -> Python 列表），各操作逐列处理；
+除很小的输入外都不在事件循环中计算：中等数据量在线程池中处理，大数据量提交到进程池。
+"""
+
+import os
+import json
+import heapq
+import asyncio
+import operator
+import threading
+import multiprocessing
+from itertools import compress
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 行数低于该阈值时直接在事件循环中计算，达到后在线程池中处理
+DATA_PROCESS_INLINE_THRESHOLD = int(os.getenv("DATA_PROCESS_INLINE_THRESHOLD", "1000"))
+# 行数达到该阈值时在进程池中处理
+DATA_PROCESS_PROCESS_THRESHOLD = int(os.getenv("DATA_PROCESS_PROCESS_THRESHOLD", "50000"))
+DATA_PROCESS_WORKERS = int(os.getenv("DATA_PROCESS_WORKERS", "0")) or None
+
+OPERATIONS = ("filter", "project", "group_by", "sort", "top_k", "dedupe")
+
+_COMPARATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "in": lambda a, b: a in b,
+    "not_in": lambda a, b: a not in b,
+    "contains": lambda a, b: a is not None and b in a,
+    "startswith": lambda a, b: isinstance(a, str) and a.startswith(b),
+}
+
+
+class Table:
+    """
+    按列存放的数据表，每列是一个 Python 列表。
+    缺少某个字段的行在该列中为 None，present 记录这些列中每行是否真的有该字段，
+    输出时只包含行原本就有的字段
+    """
+
+    def __init__(self, columns: Dict[str, List[Any]], length: int,
+                 present: Optional[Dict[str, List[bool]]] = None):
+        self.columns = columns
+        self.length = length
+        # 只记录有行缺失的列，所有行都有的列不在其中
+        self.present = present or {}
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "Table":
+        if not isinstance(rows, list) or any(not isinstance(row, dict) for row in rows):
+            raise ValueError("data 必须是对象数组")
+        names: Dict[str, None] = {}
+        for row in rows:
+            for name in row:
+                names.setdefault(name, None)
+        columns = {name: [row.get(name) for row in rows] for name in names}
+        present = {}
+        for name in names:
+            flags = [name in row for row in rows]
+            if not all(flags):
+                present[name] = flags
+        return cls(columns, len(rows), present)
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        names = list(self.columns)
+        if not names:
+            return [{} for _ in range(self.length)]
+        rows = [dict(zip(names, values)) for values in zip(*self.columns.values())]
+        for name, flags in self.present.items():
+            for row, has in zip(rows, flags):
+                if not has:
+                    del row[name]
+        return rows
+
+    def column(self, name: str) -> List[Any]:
+        return self.columns.get(name) or [None] * self.length
+
+    def column_present(self, name: str) -> Optional[List[bool]]:
+        """列中每行是否有该字段，所有行都有时返回 None"""
+        if name not in self.columns:
+            return [False] * self.length
+        return self.present.get(name)
+
+    def take(self, indices: List[int]) -> "Table":
+        """按行号取子表"""
+        return Table({name: [col[i] for i in indices] for name, col in self.columns.items()}, len(indices),
+                     {name: [flags[i] for i in indices] for name, flags in self.present.items()})
+
+    def mask(self, selectors: List[bool]) -> "Table":
+        """按布尔掩码取子表"""
+        columns = {name: list(compress(col, selectors)) for name, col in self.columns.items()}
+        present = {name: list(compress(flags, selectors)) for name, flags in self.present.items()}
+        return Table(columns, sum(selectors), present)
+
+
+def _as_list(value: Any) -> List[Any]:
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _sort_key(value: Any) -> Tuple[int, str, Any]:
+    """数字在前、其他类型按类型名分组、None 在最后，避免不同类型之间比较报错"""
+    if value is None:
+        return (2, "", "")
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (0, "", value)
+    if isinstance(value, str):
+        return (1, "str", value)
+    return (1, type(value).__name__, json.dumps(value, sort_keys=True, default=str))
+
+
+def _condition_mask(table: Table, condition: Dict[str, Any]) -> List[bool]:
+    field = condition.get("field")
+    op = condition.get("op", "==")
+    values = table.column(field)
+    if op == "exists":
+        return [v is not None for v in values]
+    if op == "not_exists":
+        return [v is None for v in values]
+    compare = _COMPARATORS.get(op)
+    if compare is None:
+        raise ValueError(f"不支持的比较运算: {op}")
+    target = condition.get("value")
+    # 缺失值只满足否定条件
+    skip_none = op not in ("!=", "not_in")
+
+    def _test(v):
+        if v is None and skip_none:
+            return False
+        try:
+            return bool(compare(v, target))
+        except TypeError:
+            return False
+    return list(map(_test, values))
+
+
+def op_filter(table: Table, spec: Dict[str, Any]) -> Table:
+    """where: [{field, op, value}]，mode 为 all（默认）或 any"""
+    conditions = _as_list(spec.get("where") or spec.get("conditions"))
+    if not conditions:
+        return table
+    masks = [_condition_mask(table, c) for c in conditions]
+    combine = any if spec.get("mode") == "any" else all
+    return table.mask(list(map(combine, zip(*masks))))
+
+
+def op_project(table: Table, spec: Dict[str, Any]) -> Table:
+    """fields: 字段列表，或 {新字段名: 原字段名}"""
+    fields = spec.get("fields")
+    if isinstance(fields, dict):
+        mapping = fields
+    else:
+        mapping = {name: name for name in _as_list(fields)}
+    if not mapping:
+        raise ValueError("project 需要 fields")
+    present = {new: table.column_present(old) for new, old in mapping.items()}
+    return Table({new: table.column(old) for new, old in mapping.items()}, table.length,
+                 {new: flags for new, flags in present.items() if flags is not None})
+
+
+def _aggregate(func: str, values: List[Any]) -> Any:
+    if func == "count":
+        return len(values)
+    present = [v for v in values if v is not None]
+    if func == "count_distinct":
+        return len(set(map(json.dumps, present)))
+    if func in ("sum", "avg"):
+        numbers = [v for v in present if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        total = sum(numbers)
+        if func == "sum":
+            return total
+        return total / len(numbers) if numbers else None
+    if func in ("min", "max"):
+        if not present:
+            return None
+        pick = min if func == "min" else max
+        return pick(present, key=_sort_key)
+    if func == "first":
+        return present[0] if present else None
+    raise ValueError(f"不支持的聚合函数: {func}")
+
+
+def op_group_by(table: Table, spec: Dict[str, Any]) -> Table:
+    """
+    by: 分组字段；aggregations: {输出字段: {"func": count|sum|avg|min|max|count_distinct|first, "field": 字段}}
+    """
+    by = _as_list(spec.get("by"))
+    aggregations = spec.get("aggregations") or {"count": {"func": "count"}}
+    groups: Dict[Tuple, List[int]] = {}
+    key_columns = [table.column(name) for name in by]
+    keys = zip(*key_columns) if key_columns else (() for _ in range(table.length))
+    for index, key in enumerate(keys):
+        groups.setdefault(tuple(json.dumps(k, sort_keys=True) if isinstance(k, (dict, list)) else k
+                                for k in key), []).append(index)
+
+    columns: Dict[str, List[Any]] = {name: [] for name in by}
+    for name in aggregations:
+        columns[name] = []
+    for indices in groups.values():
+        first = indices[0]
+        for name, col in zip(by, key_columns):
+            columns[name].append(col[first])
+        for name, agg in aggregations.items():
+            if isinstance(agg, str):
+                agg = {"func": agg, "field": name}
+            source = table.column(agg.get("field")) if agg.get("field") else None
+            values = [source[i] for i in indices] if source is not None else indices
+            columns[name].append(_aggregate(agg.get("func", "count"), values))
+    return Table(columns, len(groups))
+
+
+def _sort_fields(spec: Dict[str, Any]) -> List[Tuple[str, bool]]:
+    fields = []
+    default_desc = bool(spec.get("desc", False))
+    for item in _as_list(spec.get("by")):
+        if isinstance(item, dict):
+            fields.append((item.get("field"), bool(item.get("desc", default_desc))))
+        else:
+            fields.append((item, default_desc))
+    if not fields:
+        raise ValueError("sort 需要 by")
+    return fields
+
+
+def op_sort(table: Table, spec: Dict[str, Any]) -> Table:
+    """by: 字段或 [{field, desc}]，多字段稳定排序"""
+    indices = list(range(table.length))
+    # 从次要字段到主要字段依次稳定排序
+    for field, desc in reversed(_sort_fields(spec)):
+        column = table.column(field)
+        indices.sort(key=lambda i: _sort_key(column[i]), reverse=desc)
+        if desc:
+            # None 始终排在最后
+            indices.sort(key=lambda i: column[i] is None)
+    return table.take(indices)
+
+
+def op_top_k(table: Table, spec: Dict[str, Any]) -> Table:
+    """k: 条数；by: 排序字段；desc 默认为 true（取最大的 k 条）"""
+    k = int(spec.get("k", 10))
+    field = spec.get("by")
+    if not field:
+        raise ValueError("top_k 需要 by")
+    column = table.column(field)
+    candidates = [i for i in range(table.length) if column[i] is not None]
+    pick = heapq.nsmallest if spec.get("desc") is False else heapq.nlargest
+    return table.take(pick(k, candidates, key=lambda i: _sort_key(column[i])))
+
+
+def op_dedupe(table: Table, spec: Dict[str, Any]) -> Table:
+    """fields: 判断重复的字段，默认比较整行；保留首次出现的行"""
+    fields = _as_list(spec.get("fields")) or list(table.columns)
+    key_columns = [table.column(name) for name in fields]
+    seen = set()
+    selectors = []
+    for key in zip(*key_columns) if key_columns else (() for _ in range(table.length)):
+        marker = json.dumps(key, sort_keys=True, default=str)
+        selectors.append(marker not in seen)
+        seen.add(marker)
+    return table.mask(selectors)
+
+
+_OPERATION_HANDLERS: Dict[str, Callable[[Table, Dict[str, Any]], Table]] = {
+    "filter": op_filter,
+    "project": op_project,
+    "group_by": op_group_by,
+    "sort": op_sort,
+    "top_k": op_top_k,
+    "dedupe": op_dedupe,
+}
+
+
+def normalize_operations(params: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    operation 可以是操作名（其余参数为操作参数）、单个操作对象 {"op": ...}，或操作对象数组（按顺序执行）
+    """
+    operation = params.get("operation")
+    if isinstance(operation, str):
+        specs = [dict({k: v for k, v in params.items() if k not in ("data", "operation", "path")}, op=operation)]
+    else:
+        specs = _as_list(operation)
+    if not specs:
+        raise ValueError("缺少 operation")
+    for spec in specs:
+        if not isinstance(spec, dict) or spec.get("op") not in _OPERATION_HANDLERS:
+            raise ValueError(f"不支持的操作: {spec}，可用操作: {', '.join(OPERATIONS)}")
+    return specs
+
+
+def extract_rows(data: Any, path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """从输入中取出要处理的数组；path 为点分路径，例如 "result.body.items" """
+    if isinstance(data, str):
+        data = json.loads(data)
+    for part in (path.split(".") if path else []):
+        data = data[int(part)] if isinstance(data, list) else data[part]
+    if isinstance(data, dict):
+        # 常见的结果包装
+        for key in ("rows", "data", "items", "body", "result"):
+            if isinstance(data.get(key), list):
+                return data[key]
+    return data
+
+
+def run_pipeline(rows: List[Dict[str, Any]], specs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """执行操作管道（可在子进程中运行）"""
+    table = Table.from_rows(rows)
+    for spec in specs:
+        table = _OPERATION_HANDLERS[spec["op"]](table, spec)
+    return table.to_rows()
+
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                # spawn 启动的子进程不继承事件循环线程和连接池
+                _process_pool = ProcessPoolExecutor(max_workers=DATA_PROCESS_WORKERS,
+                                                    mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+
+async def process_data(params: Dict[str, Any]) -> Dict[str, Any]:
+    """data_process 动作入口"""
+    try:
+        specs = normalize_operations(params)
+        rows = extract_rows(params.get("data"), params.get("path"))
+        if not isinstance(rows, list):
+            raise ValueError("data 必须是对象数组")
+
+        loop = asyncio.get_running_loop()
+        if len(rows) >= DATA_PROCESS_PROCESS_THRESHOLD:
+            result = await loop.run_in_executor(_get_process_pool(), run_pipeline, rows, specs)
+            executor = "process"
+        elif len(rows) >= DATA_PROCESS_INLINE_THRESHOLD:
+            result = await loop.run_in_executor(None, run_pipeline, rows, specs)
+            executor = "thread"
+        else:
+            result = run_pipeline(rows, specs)
+            executor = "inline"
+
+        return {
+            "status": "success",
+            "data": result,
+            "count": len(result),
+            "input_count": len(rows),
+            "operations": [spec["op"] for spec in specs],
+            "executor": executor,
+            "message": "数据处理完成"
+        }
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e),
+            "message": "数据处理失败"
+        }
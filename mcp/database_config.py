@@ -3,11 +3,12 @@
 定义各种业务场景下的表结构和字段映射
 """
 
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 import json
 import os
-from openai import OpenAI
+from llm_gateway import get_llm_gateway
+from async_runner import run_sync
 
 @dataclass
 class TableConfig:
@@ -103,63 +104,90 @@ NATURAL_LANGUAGE_TABLE_MAPPING = {
     "操作日志": "user_logs"
 }
 
-# 时间描述到SQL的映射（PostgreSQL）
+# 时间描述到SQL条件的映射（PostgreSQL），{time_field} 为表配置中的时间字段
 TIME_MAPPING_PG = {
-    "近一年": "created_at >= NOW() - INTERVAL '1 year'",
-    "最近一年": "created_at >= NOW() - INTERVAL '1 year'",
-    "近12个月": "created_at >= NOW() - INTERVAL '12 months'",
-    "近30天": "created_at >= NOW() - INTERVAL '30 days'",
-    "最近30天": "created_at >= NOW() - INTERVAL '30 days'",
-    "近一个月": "created_at >= NOW() - INTERVAL '1 month'",
-    "本月": "created_at >= DATE_TRUNC('month', NOW())",
-    "当月": "created_at >= DATE_TRUNC('month', NOW())",
-    "上个月": "created_at >= DATE_TRUNC('month', NOW() - INTERVAL '1 month') AND created_at < DATE_TRUNC('month', NOW())",
-    "今年": "created_at >= DATE_TRUNC('year', NOW())",
-    "当年": "created_at >= DATE_TRUNC('year', NOW())",
-    "去年": "created_at >= DATE_TRUNC('year', NOW() - INTERVAL '1 year') AND created_at < DATE_TRUNC('year', NOW())",
-    "近7天": "created_at >= NOW() - INTERVAL '7 days'",
-    "最近7天": "created_at >= NOW() - INTERVAL '7 days'",
-    "近一周": "created_at >= NOW() - INTERVAL '1 week'",
-    "本周": "created_at >= DATE_TRUNC('week', NOW())",
-    "今天": "created_at >= DATE_TRUNC('day', NOW())",
-    "昨天": "created_at >= DATE_TRUNC('day', NOW() - INTERVAL '1 day') AND created_at < DATE_TRUNC('day', NOW())"
+    "近一年": "{time_field} >= NOW() - INTERVAL '1 year'",
+    "最近一年": "{time_field} >= NOW() - INTERVAL '1 year'",
+    "近12个月": "{time_field} >= NOW() - INTERVAL '12 months'",
+    "近30天": "{time_field} >= NOW() - INTERVAL '30 days'",
+    "最近30天": "{time_field} >= NOW() - INTERVAL '30 days'",
+    "近一个月": "{time_field} >= NOW() - INTERVAL '1 month'",
+    "本月": "{time_field} >= DATE_TRUNC('month', NOW())",
+    "当月": "{time_field} >= DATE_TRUNC('month', NOW())",
+    "上个月": "{time_field} >= DATE_TRUNC('month', NOW() - INTERVAL '1 month') AND {time_field} < DATE_TRUNC('month', NOW())",
+    "今年": "{time_field} >= DATE_TRUNC('year', NOW())",
+    "当年": "{time_field} >= DATE_TRUNC('year', NOW())",
+    "去年": "{time_field} >= DATE_TRUNC('year', NOW() - INTERVAL '1 year') AND {time_field} < DATE_TRUNC('year', NOW())",
+    "近7天": "{time_field} >= NOW() - INTERVAL '7 days'",
+    "最近7天": "{time_field} >= NOW() - INTERVAL '7 days'",
+    "近一周": "{time_field} >= NOW() - INTERVAL '1 week'",
+    "本周": "{time_field} >= DATE_TRUNC('week', NOW())",
+    "今天": "{time_field} >= DATE_TRUNC('day', NOW())",
+    "昨天": "{time_field} >= DATE_TRUNC('day', NOW() - INTERVAL '1 day') AND {time_field} < DATE_TRUNC('day', NOW())"
 }
 
-# 时间描述到SQL的映射（MySQL）
+# 时间描述到SQL条件的映射（MySQL）
 TIME_MAPPING_MYSQL = {
-    "近一年": "created_at >= DATE_SUB(NOW(), INTERVAL 1 YEAR)",
-    "最近一年": "created_at >= DATE_SUB(NOW(), INTERVAL 1 YEAR)",
-    "近12个月": "created_at >= DATE_SUB(NOW(), INTERVAL 12 MONTH)",
-    "近30天": "created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)",
-    "最近30天": "created_at >= DATE_SUB(NOW(), INTERVAL 30 DAY)",
-    "近一个月": "created_at >= DATE_SUB(NOW(), INTERVAL 1 MONTH)",
-    "本月": "created_at >= DATE_FORMAT(NOW(), '%Y-%m-01')",
-    "当月": "created_at >= DATE_FORMAT(NOW(), '%Y-%m-01')",
-    "上个月": "created_at >= DATE_FORMAT(DATE_SUB(NOW(), INTERVAL 1 MONTH), '%Y-%m-01') AND created_at < DATE_FORMAT(NOW(), '%Y-%m-01')",
-    "今年": "created_at >= DATE_FORMAT(NOW(), '%Y-01-01')",
-    "当年": "created_at >= DATE_FORMAT(NOW(), '%Y-01-01')",
-    "去年": "created_at >= DATE_FORMAT(DATE_SUB(NOW(), INTERVAL 1 YEAR), '%Y-01-01') AND created_at < DATE_FORMAT(NOW(), '%Y-01-01')",
-    "近7天": "created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)",
-    "最近7天": "created_at >= DATE_SUB(NOW(), INTERVAL 7 DAY)",
-    "近一周": "created_at >= DATE_SUB(NOW(), INTERVAL 1 WEEK)",
-    "本周": "created_at >= DATE_SUB(NOW(), INTERVAL WEEKDAY(NOW()) DAY)",
-    "今天": "created_at >= CURDATE()",
-    "昨天": "created_at >= DATE_SUB(CURDATE(), INTERVAL 1 DAY) AND created_at < CURDATE()"
+    "近一年": "{time_field} >= DATE_SUB(NOW(), INTERVAL 1 YEAR)",
+    "最近一年": "{time_field} >= DATE_SUB(NOW(), INTERVAL 1 YEAR)",
+    "近12个月": "{time_field} >= DATE_SUB(NOW(), INTERVAL 12 MONTH)",
+    "近30天": "{time_field} >= DATE_SUB(NOW(), INTERVAL 30 DAY)",
+    "最近30天": "{time_field} >= DATE_SUB(NOW(), INTERVAL 30 DAY)",
+    "近一个月": "{time_field} >= DATE_SUB(NOW(), INTERVAL 1 MONTH)",
+    "本月": "{time_field} >= DATE_FORMAT(NOW(), '%Y-%m-01')",
+    "当月": "{time_field} >= DATE_FORMAT(NOW(), '%Y-%m-01')",
+    "上个月": "{time_field} >= DATE_FORMAT(DATE_SUB(NOW(), INTERVAL 1 MONTH), '%Y-%m-01') AND {time_field} < DATE_FORMAT(NOW(), '%Y-%m-01')",
+    "今年": "{time_field} >= DATE_FORMAT(NOW(), '%Y-01-01')",
+    "当年": "{time_field} >= DATE_FORMAT(NOW(), '%Y-01-01')",
+    "去年": "{time_field} >= DATE_FORMAT(DATE_SUB(NOW(), INTERVAL 1 YEAR), '%Y-01-01') AND {time_field} < DATE_FORMAT(NOW(), '%Y-01-01')",
+    "近7天": "{time_field} >= DATE_SUB(NOW(), INTERVAL 7 DAY)",
+    "最近7天": "{time_field} >= DATE_SUB(NOW(), INTERVAL 7 DAY)",
+    "近一周": "{time_field} >= DATE_SUB(NOW(), INTERVAL 1 WEEK)",
+    "本周": "{time_field} >= DATE_SUB(CURDATE(), INTERVAL WEEKDAY(CURDATE()) DAY)",
+    "今天": "{time_field} >= CURDATE()",
+    "昨天": "{time_field} >= DATE_SUB(CURDATE(), INTERVAL 1 DAY) AND {time_field} < CURDATE()"
+}
+
+# 时间描述到SQL条件的映射（SQLite，时间按 UTC 计算，与 CURRENT_TIMESTAMP 一致）
+TIME_MAPPING_SQLITE = {
+    "近一年": "{time_field} >= datetime('now', '-1 year')",
+    "最近一年": "{time_field} >= datetime('now', '-1 year')",
+    "近12个月": "{time_field} >= datetime('now', '-12 months')",
+    "近30天": "{time_field} >= datetime('now', '-30 days')",
+    "最近30天": "{time_field} >= datetime('now', '-30 days')",
+    "近一个月": "{time_field} >= datetime('now', '-1 month')",
+    "本月": "{time_field} >= datetime('now', 'start of month')",
+    "当月": "{time_field} >= datetime('now', 'start of month')",
+    "上个月": "{time_field} >= datetime('now', 'start of month', '-1 month') AND {time_field} < datetime('now', 'start of month')",
+    "今年": "{time_field} >= datetime('now', 'start of year')",
+    "当年": "{time_field} >= datetime('now', 'start of year')",
+    "去年": "{time_field} >= datetime('now', 'start of year', '-1 year') AND {time_field} < datetime('now', 'start of year')",
+    "近7天": "{time_field} >= datetime('now', '-7 days')",
+    "最近7天": "{time_field} >= datetime('now', '-7 days')",
+    "近一周": "{time_field} >= datetime('now', '-7 days')",
+    "本周": "{time_field} >= datetime('now', 'start of day', '-6 days', 'weekday 1')",
+    "今天": "{time_field} >= datetime('now', 'start of day')",
+    "昨天": "{time_field} >= datetime('now', 'start of day', '-1 day') AND {time_field} < datetime('now', 'start of day')"
 }
 
 def get_table_config(table_name: str) -> Optional[TableConfig]:
     """根据表名获取表配置"""
     return TABLE_CONFIGS.get(table_name)
 
+def _match_table_by_keywords(natural_language: str) -> str:
+    """关键词匹配表名"""
+    for keyword, table_name in NATURAL_LANGUAGE_TABLE_MAPPING.items():
+        if keyword in natural_language:
+            return table_name
+    return "users"  # 默认返回用户表
+
 def get_table_name_from_natural_language(natural_language: str) -> str:
+    """使用DeepSeek从自然语言中推断表名（同步接口）"""
+    return run_sync(get_table_name_from_natural_language_async(natural_language))
+
+async def get_table_name_from_natural_language_async(natural_language: str) -> str:
     """使用DeepSeek从自然语言中推断表名"""
     try:
-        # 初始化DeepSeek客户端
-        client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
-        
         # 构建可用表名列表
         available_tables = list(TABLE_CONFIGS.keys())
         table_descriptions = {}
@@ -183,43 +211,33 @@ def get_table_name_from_natural_language(natural_language: str) -> str:
 3. 根据查询内容的语义来判断最合适的表
 """
 
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
+        table_name = await get_llm_gateway().complete(
+            [{"role": "user", "content": prompt}],
             temperature=0.1,
             max_tokens=50
         )
         
-        table_name = response.choices[0].message.content.strip()
-        
         # 验证返回的表名是否在可用表中
         if table_name in available_tables:
             return table_name
         else:
             # 如果返回的表名不在可用表中，回退到关键词匹配
-            for keyword, fallback_table_name in NATURAL_LANGUAGE_TABLE_MAPPING.items():
-                if keyword in natural_language:
-                    return fallback_table_name
-            return "users"  # 默认返回用户表
+            return _match_table_by_keywords(natural_language)
             
     except Exception as e:
         print(f"使用DeepSeek推断表名失败: {str(e)}")
         # 回退到原来的关键词匹配方法
-        for keyword, table_name in NATURAL_LANGUAGE_TABLE_MAPPING.items():
-            if keyword in natural_language:
-                return table_name
-        return "users"  # 默认返回用户表
+        return _match_table_by_keywords(natural_language)
 
-def get_time_mapping(db_type: str) -> Dict[str, str]:
-    """根据数据库类型获取时间映射"""
-    if db_type == "postgresql":
-        return TIME_MAPPING_PG
-    elif db_type == "mysql":
-        return TIME_MAPPING_MYSQL
+def get_time_mapping(db_type: str, time_field: str = "created_at") -> Dict[str, str]:
+    """根据数据库类型获取时间映射，条件中使用指定的时间字段"""
+    if db_type == "mysql":
+        mapping = TIME_MAPPING_MYSQL
+    elif db_type == "sqlite":
+        mapping = TIME_MAPPING_SQLITE
     else:
-        return TIME_MAPPING_PG  # 默认使用PostgreSQL
+        mapping = TIME_MAPPING_PG  # 默认使用PostgreSQL
+    return {desc: sql.format(time_field=time_field) for desc, sql in mapping.items()}
 
 def add_custom_table_config(table_name: str, config: TableConfig):
     """添加自定义表配置"""
@@ -230,15 +248,13 @@ def add_custom_language_mapping(keywords: List[str], table_name: str):
     for keyword in keywords:
         NATURAL_LANGUAGE_TABLE_MAPPING[keyword] = table_name
 
-def get_table_and_sql_from_natural_language(natural_language: str, db_type: str = "postgresql") -> tuple[str, str]:
+def get_table_and_sql_from_natural_language(natural_language: str, db_type: str = "postgresql") -> Tuple[str, str]:
+    """使用DeepSeek同时获取表名和SQL查询（同步接口）"""
+    return run_sync(get_table_and_sql_from_natural_language_async(natural_language, db_type))
+
+async def get_table_and_sql_from_natural_language_async(natural_language: str, db_type: str = "postgresql") -> Tuple[str, str]:
     """使用DeepSeek同时获取表名和SQL查询"""
     try:
-        # 初始化DeepSeek客户端
-        client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
-        
         # 构建可用表信息
         available_tables = {}
         for table_name, config in TABLE_CONFIGS.items():
@@ -258,6 +274,7 @@ def get_table_and_sql_from_natural_language(natural_language: str, db_type: str
 """
             for desc, sql in list(time_mapping.items())[:5]:
                 time_examples += f"- {desc}: {sql}\n"
+            time_examples += "示例中的 created_at 需要替换为所选表的 time_field\n"
         
         # 创建提示词
         prompt = f"""你是一个数据库专家。根据用户的自然语言查询，需要同时确定合适的表名和生成对应的SQL查询。
@@ -284,17 +301,12 @@ def get_table_and_sql_from_natural_language(natural_language: str, db_type: str
 6. 只返回JSON格式，不要包含其他解释
 """
 
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
+        result_text = await get_llm_gateway().complete(
+            [{"role": "user", "content": prompt}],
             temperature=0.1,
             max_tokens=500
         )
         
-        result_text = response.choices[0].message.content.strip()
-        
         # 清理可能的markdown格式
         if result_text.startswith("```json"):
             result_text = result_text[7:]
@@ -317,5 +329,5 @@ def get_table_and_sql_from_natural_language(natural_language: str, db_type: str
     except Exception as e:
         print(f"使用DeepSeek获取表名和SQL失败: {str(e)}")
         # 回退到原来的方法
-        table_name = get_table_name_from_natural_language(natural_language)
-        return table_name, ""
\ No newline at end of file
+        table_name = await get_table_name_from_natural_language_async(natural_language)
+        return table_name, ""
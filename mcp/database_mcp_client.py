@@ -1,17 +1,22 @@
 import os
 import json
 import asyncio
+import threading
 from datetime import datetime, timedelta
-from typing import Any, Dict, Optional, List
-from sqlalchemy import create_engine, text
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from openai import OpenAI
+from typing import Any, Dict, Optional, List, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
 from dotenv import load_dotenv
+from async_runner import run_sync
+from db_engines import get_engine_registry
+from schema_catalog import SchemaCatalog
+from sql_cache import get_sql_cache
+from sql_rules import compile_sql
+from llm_gateway import get_llm_gateway
 from database_config import (
     get_table_config, 
-    get_table_name_from_natural_language,
-    get_table_and_sql_from_natural_language,
+    get_table_and_sql_from_natural_language_async,
     get_time_mapping,
     TableConfig
 )
@@ -23,11 +28,10 @@ class DatabaseMCPClient:
     """数据库操作MCP客户端"""
     
     def __init__(self):
-        # 初始化DeepSeek客户端
-        self.llm_client = OpenAI(
-            api_key=os.getenv("DEEPSEEK_API_KEY"),
-            base_url="https://api.deepseek.com"
-        )
+        # 共享的DeepSeek网关
+        self.llm = get_llm_gateway()
+        # 自然语言到 SQL 的翻译缓存
+        self.sql_cache = get_sql_cache()
         
         # 数据库连接配置
         self.db_config = {
@@ -53,13 +57,14 @@ class DatabaseMCPClient:
         # 默认数据库类型
         self.db_type = os.getenv("DATABASE_TYPE", "postgresql")
         
-        # 数据库引擎
-        self.engine = None
-        self.async_engine = None
+        # 数据库引擎由进程级注册表按 DSN 共享
+        self.registry = get_engine_registry()
+        self.sync_url: Optional[str] = None
+        self.async_url: Optional[str] = None
         self._init_database()
     
     def _init_database(self):
-        """初始化数据库连接"""
+        """初始化数据库连接（只创建异步引擎，同步引擎按需创建）"""
         try:
             if self.db_type == "mysql":
                 config = self.db_config["mysql"]
@@ -76,13 +81,35 @@ class DatabaseMCPClient:
             else:
                 raise ValueError(f"不支持的数据库类型: {self.db_type}")
             
-            self.engine = create_engine(sync_url)
-            self.async_engine = create_async_engine(async_url)
+            self.sync_url = sync_url
+            self.async_url = async_url
+            self.registry.get_async_engine(async_url)
+            self.schema_catalog = SchemaCatalog(async_url, self.db_type, registry=self.registry)
             
         except Exception as e:
             print(f"数据库初始化失败: {str(e)}")
             raise
     
+    @property
+    def async_engine(self) -> AsyncEngine:
+        return self.registry.get_async_engine(self.async_url)
+    
+    @property
+    def engine(self) -> Engine:
+        """同步引擎，首次访问时才创建"""
+        return self.registry.get_sync_engine(self.sync_url)
+    
+    async def warm_up(self, connections: Optional[int] = None) -> int:
+        """预先建立连接，返回建立的连接数"""
+        if connections is None:
+            return await self.registry.warm_up(self.async_url)
+        return await self.registry.warm_up(self.async_url, connections)
+    
+    async def close(self):
+        """释放数据库引擎及其连接池"""
+        await self.registry.dispose(self.async_url)
+        await self.registry.dispose(self.sync_url)
+    
     def _create_sql_generation_prompt(self, natural_language: str, table_config: Optional[TableConfig] = None, table_schema: Optional[str] = None) -> str:
         """创建SQL生成的提示词"""
         schema_info = ""
@@ -101,8 +128,9 @@ class DatabaseMCPClient:
 - 字段说明: {json.dumps(table_config.fields, ensure_ascii=False, indent=2)}
 """
         
-        # 获取时间映射
-        time_mapping = get_time_mapping(self.db_type)
+        # 获取时间映射（使用表的实际时间字段）
+        time_field = table_config.time_field if table_config else "created_at"
+        time_mapping = get_time_mapping(self.db_type, time_field)
         time_examples = ""
         if time_mapping:
             time_examples = f"""
@@ -136,17 +164,12 @@ class DatabaseMCPClient:
         try:
             prompt = self._create_sql_generation_prompt(natural_language, table_config, table_schema)
             
-            response = self.llm_client.chat.completions.create(
-                model="deepseek-chat",
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+            sql_query = await self.llm.complete(
+                [{"role": "user", "content": prompt}],
                 temperature=0.1,
                 max_tokens=500
             )
             
-            sql_query = response.choices[0].message.content.strip()
-            
             # 清理SQL查询（移除可能的markdown格式）
             if sql_query.startswith("```sql"):
                 sql_query = sql_query[6:]
@@ -160,11 +183,11 @@ class DatabaseMCPClient:
         except Exception as e:
             raise Exception(f"生成SQL查询失败: {str(e)}")
     
-    async def execute_query(self, sql_query: str) -> List[Dict[str, Any]]:
-        """执行SQL查询并返回结果"""
+    async def execute_query(self, sql_query: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """执行SQL查询并返回结果，params 为绑定参数（例如规则编译得到的 :start / :end）"""
         try:
-            async with self.async_engine.begin() as conn:
-                result = await conn.execute(text(sql_query))
+            async with self.registry.begin(self.async_url) as conn:
+                result = await conn.execute(text(sql_query), params or {})
                 
                 # 获取列名
                 columns = result.keys()
@@ -186,63 +209,78 @@ class DatabaseMCPClient:
             raise Exception(f"执行SQL查询失败: {str(e)}")
     
     async def get_table_schema(self, table_name: str) -> str:
-        """获取表结构信息"""
+        """获取表结构信息（从表结构目录读取，不再逐表查询数据库）"""
         try:
-            if self.db_type == "mysql":
-                schema_query = f"DESCRIBE {table_name}"
-            elif self.db_type == "postgresql":
-                schema_query = f"""
-                SELECT column_name, data_type, is_nullable, column_default
-                FROM information_schema.columns
-                WHERE table_name = '{table_name}'
-                """
-            elif self.db_type == "sqlite":
-                schema_query = f"PRAGMA table_info({table_name})"
-            else:
-                return ""
-            
-            results = await self.execute_query(schema_query)
-            
-            # 格式化表结构信息
-            schema_info = f"表名: {table_name}\n"
-            for row in results:
-                if self.db_type == "mysql":
-                    schema_info += f"- {row['Field']}: {row['Type']} {'NOT NULL' if row['Null'] == 'NO' else 'NULL'}\n"
-                elif self.db_type == "postgresql":
-                    schema_info += f"- {row['column_name']}: {row['data_type']} {'NOT NULL' if row['is_nullable'] == 'NO' else 'NULL'}\n"
-                elif self.db_type == "sqlite":
-                    schema_info += f"- {row['name']}: {row['type']} {'NOT NULL' if row['notnull'] else 'NULL'}\n"
-            
-            return schema_info
-            
+            return await self.schema_catalog.describe(table_name)
         except Exception as e:
             print(f"获取表结构失败: {str(e)}")
             return ""
     
-    async def query_new_users_count(self, natural_language: str, table_name: str = None) -> Dict[str, Any]:
-        """统计新增用户数量的主要方法"""
-        # 如果指定了表名，使用传统方法；否则使用优化方法
+    async def _schema_version(self) -> Optional[str]:
+        """当前表结构版本，无法获取时返回 None（不使用翻译缓存）"""
+        try:
+            return await self.schema_catalog.get_version()
+        except Exception as e:
+            print(f"获取表结构版本失败，跳过 SQL 翻译缓存: {str(e)}")
+            return None
+    
+    async def _generate_for_table(self, natural_language: str, table_name: str) -> Dict[str, Any]:
+        """按指定表的配置和结构生成SQL"""
+        table_config = get_table_config(table_name)
+        table_schema = await self.get_table_schema(table_name)
+        sql_query = await self._generate_sql_from_natural_language(natural_language, table_config, table_schema)
+        return {"table_name": table_name, "sql": sql_query, "source": "llm"}
+    
+    async def _generate_with_table_inference(self, natural_language: str) -> Dict[str, Any]:
+        """一次调用同时推断表名和生成SQL，没有得到SQL时按推断的表重新生成"""
+        table_name, sql_query = await get_table_and_sql_from_natural_language_async(natural_language, self.db_type)
+        if not sql_query:
+            return await self._generate_for_table(natural_language, table_name)
+        return {"table_name": table_name, "sql": sql_query, "source": "llm"}
+    
+    async def _translate(self, natural_language: str,
+                         table_name: Optional[str] = None) -> Tuple[Dict[str, Any], Optional[str], bool]:
+        """
+        把自然语言翻译为SQL：先尝试规则编译，再查翻译缓存，最后调用大模型
+        返回 (条目, 缓存键, 是否命中缓存)，条目为 {"table_name": ..., "sql": ..., "source": ...}
+        """
+        compiled = compile_sql(natural_language, self.db_type, table_name)
+        if compiled is not None:
+            return compiled, None, False
+        
         if table_name is not None:
-            # 获取表配置
-            table_config = get_table_config(table_name)
-
-            # 获取表结构
-            table_schema = await self.get_table_schema(table_name)
-
-            # 生成SQL查询
-            sql_query = await self._generate_sql_from_natural_language(natural_language, table_config, table_schema)
+            generate = lambda: self._generate_for_table(natural_language, table_name)
         else:
-            # 使用优化的方法直接获取表名和SQL
-            table_name, sql_query = get_table_and_sql_from_natural_language(natural_language, self.db_type)
-
-            if not sql_query:
-                # 如果没有获取到SQL，回退到传统方法
-                table_config = get_table_config(table_name)
-                table_schema = await self.get_table_schema(table_name)
-                sql_query = await self._generate_sql_from_natural_language(natural_language, table_config, table_schema)
-
-        # 执行查询
-            results = await self.execute_query(sql_query)
+            generate = lambda: self._generate_with_table_inference(natural_language)
+        
+        version = await self._schema_version()
+        if version is None:
+            return await generate(), None, False
+        key = self.sql_cache.make_key(natural_language, self.db_type, table_name, version)
+        entry, cached = await self.sql_cache.translate(key, generate)
+        return entry, key, cached
+    
+    async def _execute_translated(self, entry: Dict[str, Any], key: Optional[str], cached: bool) -> List[Dict[str, Any]]:
+        """执行翻译得到的SQL：首次执行成功后写入缓存，缓存的SQL执行失败时删除缓存"""
+        try:
+            results = await self.execute_query(entry["sql"], entry.get("params"))
+        except Exception:
+            if cached:
+                await self.sql_cache.invalidate(key)
+            raise
+        if key is not None and not cached:
+            await self.sql_cache.put(key, entry)
+        return results
+    
+    async def query_new_users_count(self, natural_language: str, table_name: str = None) -> Dict[str, Any]:
+        """统计新增用户数量的主要方法"""
+        try:
+            # 未指定表名时一次调用同时推断表名和生成SQL
+            entry, cache_key, cached = await self._translate(natural_language, table_name)
+            table_name, sql_query = entry["table_name"], entry["sql"]
+            
+            # 执行查询
+            results = await self._execute_translated(entry, cache_key, cached)
             
             # 提取用户数量
             user_count = 0
@@ -262,6 +300,9 @@ class DatabaseMCPClient:
                 "generated_sql": sql_query,
                 "user_count": user_count,
                 "raw_results": results,
+                "sql_cached": cached,
+                "sql_source": "cache" if cached else entry.get("source", "llm"),
+                "sql_params": {name: str(value) for name, value in entry.get("params", {}).items()},
                 "message": f"查询结果: {user_count}"
             }
             
@@ -276,21 +317,12 @@ class DatabaseMCPClient:
     async def execute_natural_language_query(self, natural_language: str, table_name: str = None) -> Dict[str, Any]:
         """执行自然语言查询的通用方法"""
         try:
-            # 如果没有指定表名，从自然语言中推断
-            if table_name is None:
-                table_name = get_table_name_from_natural_language(natural_language)
-            
-            # 获取表配置
-            table_config = get_table_config(table_name)
-            
-            # 获取表结构
-            table_schema = await self.get_table_schema(table_name)
-            
-            # 生成SQL查询
-            sql_query = await self._generate_sql_from_natural_language(natural_language, table_config, table_schema)
+            # 没有指定表名时从自然语言中推断
+            entry, cache_key, cached = await self._translate(natural_language, table_name)
+            table_name, sql_query = entry["table_name"], entry["sql"]
             
             # 执行查询
-            results = await self.execute_query(sql_query)
+            results = await self._execute_translated(entry, cache_key, cached)
             
             return {
                 "status": "success",
@@ -299,6 +331,9 @@ class DatabaseMCPClient:
                 "generated_sql": sql_query,
                 "results": results,
                 "result_count": len(results),
+                "sql_cached": cached,
+                "sql_source": "cache" if cached else entry.get("source", "llm"),
+                "sql_params": {name: str(value) for name, value in entry.get("params", {}).items()},
                 "message": f"查询成功，返回 {len(results)} 条结果"
             }
             
@@ -313,15 +348,12 @@ class DatabaseMCPClient:
     async def execute_natural_language_query_optimized(self, natural_language: str) -> Dict[str, Any]:
         """使用DeepSeek优化的自然语言查询方法，一次性获取表名和SQL"""
         try:
-            # 使用优化的函数同时获取表名和SQL
-            table_name, sql_query = get_table_and_sql_from_natural_language(natural_language, self.db_type)
-            
-            if not sql_query:
-                # 如果没有获取到SQL，回退到原来的方法
-                return await self.execute_natural_language_query(natural_language, table_name)
+            # 同时获取表名和SQL（优先使用翻译缓存）
+            entry, cache_key, cached = await self._translate(natural_language)
+            table_name, sql_query = entry["table_name"], entry["sql"]
             
             # 执行查询
-            results = await self.execute_query(sql_query)
+            results = await self._execute_translated(entry, cache_key, cached)
             
             return {
                 "status": "success",
@@ -329,6 +361,9 @@ class DatabaseMCPClient:
                 "count": len(results),
                 "table_name": table_name,
                 "sql_query": sql_query,
+                "sql_cached": cached,
+                "sql_source": "cache" if cached else entry.get("source", "llm"),
+                "sql_params": {name: str(value) for name, value in entry.get("params", {}).items()},
                 "natural_language": natural_language,
                 "message": f"查询成功，共找到 {len(results)} 条记录"
             }
@@ -341,36 +376,33 @@ class DatabaseMCPClient:
                 "message": "查询失败"
             }
 
-# 同步包装函数
+# 同步包装函数（共享同一个客户端，引擎与连接在多次调用之间复用）
+_default_client: Optional[DatabaseMCPClient] = None
+_default_client_lock = threading.Lock()
+
+def get_default_client() -> DatabaseMCPClient:
+    """获取进程级共享的数据库客户端"""
+    global _default_client
+    if _default_client is None:
+        with _default_client_lock:
+            if _default_client is None:
+                _default_client = DatabaseMCPClient()
+    return _default_client
+
 def query_new_users_count_sync(natural_language: str, table_name: str = None) -> Dict[str, Any]:
     """同步版本的新增用户统计"""
-    client = DatabaseMCPClient()
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(client.query_new_users_count(natural_language, table_name))
-    finally:
-        loop.close()
+    client = get_default_client()
+    return run_sync(client.query_new_users_count(natural_language, table_name))
 
 def execute_natural_language_query_sync(natural_language: str, table_name: str = None) -> Dict[str, Any]:
     """同步版本的自然语言查询"""
-    client = DatabaseMCPClient()
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(client.execute_natural_language_query(natural_language, table_name))
-    finally:
-        loop.close()
+    client = get_default_client()
+    return run_sync(client.execute_natural_language_query(natural_language, table_name))
 
 def execute_natural_language_query_optimized_sync(natural_language: str) -> Dict[str, Any]:
     """同步版本的优化自然语言查询"""
-    client = DatabaseMCPClient()
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(client.execute_natural_language_query_optimized(natural_language))
-    finally:
-        loop.close()
+    client = get_default_client()
+    return run_sync(client.execute_natural_language_query_optimized(natural_language))
 
 if __name__ == "__main__":
     # 测试示例
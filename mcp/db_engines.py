@@ -0,0 +1,231 @@
+# db_engines.py
+"""
+数据库引擎注册表
+进程内按 DSN 共享引擎，所有 DatabaseMCPClient 实例复用同一个连接池。
+连接池参数通过环境变量配置，启动时可预先建立连接，关闭时统一 dispose，
+并记录连接检出次数和等待时间。同步引擎只在被使用时才创建。
+"""
+
+import os
+import time
+import asyncio
+import threading
+import contextlib
+from typing import Any, AsyncIterator, Dict, Optional
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+
+# 加载环境变量
+load_dotenv()
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# 连接最长使用时间（秒），应小于数据库的空闲断开时间（例如 MySQL wait_timeout）
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# 连接池耗尽时等待空闲连接的最长时间（秒）
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# 启动时预先建立的连接数
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", "2"))
+
+
+def _is_memory_sqlite(dsn: str) -> bool:
+    url = make_url(dsn)
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _pool_kwargs(dsn: str) -> Dict[str, Any]:
+    """内存 SQLite 使用单连接池，不接受连接池大小参数"""
+    if _is_memory_sqlite(dsn):
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+
+
+class _PoolMetrics:
+    """单个引擎的连接池统计"""
+
+    def __init__(self):
+        self.connects = 0
+        self.checkouts = 0
+        self.checkins = 0
+        self.invalidations = 0
+        # 每次取连接拆成两部分：建立新连接的耗时和在连接池中排队等待的耗时
+        self.acquires = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.connect_total = 0.0
+        self.connect_max = 0.0
+        self.timeouts = 0
+
+    def attach(self, engine: Engine) -> None:
+        @event.listens_for(engine, "do_connect")
+        def _on_do_connect(dialect, record, cargs, cparams):
+            record.info["connect_started"] = time.perf_counter()
+
+        @event.listens_for(engine, "connect")
+        def _on_connect(dbapi_conn, record):
+            self.connects += 1
+            started = record.info.pop("connect_started", None)
+            if started is not None:
+                # 记在连接上，由紧接着的 checkout 交给触发建立连接的那次取连接扣除
+                seconds = time.perf_counter() - started
+                record.info["connect_seconds"] = seconds
+                self.connect_total += seconds
+                self.connect_max = max(self.connect_max, seconds)
+
+        @event.listens_for(engine, "checkout")
+        def _on_checkout(dbapi_conn, record, proxy):
+            self.checkouts += 1
+            # 复用已有连接时为 0
+            record.info["checkout_connect_seconds"] = record.info.pop("connect_seconds", 0.0)
+
+        @event.listens_for(engine, "checkin")
+        def _on_checkin(dbapi_conn, record):
+            self.checkins += 1
+
+        @event.listens_for(engine, "invalidate")
+        def _on_invalidate(dbapi_conn, record, exception):
+            self.invalidations += 1
+
+    def record_acquire(self, seconds: float, connect_seconds: float) -> None:
+        """记录一次取连接；排队等待时间为总耗时减去建立新连接的耗时（包含 pre_ping）"""
+        wait = max(seconds - connect_seconds, 0.0)
+        self.acquires += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+
+    def to_dict(self, pool) -> Dict[str, Any]:
+        stats = {
+            "connects": self.connects,
+            "checkouts": self.checkouts,
+            "checkins": self.checkins,
+            "invalidations": self.invalidations,
+            "checkout_timeouts": self.timeouts,
+            "avg_checkout_wait": self.wait_total / self.acquires if self.acquires else 0.0,
+            "max_checkout_wait": self.wait_max,
+            "avg_connect_time": self.connect_total / self.connects if self.connects else 0.0,
+            "max_connect_time": self.connect_max,
+        }
+        # QueuePool 才有这些计数
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, name, None)
+            if callable(method):
+                stats[name] = method()
+        return stats
+
+
+class EngineRegistry:
+    """按 DSN 共享的数据库引擎"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._async_engines: Dict[str, AsyncEngine] = {}
+        self._sync_engines: Dict[str, Engine] = {}
+        self._metrics: Dict[str, _PoolMetrics] = {}
+
+    def get_async_engine(self, dsn: str) -> AsyncEngine:
+        engine = self._async_engines.get(dsn)
+        if engine is None:
+            with self._lock:
+                engine = self._async_engines.get(dsn)
+                if engine is None:
+                    engine = create_async_engine(dsn, **_pool_kwargs(dsn))
+                    metrics = self._metrics.setdefault(dsn, _PoolMetrics())
+                    metrics.attach(engine.sync_engine)
+                    self._async_engines[dsn] = engine
+        return engine
+
+    def get_sync_engine(self, dsn: str) -> Engine:
+        """同步引擎（按需创建）"""
+        engine = self._sync_engines.get(dsn)
+        if engine is None:
+            with self._lock:
+                engine = self._sync_engines.get(dsn)
+                if engine is None:
+                    engine = create_engine(dsn, **_pool_kwargs(dsn))
+                    metrics = self._metrics.setdefault(dsn, _PoolMetrics())
+                    metrics.attach(engine)
+                    self._sync_engines[dsn] = engine
+        return engine
+
+    @contextlib.asynccontextmanager
+    async def begin(self, dsn: str) -> AsyncIterator[AsyncConnection]:
+        """从连接池取连接并开启事务，分别记录排队等待和建立新连接的时间"""
+        engine = self.get_async_engine(dsn)
+        metrics = self._metrics[dsn]
+        started = time.perf_counter()
+        try:
+            conn = await engine.connect()
+        except PoolTimeoutError:
+            metrics.timeouts += 1
+            raise
+        elapsed = time.perf_counter() - started
+        try:
+            raw = await conn.get_raw_connection()
+            metrics.record_acquire(elapsed, raw.info.pop("checkout_connect_seconds", 0.0))
+            async with conn.begin():
+                yield conn
+        finally:
+            await conn.close()
+
+    async def warm_up(self, dsn: str, connections: int = DB_POOL_WARMUP) -> int:
+        """同时打开若干连接再放回连接池，首批查询不必等待建立连接"""
+        if connections <= 0:
+            return 0
+        engine = self.get_async_engine(dsn)
+        if not _is_memory_sqlite(dsn):
+            connections = min(connections, DB_POOL_SIZE)
+        else:
+            connections = 1
+        conns = await asyncio.gather(*(engine.connect() for _ in range(connections)),
+                                     return_exceptions=True)
+        opened = [c for c in conns if isinstance(c, AsyncConnection)]
+        await asyncio.gather(*(c.close() for c in opened), return_exceptions=True)
+        errors = [c for c in conns if isinstance(c, BaseException)]
+        if errors and not opened:
+            raise errors[0]
+        return len(opened)
+
+    async def dispose(self, dsn: str) -> None:
+        """关闭指定 DSN 的引擎及其连接池"""
+        with self._lock:
+            async_engine = self._async_engines.pop(dsn, None)
+            sync_engine = self._sync_engines.pop(dsn, None)
+        if async_engine is not None:
+            await async_engine.dispose()
+        if sync_engine is not None:
+            sync_engine.dispose()
+
+    async def dispose_all(self) -> None:
+        for dsn in set(self._async_engines) | set(self._sync_engines):
+            await self.dispose(dsn)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {}
+        for dsn, metrics in list(self._metrics.items()):
+            engine = self._async_engines.get(dsn)
+            pool = engine.pool if engine is not None else None
+            if pool is None and dsn in self._sync_engines:
+                pool = self._sync_engines[dsn].pool
+            entry = metrics.to_dict(pool)
+            entry["async"] = dsn in self._async_engines
+            entry["sync"] = dsn in self._sync_engines
+            stats[make_url(dsn).render_as_string(hide_password=True)] = entry
+        return stats
+
+
+# 全局引擎注册表
+_registry = EngineRegistry()
+
+def get_engine_registry() -> EngineRegistry:
+    """获取全局数据库引擎注册表"""
+    return _registry
@@ -0,0 +1,313 @@
+# dingtalk_dispatcher.py
+"""
+钉钉通知分发器
+消息按 webhook 排队，合并窗口内的多条消息合并为一条 markdown 消息（@ 的人取并集），
+每个 webhook 用令牌桶限速（机器人限制为每分钟 20 条）。
+发送失败的批次进入延迟重试队列，退避期间工作协程继续发送后面的消息。
+发送方只负责入队并立即拿到 message_id，投递结果异步产生，不会因为 webhook 被限流而阻塞。
+"""
+
+import os
+import time
+import random
+import asyncio
+import itertools
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from dotenv import load_dotenv
+from cache_utils import TTLCache
+from rate_limit import TokenBucket, parse_rate
+
+# 加载环境变量
+load_dotenv()
+
+# 合并窗口（秒）：首条消息入队后等待这么久，把期间到达的消息合并发送
+DINGTALK_COALESCE_WINDOW = float(os.getenv("DINGTALK_COALESCE_WINDOW", "1.0"))
+DINGTALK_MAX_BATCH = int(os.getenv("DINGTALK_MAX_BATCH", "20"))
+# 合并后消息正文的上限（字符），钉钉单条消息上限约 20000 字节
+DINGTALK_MAX_MESSAGE_CHARS = int(os.getenv("DINGTALK_MAX_MESSAGE_CHARS", "6000"))
+DINGTALK_RATE_LIMIT = os.getenv("DINGTALK_RATE_LIMIT", "20/60")
+DINGTALK_MAX_RETRIES = int(os.getenv("DINGTALK_MAX_RETRIES", "3"))
+DINGTALK_RETRY_BASE_DELAY = float(os.getenv("DINGTALK_RETRY_BASE_DELAY", "3"))
+# 关闭时等待剩余消息发送的最长时间（秒）
+DINGTALK_FLUSH_TIMEOUT = float(os.getenv("DINGTALK_FLUSH_TIMEOUT", "10"))
+# 投递结果保留时间（秒）
+DINGTALK_RESULT_TTL = float(os.getenv("DINGTALK_RESULT_TTL", "3600"))
+
+# 限流（发送过快）和系统繁忙的错误码可以重试
+RETRYABLE_ERRCODES = {130101, -1}
+
+SendFunc = Callable[[str, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+@dataclass
+class PendingNotification:
+    """排队中的通知"""
+    message_id: str
+    content: str
+    at_mobiles: List[str]
+    is_at_all: bool
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class PendingBatch:
+    """待发送的合并消息，attempt 为已重试次数"""
+    batch: List[PendingNotification]
+    payload: Dict[str, Any]
+    attempt: int = 0
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+def build_payload(batch: List[PendingNotification]) -> Dict[str, Any]:
+    """单条消息保持文本格式；多条消息合并为 markdown 列表，@ 的手机号取并集"""
+    at_mobiles: List[str] = []
+    for item in batch:
+        for mobile in item.at_mobiles:
+            if mobile not in at_mobiles:
+                at_mobiles.append(mobile)
+    is_at_all = any(item.is_at_all for item in batch)
+    at = {"atMobiles": at_mobiles, "isAtAll": is_at_all}
+
+    if len(batch) == 1:
+        return {"msgtype": "text", "text": {"content": batch[0].content}, "at": at}
+
+    lines = [f"#### 工作流通知（{len(batch)} 条）", ""]
+    for item in batch:
+        lines.append("- " + item.content.replace("\n", "\n  "))
+    if at_mobiles:
+        # markdown 消息需要在正文中包含 @手机号 才会提醒
+        lines.extend(["", " ".join(f"@{mobile}" for mobile in at_mobiles)])
+    return {
+        "msgtype": "markdown",
+        "markdown": {"title": f"工作流通知（{len(batch)} 条）", "text": "\n".join(lines)},
+        "at": at
+    }
+
+
+class DingTalkDispatcher:
+    """按 webhook 排队、合并和限速的钉钉通知分发器"""
+
+    def __init__(self, send: SendFunc,
+                 window: float = DINGTALK_COALESCE_WINDOW,
+                 max_batch: int = DINGTALK_MAX_BATCH,
+                 rate_limit: str = DINGTALK_RATE_LIMIT,
+                 max_retries: int = DINGTALK_MAX_RETRIES):
+        self._send = send
+        self.window = window
+        self.max_batch = max_batch
+        self.rate, self.burst = parse_rate(rate_limit)
+        self.max_retries = max_retries
+
+        # 队列和工作协程绑定到创建它们的事件循环
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queues: Dict[str, Deque[PendingNotification]] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        # 退避结束、等待重新发送的批次，以及还在退避中的批次
+        self._retries: Dict[str, Deque[PendingBatch]] = {}
+        self._backoff: Dict[str, List[PendingBatch]] = {}
+        # 尚未产生投递结果的消息（包括排队中和正在发送的）
+        self._unresolved: Dict[str, PendingNotification] = {}
+        self._flushing = False
+
+        self._ids = itertools.count(1)
+        self._results = TTLCache(maxsize=10000, ttl=DINGTALK_RESULT_TTL)
+        self.submitted = 0
+        self.delivered = 0
+        self.failed = 0
+        self.batches_sent = 0
+        self.retries = 0
+
+    def _ensure_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # 旧事件循环已结束，其中排队和重试中的消息无法再发送，标记为失败而不是直接丢弃
+        for backoff in self._backoff.values():
+            for pending in backoff:
+                pending.timer.cancel()
+        if self._unresolved:
+            self._resolve(list(self._unresolved.values()), "failed", error="事件循环已结束，消息未发送")
+        self._loop = loop
+        self._queues = {}
+        self._wakeups = {}
+        self._workers = {}
+        self._retries = {}
+        self._backoff = {}
+        self._unresolved = {}
+
+    def submit(self, webhook: str, content: str, at_mobiles: Optional[List[str]] = None,
+               is_at_all: bool = False) -> PendingNotification:
+        """消息入队，立即返回；通过 future 或 get_delivery(message_id) 获取投递结果"""
+        self._ensure_loop()
+        message_id = f"dt-{int(time.time() * 1000)}-{next(self._ids)}"
+        item = PendingNotification(
+            message_id=message_id,
+            content=str(content),
+            at_mobiles=[str(m) for m in (at_mobiles or [])],
+            is_at_all=bool(is_at_all),
+            future=self._loop.create_future()
+        )
+        self._results.set(message_id, {"message_id": message_id, "status": "queued"})
+        self._unresolved[message_id] = item
+        self.submitted += 1
+
+        if webhook not in self._queues:
+            self._queues[webhook] = deque()
+            self._wakeups[webhook] = asyncio.Event()
+            self._retries[webhook] = deque()
+            self._backoff[webhook] = []
+            self._buckets.setdefault(webhook, TokenBucket(self.rate, self.burst))
+            self._workers[webhook] = asyncio.ensure_future(self._worker(webhook))
+        self._queues[webhook].append(item)
+        self._wakeups[webhook].set()
+        return item
+
+    def get_delivery(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """查询投递结果"""
+        return self._results.get(message_id)
+
+    def _take_batch(self, queue: Deque[PendingNotification]) -> List[PendingNotification]:
+        batch = [queue.popleft()]
+        size = len(batch[0].content)
+        while queue and len(batch) < self.max_batch and size + len(queue[0].content) <= DINGTALK_MAX_MESSAGE_CHARS:
+            size += len(queue[0].content)
+            batch.append(queue.popleft())
+        return batch
+
+    async def _worker(self, webhook: str) -> None:
+        queue = self._queues[webhook]
+        retries = self._retries[webhook]
+        wakeup = self._wakeups[webhook]
+        while True:
+            if retries:
+                # 退避结束的批次比队列中的消息更早，优先发送
+                pending = retries.popleft()
+            elif queue:
+                # 合并窗口：等待同一时间段内的其他消息
+                delay = self.window - (time.monotonic() - queue[0].enqueued_at)
+                if delay > 0 and len(queue) < self.max_batch and not self._flushing:
+                    await asyncio.sleep(delay)
+                batch = self._take_batch(queue)
+                pending = PendingBatch(batch, build_payload(batch))
+            else:
+                wakeup.clear()
+                await wakeup.wait()
+                continue
+            try:
+                await self._deliver(webhook, pending)
+            except asyncio.CancelledError:
+                self._resolve(pending.batch, "failed", error="分发器已关闭")
+                raise
+
+    def _resolve(self, batch: List[PendingNotification], status: str,
+                 error: Optional[str] = None, response: Any = None) -> None:
+        delivered_at = time.time()
+        for item in batch:
+            result = {
+                "message_id": item.message_id,
+                "status": status,
+                "batch_size": len(batch),
+                "queued_seconds": time.monotonic() - item.enqueued_at,
+                "delivered_at": delivered_at if status == "delivered" else None,
+                "error": error,
+                "response": response
+            }
+            self._results.set(item.message_id, result)
+            self._unresolved.pop(item.message_id, None)
+            if not item.future.done():
+                try:
+                    item.future.set_result(result)
+                except RuntimeError:
+                    # future 所属的事件循环已关闭，结果仍可通过 get_delivery 查询
+                    pass
+        if status == "delivered":
+            self.delivered += len(batch)
+        else:
+            self.failed += len(batch)
+
+    async def _deliver(self, webhook: str, pending: PendingBatch) -> None:
+        """按令牌桶限速发送一次；被限流或网络错误时放入延迟重试队列，不阻塞后面的消息"""
+        await self._buckets[webhook].acquire()
+        try:
+            response = await self._send(webhook, pending.payload)
+            errcode = response.get("errcode", 0) if isinstance(response, dict) else 0
+            if errcode == 0:
+                self.batches_sent += 1
+                self._resolve(pending.batch, "delivered", response=response)
+                return
+            error = f"钉钉返回错误: {errcode} {response.get('errmsg', '')}"
+            retryable = errcode in RETRYABLE_ERRCODES
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e)
+            retryable = True
+        if not retryable or pending.attempt >= self.max_retries:
+            self._resolve(pending.batch, "failed", error=error)
+            return
+        pending.attempt += 1
+        self.retries += 1
+        delay = DINGTALK_RETRY_BASE_DELAY * (2 ** (pending.attempt - 1)) * random.uniform(0.5, 1.0)
+        self._backoff[webhook].append(pending)
+        pending.timer = self._loop.call_later(delay, self._retry_ready, webhook, pending)
+
+    def _retry_ready(self, webhook: str, pending: PendingBatch) -> None:
+        """退避结束，批次移入重试队列并唤醒工作协程"""
+        pending.timer = None
+        self._backoff[webhook].remove(pending)
+        self._retries[webhook].append(pending)
+        self._wakeups[webhook].set()
+
+    async def flush(self, timeout: Optional[float] = None) -> None:
+        """不再等待合并窗口，发送所有排队中的消息"""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        self._flushing = True
+        for wakeup in self._wakeups.values():
+            wakeup.set()
+        pending = [item.future for item in self._unresolved.values()]
+        try:
+            if pending:
+                await asyncio.wait(pending, timeout=timeout)
+        finally:
+            self._flushing = False
+
+    async def close(self) -> None:
+        """尽量发完剩余消息后停止工作协程，未发出的消息标记为失败"""
+        if self._loop is not asyncio.get_running_loop():
+            return
+        await self.flush(DINGTALK_FLUSH_TIMEOUT)
+        for task in self._workers.values():
+            task.cancel()
+        await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        for backoff in self._backoff.values():
+            for pending in backoff:
+                pending.timer.cancel()
+        if self._unresolved:
+            self._resolve(list(self._unresolved.values()), "failed", error="分发器已关闭")
+        self._workers = {}
+        self._queues = {}
+        self._wakeups = {}
+        self._retries = {}
+        self._backoff = {}
+        self._loop = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "window": self.window,
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "submitted": self.submitted,
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "batches_sent": self.batches_sent,
+            "retries": self.retries,
+            "queued": {webhook[-12:]: len(queue) for webhook, queue in self._queues.items()},
+            "retrying": {webhook[-12:]: len(self._retries[webhook]) + len(backoff)
+                         for webhook, backoff in self._backoff.items() if backoff or self._retries[webhook]}
+        }
@@ -0,0 +1,240 @@
+# file_actions.py
+"""
+本地文件动作
+file_read / file_write / file_delete / directory_list 的实现。
+文件 I/O 在专用线程池中执行，不阻塞事件循环；大文件按字节范围通过 mmap 读取，
+大目录用 os.scandir 流式遍历并分页，返回到工作流上下文的内容有大小上限。
+"""
+
+import os
+import json
+import mmap
+import stat
+import heapq
+import base64
+import asyncio
+import fnmatch
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+# 允许访问的根目录，默认是当前目录下的 workspace；文件动作可由任意工作流请求触发，不提供不受限制的模式
+MCP_FILE_ROOT = os.getenv("MCP_FILE_ROOT") or "workspace"
+# 单次读取返回的最大字节数，超出部分截断
+MCP_FILE_MAX_CONTENT_BYTES = int(os.getenv("MCP_FILE_MAX_CONTENT_BYTES", str(1024 * 1024)))
+# 超过该大小的文件使用 mmap 读取
+MCP_FILE_MMAP_THRESHOLD = int(os.getenv("MCP_FILE_MMAP_THRESHOLD", str(4 * 1024 * 1024)))
+MCP_FILE_IO_WORKERS = int(os.getenv("MCP_FILE_IO_WORKERS", "8"))
+DIRECTORY_DEFAULT_PAGE_SIZE = 100
+DIRECTORY_MAX_PAGE_SIZE = 1000
+
+_io_pool = ThreadPoolExecutor(max_workers=MCP_FILE_IO_WORKERS, thread_name_prefix="mcp-file-io")
+
+
+def _current_umask() -> int:
+    # os.umask 只能先设置再恢复，在导入时（单线程）读取一次
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+_UMASK = _current_umask()
+
+
+def _resolve_path(path: Optional[str]) -> str:
+    """解析路径：相对路径基于 MCP_FILE_ROOT，不允许访问根目录之外的文件"""
+    if not path:
+        raise ValueError("缺少文件路径")
+    root = os.path.realpath(MCP_FILE_ROOT)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if resolved != root and not resolved.startswith(root + os.sep):
+        raise PermissionError(f"路径不在允许的目录内: {path}")
+    return resolved
+
+
+def _decode(data: bytes, encoding: str) -> str:
+    if encoding == "base64":
+        return base64.b64encode(data).decode("ascii")
+    return data.decode(encoding, errors="replace")
+
+
+def read_file(params: Dict[str, Any]) -> Dict[str, Any]:
+    """读取文件的全部或一个字节范围，返回内容不超过 MCP_FILE_MAX_CONTENT_BYTES"""
+    path = _resolve_path(params.get("file_path"))
+    encoding = params.get("encoding") or "utf-8"
+    offset = max(int(params.get("offset") or 0), 0)
+    max_bytes = min(int(params.get("max_bytes") or MCP_FILE_MAX_CONTENT_BYTES), MCP_FILE_MAX_CONTENT_BYTES)
+
+    size = os.path.getsize(path)
+    length = params.get("length")
+    available = max(size - offset, 0)
+    requested = available if length is None else min(max(int(length), 0), available)
+    to_read = min(requested, max_bytes)
+
+    with open(path, "rb") as f:
+        if to_read == 0:
+            data = b""
+        elif size >= MCP_FILE_MMAP_THRESHOLD:
+            # 只映射需要的页面，不把整个文件读入内存
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                data = mapped[offset:offset + to_read]
+        else:
+            f.seek(offset)
+            data = f.read(to_read)
+
+    return {
+        "status": "success",
+        "file_path": path,
+        "size": size,
+        "offset": offset,
+        "length": len(data),
+        "encoding": encoding,
+        "content": _decode(data, encoding),
+        "truncated": to_read < requested,
+        "message": "文件读取成功"
+    }
+
+
+def write_file(params: Dict[str, Any]) -> Dict[str, Any]:
+    """写入文件；覆盖写先写临时文件再原子替换，append 模式追加"""
+    path = _resolve_path(params.get("file_path"))
+    content = params.get("content", "")
+    encoding = params.get("encoding") or "utf-8"
+    mode = params.get("mode") or "overwrite"
+    if mode not in ("overwrite", "append"):
+        raise ValueError(f"不支持的写入模式: {mode}")
+
+    if isinstance(content, (dict, list)):
+        content = json.dumps(content, ensure_ascii=False, indent=2)
+    data = base64.b64decode(content) if encoding == "base64" else str(content).encode(encoding)
+
+    directory = os.path.dirname(path)
+    if params.get("create_dirs", True):
+        os.makedirs(directory, exist_ok=True)
+
+    if mode == "append":
+        with open(path, "ab") as f:
+            f.write(data)
+    else:
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # mkstemp 创建的文件权限是 0600，替换前改为原文件的权限（新文件按 umask）
+            try:
+                file_mode = stat.S_IMODE(os.stat(path).st_mode)
+            except FileNotFoundError:
+                file_mode = 0o666 & ~_UMASK
+            os.chmod(tmp_path, file_mode)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    return {
+        "status": "success",
+        "file_path": path,
+        "mode": mode,
+        "bytes_written": len(data),
+        "size": os.path.getsize(path),
+        "message": "文件写入成功"
+    }
+
+
+def delete_file(params: Dict[str, Any]) -> Dict[str, Any]:
+    """删除文件（不删除目录）"""
+    path = _resolve_path(params.get("file_path"))
+    if os.path.isdir(path):
+        raise IsADirectoryError(f"不能删除目录: {path}")
+    existed = os.path.exists(path)
+    if existed:
+        os.remove(path)
+    elif not params.get("missing_ok", False):
+        raise FileNotFoundError(f"文件不存在: {path}")
+    return {
+        "status": "success",
+        "file_path": path,
+        "deleted": existed,
+        "message": "文件删除成功" if existed else "文件不存在，无需删除"
+    }
+
+
+def _entry_info(entry: os.DirEntry) -> Dict[str, Any]:
+    try:
+        st = entry.stat(follow_symlinks=False)
+        size, modified = st.st_size, st.st_mtime
+    except OSError:
+        size, modified = None, None
+    if entry.is_dir(follow_symlinks=False):
+        kind = "directory"
+    elif entry.is_symlink():
+        kind = "symlink"
+    else:
+        kind = "file"
+    return {"name": entry.name, "type": kind, "size": size if kind == "file" else None, "modified": modified}
+
+
+def list_directory(params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    分页列出目录：按文件名排序，cursor 为上一页最后一个文件名。
+    目录用 os.scandir 流式遍历，每页只保留 page_size 个条目，不构建完整列表。
+    """
+    path = _resolve_path(params.get("directory_path") or ".")
+    page_size = int(params.get("page_size") or DIRECTORY_DEFAULT_PAGE_SIZE)
+    page_size = min(max(page_size, 1), DIRECTORY_MAX_PAGE_SIZE)
+    cursor = params.get("cursor")
+    pattern = params.get("pattern")
+    include_hidden = bool(params.get("include_hidden", False))
+
+    total = 0
+    with os.scandir(path) as it:
+        def _candidates():
+            nonlocal total
+            for entry in it:
+                if not include_hidden and entry.name.startswith("."):
+                    continue
+                if pattern and not fnmatch.fnmatch(entry.name, pattern):
+                    continue
+                total += 1
+                if cursor is not None and entry.name <= cursor:
+                    continue
+                yield entry
+        page: List[os.DirEntry] = heapq.nsmallest(page_size + 1, _candidates(), key=lambda e: e.name)
+
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    entries = [_entry_info(entry) for entry in page]
+    return {
+        "status": "success",
+        "directory_path": path,
+        "entries": entries,
+        "count": len(entries),
+        "total": total,
+        "next_cursor": page[-1].name if has_more else None,
+        "message": "目录列出成功"
+    }
+
+
+FILE_ACTIONS = {
+    "file_read": read_file,
+    "file_write": write_file,
+    "file_delete": delete_file,
+    "directory_list": list_directory,
+}
+
+
+async def run_file_action(action: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """在文件 I/O 线程池中执行文件动作"""
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_io_pool, FILE_ACTIONS[action], params)
+    except Exception as e:
+        return {
+            "status": "error",
+            "error": str(e),
+            "message": f"{action} 执行失败"
+        }
@@ -0,0 +1,204 @@
+# http_cache.py
+"""
+HTTP 响应缓存
+api_call 的 GET 响应按 Cache-Control / Expires 判断新鲜度，过期后用 ETag / Last-Modified
+发起条件请求，服务端返回 304 时直接复用缓存的响应体
+"""
+
+import os
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Mapping, Optional
+from dotenv import load_dotenv
+from cache_utils import TTLCache, stable_hash
+
+# 加载环境变量
+load_dotenv()
+
+HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "true").lower() == "true"
+HTTP_CACHE_SIZE = int(os.getenv("HTTP_CACHE_SIZE", "1024"))
+# 可缓存的最大响应体（字节），更大的响应不缓存
+HTTP_CACHE_MAX_BODY_BYTES = int(os.getenv("HTTP_CACHE_MAX_BODY_BYTES", str(1024 * 1024)))
+# 过期条目保留多久（秒）以便条件请求
+HTTP_CACHE_RETENTION = float(os.getenv("HTTP_CACHE_RETENTION", "3600"))
+
+CACHEABLE_METHODS = {"GET", "HEAD"}
+CACHEABLE_STATUSES = {200, 203}
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    """解析 Cache-Control 头，例如 "max-age=60, no-cache" -> {"max-age": "60", "no-cache": None}"""
+    directives: Dict[str, Optional[str]] = {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') if arg else None
+    return directives
+
+
+def _parse_http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _header(headers: Mapping[str, str], name: str) -> Optional[str]:
+    """大小写不敏感地读取头"""
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+class HTTPResponseCache:
+    """私有 HTTP 缓存（内存 LRU）"""
+
+    def __init__(self, maxsize: int = HTTP_CACHE_SIZE,
+                 max_body_bytes: int = HTTP_CACHE_MAX_BODY_BYTES,
+                 retention: float = HTTP_CACHE_RETENTION,
+                 enabled: bool = HTTP_CACHE_ENABLED):
+        self.enabled = enabled
+        self.max_body_bytes = max_body_bytes
+        self.retention = retention
+        self.memory = TTLCache(maxsize=maxsize, ttl=None)
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stores = 0
+
+    @staticmethod
+    def make_key(method: str, url: str, query: Optional[Mapping[str, Any]] = None) -> str:
+        return stable_hash(method.upper(), url, dict(query or {}))
+
+    def lookup(self, method: str, url: str, query: Optional[Mapping[str, Any]],
+               request_headers: Mapping[str, str]) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存条目，返回的条目带 "fresh" 标记；过期条目仍返回，用于条件请求
+        """
+        if not self.enabled or method.upper() not in CACHEABLE_METHODS:
+            return None
+        request_cc = parse_cache_control(_header(request_headers, "cache-control"))
+        if "no-store" in request_cc:
+            return None
+        entry = self.memory.get(self.make_key(method, url, query))
+        if entry is None:
+            self.misses += 1
+            return None
+        # Vary 中列出的请求头必须一致
+        for name, value in entry["vary"].items():
+            if _header(request_headers, name) != value:
+                self.misses += 1
+                return None
+        fresh = (entry["expires_at"] is not None and entry["expires_at"] > time.time()
+                 and not entry["no_cache"] and "no-cache" not in request_cc)
+        if fresh:
+            self.hits += 1
+        return dict(entry, fresh=fresh)
+
+    @staticmethod
+    def conditional_headers(entry: Dict[str, Any]) -> Dict[str, str]:
+        """过期条目的验证头"""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    @staticmethod
+    def _expires_at(response_headers: Mapping[str, str], now: float) -> Optional[float]:
+        cc = parse_cache_control(_header(response_headers, "cache-control"))
+        if "max-age" in cc:
+            try:
+                age = float(_header(response_headers, "age") or 0)
+                return now + max(float(cc["max-age"] or 0) - age, 0)
+            except ValueError:
+                return None
+        expires = _parse_http_date(_header(response_headers, "expires"))
+        if expires is not None:
+            date = _parse_http_date(_header(response_headers, "date")) or now
+            return now + max(expires - date, 0)
+        return None
+
+    def store(self, method: str, url: str, query: Optional[Mapping[str, Any]],
+              request_headers: Mapping[str, str], status: int,
+              response_headers: Mapping[str, str], body: Any, body_size: int) -> bool:
+        """按响应头决定是否缓存，返回是否已缓存"""
+        if not self.enabled or method.upper() not in CACHEABLE_METHODS or status not in CACHEABLE_STATUSES:
+            return False
+        if body_size > self.max_body_bytes:
+            return False
+        request_cc = parse_cache_control(_header(request_headers, "cache-control"))
+        cc = parse_cache_control(_header(response_headers, "cache-control"))
+        vary = _header(response_headers, "vary")
+        if "no-store" in cc or "no-store" in request_cc or (vary and vary.strip() == "*"):
+            return False
+
+        now = time.time()
+        etag = _header(response_headers, "etag")
+        last_modified = _header(response_headers, "last-modified")
+        expires_at = self._expires_at(response_headers, now)
+        # 既不新鲜也无法验证的响应没有缓存价值
+        if (expires_at is None or expires_at <= now) and not (etag or last_modified):
+            return False
+
+        vary_names = [v.strip().lower() for v in (vary or "").split(",") if v.strip()]
+        entry = {
+            "status": status,
+            "headers": {k.lower(): v for k, v in response_headers.items()},
+            "body": body,
+            "etag": etag,
+            "last_modified": last_modified,
+            "expires_at": expires_at,
+            "no_cache": "no-cache" in cc,
+            "vary": {name: _header(request_headers, name) for name in vary_names},
+            "stored_at": now
+        }
+        retention = max((expires_at or now) - now, 0) + self.retention
+        self.memory.set(self.make_key(method, url, query), entry, ttl=retention)
+        self.stores += 1
+        return True
+
+    def refresh(self, method: str, url: str, query: Optional[Mapping[str, Any]],
+                entry: Dict[str, Any], response_headers: Mapping[str, str]) -> Dict[str, Any]:
+        """收到 304 后用新的响应头更新条目的新鲜度"""
+        now = time.time()
+        entry = {k: v for k, v in entry.items() if k != "fresh"}
+        # 304 的头覆盖缓存的头（响应体相关的头除外），再按合并后的头重新计算新鲜度
+        headers = dict(entry["headers"])
+        for key, value in response_headers.items():
+            if key.lower() not in ("content-length", "content-encoding", "transfer-encoding"):
+                headers[key.lower()] = value
+        entry["headers"] = headers
+        entry["etag"] = headers.get("etag")
+        entry["last_modified"] = headers.get("last-modified")
+        entry["expires_at"] = self._expires_at(headers, now)
+        entry["no_cache"] = "no-cache" in parse_cache_control(headers.get("cache-control"))
+        entry["stored_at"] = now
+        retention = max((entry["expires_at"] or now) - now, 0) + self.retention
+        self.memory.set(self.make_key(method, url, query), entry, ttl=retention)
+        self.revalidated += 1
+        return entry
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "stores": self.stores,
+            "memory": self.memory.get_stats()
+        }
+
+
+# 全局 HTTP 响应缓存
+_http_cache = HTTPResponseCache()
+
+def get_http_cache() -> HTTPResponseCache:
+    """获取全局 HTTP 响应缓存"""
+    return _http_cache
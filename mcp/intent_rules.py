@@ -0,0 +1,300 @@
+# intent_rules.py
+"""
+基于规则的工作流意图解析
+常见的简单指令（发钉钉、部署、上传文件等）用预编译的正则和实体词典在本地解析，
+只有在规则无法完整覆盖整条查询时才交给大模型
+"""
+
+import os
+import re
+import unicodedata
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+WORKFLOW_RULES_ENABLED = os.getenv("WORKFLOW_RULES_ENABLED", "true").lower() == "true"
+
+# 环境实体词典
+ENVIRONMENT_MAPPING = {
+    "生产环境": "production",
+    "生产": "production",
+    "线上环境": "production",
+    "线上": "production",
+    "prod": "production",
+    "production": "production",
+    "预发环境": "staging",
+    "预发布环境": "staging",
+    "预发": "staging",
+    "staging": "staging",
+    "测试环境": "test",
+    "测试": "test",
+    "test": "test",
+    "开发环境": "dev",
+    "开发": "dev",
+    "dev": "dev",
+}
+
+# 服务实体词典
+SERVICE_MAPPING = {
+    "文档服务": "document",
+    "文档": "document",
+    "日志服务": "log",
+    "日志": "log",
+    "图片服务": "image",
+    "图片": "image",
+    "备份服务": "backup",
+    "备份": "backup",
+}
+
+# 步骤之间的连接词；单字「再」只在标点之后才算连接词，避免拆开「再见」这类消息内容
+_CLAUSE_SPLIT_RE = re.compile(r"\s*[,;.]\s*再\s*|\s*(?:[,;.]\s*)?(?:然后|并且|接着|随后|最后|完成后|之后再)\s*|\s*[,;]\s*")
+
+_NAME = r"[A-Za-z0-9_][A-Za-z0-9_.\-]*"
+_VERSION = r"v?\d+(?:\.\d+)*(?:[-+][A-Za-z0-9.]+)?"
+# 只把像路径的词当作路径：包含 /，或以 .扩展名 结尾
+_PATH = r"(?:[^\s]*?/[^\s]*?|[^\s/]+?\.[A-Za-z][A-Za-z0-9]{0,9})"
+_ENV = "|".join(sorted((re.escape(k) for k in ENVIRONMENT_MAPPING), key=len, reverse=True))
+
+# 各动作的句式
+DINGTALK_PATTERNS = [
+    re.compile(r"^(?:请)?(?:发送|发|推送)?(?:一条)?钉钉(?:消息|通知)?(?:给团队|通知团队|给大家|通知大家|通知所有人|给所有人)?"
+               r"(?:说|内容为|内容是|:)\s*(?P<message>.+)$", re.IGNORECASE),
+    re.compile(r"^(?:请)?(?:用钉钉|在钉钉上?)?(?:通知团队|通知大家|通知所有人|告诉大家|告诉团队)(?:说|:)?\s*(?P<message>.+)$"),
+]
+DINGTALK_BARE_PATTERN = re.compile(r"^(?:请)?(?:发送|发|推送)(?:一条)?钉钉(?:消息|通知)(?:给团队|通知团队|给大家|通知大家|通知所有人|给所有人)?$")
+AT_ALL_RE = re.compile(r"所有人|大家|@all", re.IGNORECASE)
+
+DEPLOY_PATTERNS = [
+    re.compile(rf"^(?:请)?部署\s*(?:项目\s*)?(?P<project>{_NAME})\s*(?:项目)?\s*(?:的\s*(?P<version>{_VERSION})\s*版本)?\s*(?:到|至)\s*(?P<env>{_ENV})$", re.IGNORECASE),
+    re.compile(rf"^(?:请)?(?:把|将)\s*(?:项目\s*)?(?P<project>{_NAME})\s*(?:项目)?\s*(?:的\s*(?P<version>{_VERSION})\s*版本)?\s*部署(?:到|至)\s*(?P<env>{_ENV})$", re.IGNORECASE),
+    re.compile(rf"^(?:请)?(?:在|往)\s*(?P<env>{_ENV})\s*部署\s*(?:项目\s*)?(?P<project>{_NAME})(?:\s*(?P<version>{_VERSION}))?$", re.IGNORECASE),
+]
+
+UPLOAD_PATTERNS = [
+    re.compile(rf"^(?:请)?(?:上传|上载)\s*(?:文件)?\s*(?P<file>{_PATH})\s*(?:到|至)\s*(?P<service>[^\s]+?)$"),
+    re.compile(rf"^(?:请)?(?:把|将)\s*(?:文件)?\s*(?P<file>{_PATH})\s*(?:上传|上载)(?:到|至)\s*(?P<service>[^\s]+?)$"),
+]
+
+FILE_READ_PATTERN = re.compile(rf"^(?:请)?(?:读取|查看|打开)\s*(?:文件)?\s*(?P<file>{_PATH})\s*(?:的内容|内容)?$")
+DIRECTORY_LIST_PATTERN = re.compile(rf"^(?:请)?(?:列出\s*(?:目录)?|查看\s*目录)\s*(?P<dir>{_PATH})\s*(?:目录)?(?:下)?(?:的)?(?:内容|文件)?$")
+
+# 规则命中统计
+_stats = {"matches": 0, "declined": 0}
+
+
+class _Clause(str):
+    """
+    用于匹配的规范化子句，同时记录每个字符在原文中的位置；
+    消息内容、文件路径等参数通过 original() 取原文，不受规范化影响
+    """
+
+    def __new__(cls, text: str, source: str, offsets: List[int], source_end: int) -> "_Clause":
+        clause = super().__new__(cls, text)
+        clause.source = source
+        clause.offsets = offsets
+        clause.source_end = source_end
+        return clause
+
+    def original(self, start: int, end: int, keep_tail: bool = False) -> str:
+        """
+        规范化文本 [start, end) 对应的原文；
+        keep_tail 为 True 且延伸到子句末尾时，包含匹配时去掉的结尾标点
+        """
+        if end >= len(self):
+            source_end = self.source_end if keep_tail else self.offsets[-1] + 1
+        else:
+            source_end = self.offsets[end]
+        return self.source[self.offsets[start]:source_end].strip()
+
+    def group(self, m: "re.Match[str]", name: str, keep_tail: bool = False) -> str:
+        return self.original(*m.span(name), keep_tail=keep_tail)
+
+
+def _prepare(text: str) -> Tuple[str, List[int]]:
+    """
+    返回用于匹配的规范化文本（NFKC、中文标点替换、合并空白、去掉结尾标点），
+    以及每个字符在原文中的位置；原文本身不做修改
+    """
+    chars: List[str] = []
+    offsets: List[int] = []
+    for index, char in enumerate(text or ""):
+        for normalized in unicodedata.normalize("NFKC", char).replace("。", ".").replace("、", ","):
+            if normalized.isspace():
+                if not chars or chars[-1] == " ":
+                    continue
+                normalized = " "
+            chars.append(normalized)
+            offsets.append(index)
+    while chars and chars[-1] in " .!?":
+        chars.pop()
+        offsets.pop()
+    return "".join(chars), offsets
+
+
+def _split_clauses(query: str, offsets: List[int], source: str) -> List[_Clause]:
+    clauses = []
+    start = 0
+    bounds = [(m.start(), m.end()) for m in _CLAUSE_SPLIT_RE.finditer(query)] + [(len(query), len(query))]
+    for end, next_start in bounds:
+        text = query[start:end]
+        lead = len(text) - len(text.lstrip())
+        text = text.strip()
+        clause_offsets = offsets[start + lead:start + lead + len(text)]
+        if end == len(query):
+            # 最后一个子句在原文中延伸到结尾，包括匹配时去掉的结尾标点
+            source_end = len(source.rstrip())
+        else:
+            source_end = clause_offsets[-1] + 1 if clause_offsets else 0
+        clauses.append(_Clause(text, source, clause_offsets, source_end))
+        start = next_start
+    return clauses
+
+
+def _map_environment(text: str) -> str:
+    return ENVIRONMENT_MAPPING.get(text.lower(), ENVIRONMENT_MAPPING.get(text, text))
+
+
+def _map_service(text: str) -> str:
+    if text in SERVICE_MAPPING:
+        return SERVICE_MAPPING[text]
+    if text.endswith("服务") and len(text) > 2:
+        return text[:-2]
+    return text
+
+
+def _summarize(steps: List[Dict[str, Any]]) -> Optional[str]:
+    """为没有给出内容的通知生成消息"""
+    if not steps:
+        return None
+    last = steps[-1]
+    params = last["params"]
+    if last["action"] == "deploy":
+        version = f" {params['version']}" if params.get("version") else ""
+        return f"{params['project_name']}{version} 已成功部署到 {params['environment']} 环境"
+    if last["action"] == "upload_file":
+        return f"文件 {params['file_path']} 已上传到 {params['service_name']} 服务"
+    return f"{last['description']} 已完成"
+
+
+def _match_dingtalk(clause: _Clause, steps: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    for pattern in DINGTALK_PATTERNS:
+        m = pattern.match(clause)
+        if m:
+            message = clause.group(m, "message", keep_tail=True)
+            if not message:
+                return None
+            prefix = clause[:m.start("message")]
+            return {
+                "action": "dingtalk_notify",
+                "params": {"message": message, "is_at_all": bool(AT_ALL_RE.search(prefix))},
+                "description": "发送钉钉通知"
+            }
+    if DINGTALK_BARE_PATTERN.match(clause):
+        message = _summarize(steps)
+        if message is None:
+            return None
+        return {
+            "action": "dingtalk_notify",
+            "params": {"message": message, "is_at_all": bool(AT_ALL_RE.search(clause))},
+            "description": "发送钉钉通知"
+        }
+    return None
+
+
+def _match_deploy(clause: _Clause, steps: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    for pattern in DEPLOY_PATTERNS:
+        m = pattern.match(clause)
+        if m:
+            environment = _map_environment(m.group("env"))
+            params = {"project_name": m.group("project"), "environment": environment}
+            if m.group("version"):
+                params["version"] = m.group("version")
+            return {
+                "action": "deploy",
+                "params": params,
+                "description": f"部署 {params['project_name']} 到 {environment} 环境"
+            }
+    return None
+
+
+def _match_upload(clause: _Clause, steps: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    for pattern in UPLOAD_PATTERNS:
+        m = pattern.match(clause)
+        if m:
+            file_path = clause.group(m, "file")
+            service = _map_service(m.group("service"))
+            return {
+                "action": "upload_file",
+                "params": {"file_path": file_path, "service_name": service},
+                "description": f"上传文件 {file_path} 到 {service} 服务"
+            }
+    return None
+
+
+def _match_file_read(clause: _Clause, steps: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    m = FILE_READ_PATTERN.match(clause)
+    if m and m.group("file"):
+        file_path = clause.group(m, "file")
+        return {"action": "file_read", "params": {"file_path": file_path},
+                "description": f"读取文件 {file_path}"}
+    return None
+
+
+def _match_directory_list(clause: _Clause, steps: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    m = DIRECTORY_LIST_PATTERN.match(clause)
+    if m and m.group("dir"):
+        directory = clause.group(m, "dir")
+        return {"action": "directory_list", "params": {"directory_path": directory},
+                "description": f"列出目录 {directory}"}
+    return None
+
+
+# 动作 -> 匹配函数，按优先级排列。
+# file_delete 和 file_write（会覆盖已有文件）不走规则，破坏性操作始终交给大模型确认意图
+RULE_MATCHERS: List[Tuple[str, Callable[[_Clause, List[Dict[str, Any]]], Optional[Dict[str, Any]]]]] = [
+    ("deploy", _match_deploy),
+    ("upload_file", _match_upload),
+    ("directory_list", _match_directory_list),
+    ("file_read", _match_file_read),
+    ("dingtalk_notify", _match_dingtalk),
+]
+
+
+def parse_with_rules(natural_language: str, actions: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    用规则解析查询，每个子句都必须被某条规则完整匹配，否则返回 None
+    """
+    if not WORKFLOW_RULES_ENABLED:
+        return None
+    query, offsets = _prepare(natural_language)
+    clauses = _split_clauses(query, offsets, natural_language or "")
+    if not clauses or any(not c for c in clauses):
+        _stats["declined"] += 1
+        return None
+
+    steps: List[Dict[str, Any]] = []
+    for clause in clauses:
+        step = None
+        for action, matcher in RULE_MATCHERS:
+            if action not in actions:
+                continue
+            step = matcher(clause, steps)
+            if step is not None:
+                break
+        if step is None:
+            _stats["declined"] += 1
+            return None
+        steps.append(step)
+
+    _stats["matches"] += 1
+    return {
+        "description": "，然后".join(step["description"] for step in steps),
+        "steps": steps
+    }
+
+
+def get_rule_stats() -> Dict[str, Any]:
+    """规则解析统计"""
+    return {"enabled": WORKFLOW_RULES_ENABLED, **_stats}
@@ -0,0 +1,301 @@
+# llm_gateway.py
+"""
+统一的异步大模型网关
+所有 DeepSeek 调用共享同一个连接池，并统一做并发限制、超时、重试和调用统计
+"""
+
+import os
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+)
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+LLM_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+LLM_DEFAULT_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
+# 全局并发上限
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+# 单模型默认并发上限，可通过 LLM_MODEL_CONCURRENCY="deepseek-chat=8,deepseek-reasoner=2" 单独配置
+LLM_DEFAULT_MODEL_CONCURRENCY = int(os.getenv("LLM_DEFAULT_MODEL_CONCURRENCY", "8"))
+LLM_MODEL_CONCURRENCY = os.getenv("LLM_MODEL_CONCURRENCY", "")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "8"))
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "50"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+
+# 保留最近调用记录的条数
+RECENT_CALLS_LIMIT = 100
+
+
+def _parse_model_limits(spec: str) -> Dict[str, int]:
+    """解析 "model=limit,model=limit" 格式的并发配置"""
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        model, limit = item.split("=", 1)
+        try:
+            limits[model.strip()] = int(limit)
+        except ValueError:
+            print(f"忽略无效的模型并发配置: {item}")
+    return limits
+
+
+def _is_retryable(error: Exception) -> bool:
+    """429、5xx、超时和连接错误可以重试"""
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class LLMGateway:
+    """异步大模型网关"""
+
+    def __init__(self, api_key: Optional[str] = None,
+                 base_url: Optional[str] = None,
+                 max_concurrency: Optional[int] = None,
+                 model_concurrency: Optional[Dict[str, int]] = None,
+                 timeout: Optional[float] = None,
+                 max_retries: Optional[int] = None):
+        self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
+        self.base_url = base_url or LLM_BASE_URL
+        self.max_concurrency = max_concurrency or LLM_MAX_CONCURRENCY
+        self.model_concurrency = model_concurrency if model_concurrency is not None \
+            else _parse_model_limits(LLM_MODEL_CONCURRENCY)
+        self.timeout = timeout or LLM_TIMEOUT
+        self.max_retries = max_retries if max_retries is not None else LLM_MAX_RETRIES
+
+        # 客户端和信号量绑定到创建它们的事件循环
+        self._client: Optional[AsyncOpenAI] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._global_semaphore: Optional[asyncio.Semaphore] = None
+        self._model_semaphores: Dict[str, asyncio.Semaphore] = {}
+        # 事件循环结束时负责关闭客户端的任务
+        self._client_guard: Optional[asyncio.Task] = None
+
+        # 调用统计
+        self._in_flight = 0
+        self._model_stats: Dict[str, Dict[str, Any]] = {}
+        self._recent_calls = deque(maxlen=RECENT_CALLS_LIMIT)
+
+    def _ensure_loop_resources(self) -> None:
+        """为当前事件循环准备客户端和信号量"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._client is not None:
+            return
+        # 旧客户端的连接属于旧事件循环，交给旧循环关闭
+        self._release_client(self._client, self._loop)
+        self._loop = loop
+        self._global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._model_semaphores = {}
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE
+            ),
+            timeout=self.timeout
+        )
+        self._client = AsyncOpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            # 重试由网关统一处理
+            max_retries=0,
+            http_client=http_client
+        )
+        self._client_guard = loop.create_task(self._close_on_loop_exit(self._client))
+
+    @staticmethod
+    async def _close_on_loop_exit(client: AsyncOpenAI) -> None:
+        """一直挂起；事件循环结束（asyncio.run 退出时取消剩余任务）时在该循环中关闭客户端"""
+        try:
+            await asyncio.Event().wait()
+        finally:
+            if not client.is_closed():
+                await client.close()
+
+    @staticmethod
+    def _release_client(client: Optional[AsyncOpenAI], loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        if client is None or client.is_closed():
+            return
+        if loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.close(), loop)
+
+    def _model_semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._model_semaphores:
+            limit = self.model_concurrency.get(model, LLM_DEFAULT_MODEL_CONCURRENCY)
+            self._model_semaphores[model] = asyncio.Semaphore(limit)
+        return self._model_semaphores[model]
+
+    async def start(self) -> None:
+        """预先创建客户端"""
+        self._ensure_loop_resources()
+
+    async def close(self) -> None:
+        """关闭底层连接池"""
+        client = self._client
+        guard = self._client_guard
+        self._client = None
+        self._client_guard = None
+        self._loop = None
+        if guard is not None:
+            guard.cancel()
+        if client is not None and not client.is_closed():
+            await client.close()
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """指数退避加随机抖动，优先遵循服务端的 Retry-After"""
+        if isinstance(error, APIStatusError):
+            retry_after = error.response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(float(retry_after), LLM_RETRY_MAX_DELAY)
+                except ValueError:
+                    pass
+        ceiling = min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def _record(self, model: str, latency: float, attempts: int,
+                usage: Any = None, error: Optional[Exception] = None) -> None:
+        """记录单次调用的延迟和 token 用量"""
+        stats = self._model_stats.setdefault(model, {
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "total_latency": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "total_tokens": 0
+        })
+        stats["calls"] += 1
+        stats["retries"] += attempts - 1
+        stats["total_latency"] += latency
+        if error is not None:
+            stats["errors"] += 1
+        if usage is not None:
+            stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            stats["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+            stats["total_tokens"] += getattr(usage, "total_tokens", 0) or 0
+
+        self._recent_calls.append({
+            "model": model,
+            "latency": latency,
+            "attempts": attempts,
+            "status": "error" if error is not None else "success",
+            "error": str(error) if error is not None else None,
+            "total_tokens": getattr(usage, "total_tokens", None) if usage is not None else None,
+            "timestamp": time.time()
+        })
+
+    async def _create_with_retry(self, model: str, messages: List[Dict[str, str]],
+                                 start: float, **kwargs) -> Tuple[Any, int]:
+        """发起请求，可重试的错误按退避策略重试，返回 (响应, 尝试次数)"""
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                response = await self._client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    **kwargs
+                )
+                return response, attempts
+            except Exception as e:
+                if attempts > self.max_retries or not _is_retryable(e):
+                    self._record(model, time.perf_counter() - start, attempts, error=e)
+                    raise
+                await asyncio.sleep(self._backoff_delay(attempts - 1, e))
+
+    async def chat_completion(self, messages: List[Dict[str, str]],
+                              model: Optional[str] = None, **kwargs) -> Any:
+        """
+        调用 chat.completions.create，带并发限制和重试，返回原始响应
+        """
+        self._ensure_loop_resources()
+        model = model or LLM_DEFAULT_MODEL
+        start = time.perf_counter()
+
+        async with self._global_semaphore, self._model_semaphore(model):
+            self._in_flight += 1
+            try:
+                response, attempts = await self._create_with_retry(model, messages, start, **kwargs)
+                self._record(model, time.perf_counter() - start, attempts,
+                             usage=getattr(response, "usage", None))
+                return response
+            finally:
+                self._in_flight -= 1
+
+    async def stream_completion(self, messages: List[Dict[str, str]],
+                                model: Optional[str] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        流式调用，逐段产出回复文本。只在收到首个数据块之前重试。
+        """
+        self._ensure_loop_resources()
+        model = model or LLM_DEFAULT_MODEL
+        start = time.perf_counter()
+
+        async with self._global_semaphore, self._model_semaphore(model):
+            self._in_flight += 1
+            try:
+                stream, attempts = await self._create_with_retry(
+                    model, messages, start, stream=True,
+                    stream_options={"include_usage": True}, **kwargs
+                )
+                usage = None
+                try:
+                    async for chunk in stream:
+                        if getattr(chunk, "usage", None) is not None:
+                            usage = chunk.usage
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+                except Exception as e:
+                    self._record(model, time.perf_counter() - start, attempts, error=e)
+                    raise
+                finally:
+                    await stream.close()
+                self._record(model, time.perf_counter() - start, attempts, usage=usage)
+            finally:
+                self._in_flight -= 1
+
+    async def complete(self, messages: List[Dict[str, str]],
+                       model: Optional[str] = None, **kwargs) -> str:
+        """调用大模型并返回首个回复的文本内容"""
+        response = await self.chat_completion(messages, model=model, **kwargs)
+        return (response.choices[0].message.content or "").strip()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调用统计"""
+        models = {}
+        for model, stats in self._model_stats.items():
+            models[model] = dict(stats)
+            models[model]["avg_latency"] = stats["total_latency"] / stats["calls"] if stats["calls"] else 0.0
+        return {
+            "in_flight": self._in_flight,
+            "max_concurrency": self.max_concurrency,
+            "models": models,
+            "recent_calls": list(self._recent_calls)
+        }
+
+
+# 全局网关实例
+_gateway = LLMGateway()
+
+def get_llm_gateway() -> LLMGateway:
+    """获取全局共享的大模型网关"""
+    return _gateway
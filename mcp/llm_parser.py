@@ -1,60 +1,59 @@
 # llm_parser.py
 import os
 import json
-from typing import Any, Dict, List
-from openai import OpenAI
+from typing import Any, AsyncIterator, Dict, List
 from dotenv import load_dotenv
+from llm_gateway import get_llm_gateway
+from async_runner import run_sync
+from parse_cache import get_parse_cache
+from workflow_templates import get_template_store
+from intent_rules import parse_with_rules
+from stream_parser import IncrementalStepParser
 
 # 加载环境变量
 load_dotenv()
 
-# 初始化 DeepSeek 客户端
-client = OpenAI(
-    api_key=os.getenv("DEEPSEEK_API_KEY"),
-    base_url="https://api.deepseek.com"
-)
-
 # 定义可用的 MCP 动作
 AVAILABLE_ACTIONS = {
     "dingtalk_notify": {
         "description": "发送钉钉通知",
-        "params": ["message", "at_mobiles", "is_at_all"]
+        "params": ["message", "at_mobiles", "is_at_all", "wait_for_delivery"]
     },
     "deploy": {
         "description": "部署项目到指定环境",
-        "params": ["environment", "project_name", "version", "config"]
+        "params": ["environment", "project_name", "version", "config", "wait"]
     },
     "upload_file": {
         "description": "上传文件到服务API",
         "params": ["file_path", "service_name", "metadata"]
     },
     "file_read": {
-        "description": "读取文件内容",
-        "params": ["file_path"]
+        "description": "读取文件内容，可指定字节范围",
+        "params": ["file_path", "offset", "length", "encoding"]
     },
     "file_write": {
         "description": "写入文件内容",
-        "params": ["file_path", "content"]
+        "params": ["file_path", "content", "mode"]
     },
     "file_delete": {
         "description": "删除文件",
         "params": ["file_path"]
     },
     "directory_list": {
-        "description": "列出目录内容",
-        "params": ["directory_path"]
+        "description": "列出目录内容（分页）",
+        "params": ["directory_path", "pattern", "page_size", "cursor"]
     },
     "web_search": {
         "description": "搜索网页内容",
         "params": ["query", "num_results"]
     },
     "data_process": {
-        "description": "处理数据",
-        "params": ["data", "operation"]
+        "description": "处理对象数组，operation 为 filter、project、group_by、sort、top_k、dedupe 之一或它们组成的数组",
+        "params": ["data", "operation", "path"]
     },
     "api_call": {
         "description": "调用外部API",
-        "params": ["url", "method", "headers", "body"]
+        "params": ["url", "method", "headers", "query", "body", "stream"]
     }
 }
 
@@ -88,44 +87,156 @@ def create_system_prompt() -> str:
 4. 返回的必须是有效的JSON格式
 """
 
-def parse_to_workflow(natural_language: str) -> Dict[str, Any]:
+def _build_messages(natural_language: str) -> List[Dict[str, str]]:
+    """构建解析请求的消息"""
+    return [
+        {"role": "system", "content": create_system_prompt()},
+        {"role": "user", "content": natural_language}
+    ]
+
+def _load_workflow(workflow_json: str) -> Dict[str, Any]:
+    """解析并验证大模型返回的工作流"""
+    workflow = json.loads(workflow_json)
+    
+    # 验证工作流格式
+    if "steps" not in workflow:
+        workflow["steps"] = []
+    
+    # 验证每个步骤
+    for step in workflow["steps"]:
+        _validate_step(step)
+        
+    return workflow
+
+def _validate_step(step: Dict[str, Any]) -> None:
+    """验证单个步骤的动作是否可用"""
+    if "action" not in step or step["action"] not in AVAILABLE_ACTIONS:
+        raise ValueError(f"无效的动作: {step.get('action')}")
+
+def _error_workflow(e: Exception) -> Dict[str, Any]:
+    """解析失败时返回的默认错误工作流"""
+    print(f"解析工作流时出错: {str(e)}")
+    return {
+        "description": "解析失败",
+        "steps": [],
+        "error": str(e)
+    }
+
+def parse_to_workflow(natural_language: str, use_cache: bool = True) -> Dict[str, Any]:
     """
     调用 DeepSeek 大模型，将自然语言解析为结构化工作流。
+    同步接口，在常驻后台事件循环上执行 parse_to_workflow_async。
+    """
+    return run_sync(parse_to_workflow_async(natural_language, use_cache))
+
+async def parse_to_workflow_async(natural_language: str, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    parse_to_workflow 的异步版本，不阻塞事件循环。
+    常见句式先由本地规则解析；其余查询的解析结果会被缓存，并发的相同请求只调用一次大模型。
+    """
+    workflow = parse_with_rules(natural_language, AVAILABLE_ACTIONS)
+    if workflow is not None:
+        return workflow
+    
+    if not use_cache:
+        return await _parse_with_llm(natural_language)
+    return await get_parse_cache().get_or_parse(
+        natural_language, AVAILABLE_ACTIONS, lambda: _parse_uncached(natural_language)
+    )
+
+class WorkflowStream:
+    """
+    流式解析结果：异步迭代逐个得到已验证的步骤。
+    workflow 字典随解析过程补全（description、steps，失败时带 error），可预先写入执行选项。
     """
+    
+    def __init__(self, natural_language: str, use_cache: bool = True):
+        self.natural_language = natural_language
+        self.use_cache = use_cache
+        self.workflow: Dict[str, Any] = {"description": "", "steps": []}
+    
+    def __aiter__(self) -> AsyncIterator[Dict[str, Any]]:
+        return self._iterate()
+    
+    async def _fast_path(self) -> Dict[str, Any]:
+        """规则、缓存和模板，均不调用大模型"""
+        workflow = parse_with_rules(self.natural_language, AVAILABLE_ACTIONS)
+        if workflow is None and self.use_cache:
+            workflow = await get_parse_cache().get(self.natural_language, AVAILABLE_ACTIONS)
+            if workflow is None:
+                workflow = get_template_store().match(self.natural_language, AVAILABLE_ACTIONS)
+        return workflow
+    
+    async def _iterate(self) -> AsyncIterator[Dict[str, Any]]:
+        workflow = await self._fast_path()
+        if workflow is not None:
+            self.workflow["description"] = workflow.get("description", "")
+            for step in workflow.get("steps", []):
+                self.workflow["steps"].append(step)
+                yield step
+            return
+        
+        parser = IncrementalStepParser()
+        try:
+            async for delta in get_llm_gateway().stream_completion(
+                _build_messages(self.natural_language),
+                temperature=0.1,
+                response_format={"type": "json_object"}
+            ):
+                for step in parser.feed(delta):
+                    _validate_step(step)
+                    self.workflow["steps"].append(step)
+                    yield step
+            
+            workflow = _load_workflow(parser.text)
+            self.workflow["description"] = workflow.get("description", "")
+            # 增量解析漏掉的步骤（例如 steps 不在顶层）在流结束后补齐
+            for step in workflow["steps"][len(self.workflow["steps"]):]:
+                self.workflow["steps"].append(step)
+                yield step
+            
+            if self.use_cache:
+                await get_parse_cache().put(self.natural_language, AVAILABLE_ACTIONS, workflow)
+                get_template_store().learn(self.natural_language, workflow, AVAILABLE_ACTIONS)
+        except Exception as e:
+            error = _error_workflow(e)
+            self.workflow["error"] = error["error"]
+            if not self.workflow["description"]:
+                self.workflow["description"] = error["description"]
+
+def parse_to_workflow_stream(natural_language: str, use_cache: bool = True) -> WorkflowStream:
+    """
+    流式解析工作流：每个步骤在大模型生成完该步骤的 JSON 对象后立即产出，
+    执行器可以边生成边执行。
+    """
+    return WorkflowStream(natural_language, use_cache)
+
+async def _parse_uncached(natural_language: str) -> Dict[str, Any]:
+    """缓存未命中时的解析：先尝试已学习的模板，失败再调用大模型并学习新模板"""
+    templates = get_template_store()
+    workflow = templates.match(natural_language, AVAILABLE_ACTIONS)
+    if workflow is not None:
+        return workflow
+    
+    workflow = await _parse_with_llm(natural_language)
+    if not workflow.get("error"):
+        templates.learn(natural_language, workflow, AVAILABLE_ACTIONS)
+    return workflow
+
+async def _parse_with_llm(natural_language: str) -> Dict[str, Any]:
+    """通过统一的大模型网关调用 DeepSeek 解析工作流"""
     try:
-        response = client.chat.completions.create(
-            model="deepseek-chat",
-            messages=[
-                {"role": "system", "content": create_system_prompt()},
-                {"role": "user", "content": natural_language}
-            ],
+        workflow_json = await get_llm_gateway().complete(
+            _build_messages(natural_language),
             temperature=0.1,
             response_format={"type": "json_object"}
         )
         
         # 解析响应
-        workflow_json = response.choices[0].message.content
-        workflow = json.loads(workflow_json)
-        
-        # 验证工作流格式
-        if "steps" not in workflow:
-            workflow["steps"] = []
-        
-        # 验证每个步骤
-        for step in workflow["steps"]:
-            if "action" not in step or step["action"] not in AVAILABLE_ACTIONS:
-                raise ValueError(f"无效的动作: {step.get('action')}")
-            
-        return workflow
+        return _load_workflow(workflow_json)
         
     except Exception as e:
-        print(f"解析工作流时出错: {str(e)}")
-        # 返回一个默认的错误工作流
-        return {
-            "description": "解析失败",
-            "steps": [],
-            "error": str(e)
-        }
+        return _error_workflow(e)
 
 if __name__ == "__main__":
     query = "发送钉钉消息说测试成功"
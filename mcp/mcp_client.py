@@ -1,82 +1,324 @@
 # mcp_client.py
 import os
 import json
+import math
+import random
 import aiohttp
 import asyncio
-from typing import Any, Dict, Optional
+import tempfile
+import contextlib
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
 from dotenv import load_dotenv
+from async_runner import run_sync, register_shutdown
+from cache_utils import cached_file_sha256
+from upload_index import UploadIndex, get_upload_index
+from file_actions import FILE_ACTIONS, run_file_action
+from http_cache import HTTPResponseCache, get_http_cache
+from data_process import process_data
+from dingtalk_dispatcher import DingTalkDispatcher
 
 # 加载环境变量
 load_dotenv()
 
+# HTTP 连接池配置
+HTTP_POOL_LIMIT = int(os.getenv("MCP_HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("MCP_HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("MCP_HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("MCP_HTTP_DNS_CACHE_TTL", "300"))
+HTTP_REQUEST_TIMEOUT = float(os.getenv("MCP_HTTP_REQUEST_TIMEOUT", "30"))
+# 上传服务是否支持按内容哈希查询已存在的文件（GET /files/{sha256}）
+FILE_UPLOAD_CHECK_ENABLED = os.getenv("FILE_UPLOAD_CHECK_ENABLED", "false").lower() == "true"
+# 上传方式：multipart（单个请求）、chunked（分片、可续传）、auto（大文件分片，服务端不支持时回退）
+FILE_UPLOAD_MODE = os.getenv("FILE_UPLOAD_MODE", "auto").lower()
+FILE_UPLOAD_CHUNKED_THRESHOLD = int(os.getenv("FILE_UPLOAD_CHUNKED_THRESHOLD", str(64 * 1024 * 1024)))
+FILE_UPLOAD_CHUNK_SIZE = int(os.getenv("FILE_UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+FILE_UPLOAD_CONCURRENCY = int(os.getenv("FILE_UPLOAD_CONCURRENCY", "4"))
+FILE_UPLOAD_PART_RETRIES = int(os.getenv("FILE_UPLOAD_PART_RETRIES", "3"))
+FILE_UPLOAD_RETRY_BASE_DELAY = float(os.getenv("FILE_UPLOAD_RETRY_BASE_DELAY", "0.5"))
+FILE_UPLOAD_RETRY_MAX_DELAY = float(os.getenv("FILE_UPLOAD_RETRY_MAX_DELAY", "8"))
+
+# api_call：响应体超过该大小（或请求 stream 时）写入临时文件，只返回文件路径
+API_CALL_MAX_BODY_BYTES = int(os.getenv("API_CALL_MAX_BODY_BYTES", str(1024 * 1024)))
+API_CALL_DOWNLOAD_DIR = os.getenv("API_CALL_DOWNLOAD_DIR", "") or tempfile.gettempdir()
+API_CALL_CHUNK_SIZE = 256 * 1024
+# 返回给工作流的响应头
+API_CALL_RESPONSE_HEADERS = ("content-type", "content-length", "etag", "last-modified", "cache-control", "location")
+
+# 部署状态轮询：状态没有变化时间隔按倍数增长，有变化时回到初始间隔
+DEPLOY_POLL_INITIAL_DELAY = float(os.getenv("DEPLOY_POLL_INITIAL_DELAY", "1"))
+DEPLOY_POLL_MAX_DELAY = float(os.getenv("DEPLOY_POLL_MAX_DELAY", "15"))
+DEPLOY_POLL_BACKOFF = float(os.getenv("DEPLOY_POLL_BACKOFF", "1.5"))
+# 部署服务支持长轮询时设置（秒），状态查询带上 ?wait=N，服务端在状态变化或超时后返回
+DEPLOY_LONG_POLL_WAIT = float(os.getenv("DEPLOY_LONG_POLL_WAIT", "0"))
+# 等待部署完成的最长时间（秒），0 表示不限制
+DEPLOY_TIMEOUT = float(os.getenv("DEPLOY_TIMEOUT", "1800"))
+# 连续多少次状态查询失败后放弃
+DEPLOY_POLL_MAX_ERRORS = int(os.getenv("DEPLOY_POLL_MAX_ERRORS", "5"))
+DEPLOY_SUCCESS_STATES = {"succeeded", "success", "completed"}
+DEPLOY_FAILURE_STATES = {"failed", "error", "cancelled", "rolled_back"}
+
+# 支持进度回调的动作
+PROGRESS_ACTIONS = {"upload_file", "api_call", "deploy"}
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+
+class MCPAPIError(Exception):
+    """MCP 服务返回的错误响应"""
+
+    def __init__(self, status: int, body: Any):
+        super().__init__(f"API 错误: {status} - {body}")
+        self.status = status
+        self.body = body
+
+
+def _read_part(file_path: str, offset: int, length: int) -> bytes:
+    """读取文件的一个分片"""
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        return f.read(length)
+
 class MCPClient:
     """MCP API 客户端"""
     
-    def __init__(self):
+    def __init__(self, limit: Optional[int] = None,
+                 limit_per_host: Optional[int] = None,
+                 keepalive_timeout: Optional[float] = None,
+                 dns_cache_ttl: Optional[int] = None,
+                 upload_index: Optional[UploadIndex] = None,
+                 http_cache: Optional[HTTPResponseCache] = None):
         self.dingtalk_webhook = os.getenv("DINGTALK_WEBHOOK_URL")
         self.deploy_api_url = os.getenv("DEPLOY_API_URL")
         self.file_upload_api_url = os.getenv("FILE_UPLOAD_API_URL")
         self.api_token = os.getenv("MCP_API_TOKEN")
+        self._upload_index = upload_index
+        self.http_cache = http_cache or get_http_cache()
+        # 未完成的分片上传：(服务, sha256) -> upload_id，失败重试时从已上传的分片继续
+        self._pending_uploads: Dict[Tuple[str, str], str] = {}
+        # 服务端是否支持分片上传协议，首次探测后记录
+        self._chunked_supported: Optional[bool] = None
+        # 钉钉通知按 webhook 排队、合并和限速后发送
+        self.dingtalk = DingTalkDispatcher(self._post_dingtalk)
+        
+        # 连接池参数
+        self.limit = limit if limit is not None else HTTP_POOL_LIMIT
+        self.limit_per_host = limit_per_host if limit_per_host is not None else HTTP_POOL_LIMIT_PER_HOST
+        self.keepalive_timeout = keepalive_timeout if keepalive_timeout is not None else HTTP_KEEPALIVE_TIMEOUT
+        self.dns_cache_ttl = dns_cache_ttl if dns_cache_ttl is not None else HTTP_DNS_CACHE_TTL
+        
+        # 共享会话（绑定到创建它的事件循环）
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._session_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session_lock: Optional[asyncio.Lock] = None
+        # 事件循环结束时负责关闭会话的任务
+        self._session_guard: Optional[asyncio.Task] = None
+        
+        # 请求统计
+        self._requests_total = 0
+        self._requests_in_flight = 0
+        self._sessions_created = 0
+    
+    async def start(self) -> None:
+        """启动客户端，预先创建共享会话"""
+        await self._get_session()
+    
+    async def close(self) -> None:
+        """发送排队中的钉钉通知，然后关闭共享会话并释放连接池"""
+        await self.dingtalk.close()
+        session = self._session
+        guard = self._session_guard
+        self._session = None
+        self._session_loop = None
+        self._session_lock = None
+        self._session_guard = None
+        if guard is not None:
+            guard.cancel()
+        if session is not None and not session.closed:
+            await session.close()
+    
+    async def __aenter__(self) -> "MCPClient":
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        await self.close()
+    
+    def _create_session(self) -> aiohttp.ClientSession:
+        """创建带连接池的会话"""
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl
+        )
+        self._sessions_created += 1
+        return aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_REQUEST_TIMEOUT)
+        )
+    
+    @staticmethod
+    async def _close_on_loop_exit(session: aiohttp.ClientSession) -> None:
+        """一直挂起；事件循环结束（asyncio.run 退出时取消剩余任务）时在该循环中关闭会话"""
+        try:
+            await asyncio.Event().wait()
+        finally:
+            if not session.closed:
+                await session.close()
+    
+    @staticmethod
+    def _release_session(session: Optional[aiohttp.ClientSession],
+                         loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """关闭旧事件循环上的会话；连接属于旧循环，只能在旧循环中关闭"""
+        if session is None or session.closed:
+            return
+        if loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享会话，必要时（首次使用、已关闭或事件循环变化）重新创建"""
+        loop = asyncio.get_running_loop()
+        if self._session is not None and not self._session.closed and self._session_loop is loop:
+            return self._session
+        
+        if self._session_lock is None or self._session_loop is not loop:
+            # 旧事件循环上的会话无法在当前循环中复用，交给旧循环关闭
+            self._release_session(self._session, self._session_loop)
+            self._session_lock = asyncio.Lock()
+            self._session = None
+            self._session_guard = None
+            self._session_loop = loop
+        
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                self._session = self._create_session()
+                self._session_guard = loop.create_task(self._close_on_loop_exit(self._session))
+            return self._session
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取连接池使用情况"""
+        stats = {
+            "session_open": self._session is not None and not self._session.closed,
+            "limit": self.limit,
+            "limit_per_host": self.limit_per_host,
+            "keepalive_timeout": self.keepalive_timeout,
+            "dns_cache_ttl": self.dns_cache_ttl,
+            "sessions_created": self._sessions_created,
+            "requests_total": self._requests_total,
+            "requests_in_flight": self._requests_in_flight,
+            "acquired_connections": 0,
+            "idle_connections": 0,
+            "per_host": {}
+        }
+        if not stats["session_open"]:
+            return stats
+        
+        connector = self._session.connector
+        acquired = getattr(connector, "_acquired", ())
+        idle = getattr(connector, "_conns", {})
+        acquired_per_host = getattr(connector, "_acquired_per_host", {})
+        stats["acquired_connections"] = len(acquired)
+        stats["idle_connections"] = sum(len(conns) for conns in idle.values())
+        
+        hosts = set(idle.keys()) | set(acquired_per_host.keys())
+        for key in hosts:
+            host = f"{getattr(key, 'host', key)}:{getattr(key, 'port', '')}"
+            stats["per_host"][host] = {
+                "acquired": len(acquired_per_host.get(key, ())),
+                "idle": len(idle.get(key, ()))
+            }
+        return stats
         
     async def _make_request(self, url: str, method: str = "POST", 
                           headers: Optional[Dict] = None, 
                           data: Optional[Dict] = None,
-                          files: Optional[Dict] = None) -> Dict[str, Any]:
+                          files: Optional[Dict] = None,
+                          timeout: Optional[float] = None) -> Dict[str, Any]:
         """发送 HTTP 请求"""
-        async with aiohttp.ClientSession() as session:
-            default_headers = {"Authorization": f"Bearer {self.api_token}"}
-            if headers:
-                default_headers.update(headers)
-            
-            kwargs = {
-                "headers": default_headers,
-                "timeout": aiohttp.ClientTimeout(total=30)
-            }
-            
-            if files:
-                # 文件上传
-                form_data = aiohttp.FormData()
-                for key, value in (data or {}).items():
-                    form_data.add_field(key, value)
-                for file_key, file_path in files.items():
-                    form_data.add_field(file_key, open(file_path, 'rb'))
-                kwargs["data"] = form_data
-            elif data:
-                kwargs["json"] = data
-            
-            async with session.request(method, url, **kwargs) as response:
-                result = await response.json()
-                if response.status >= 400:
-                    raise Exception(f"API 错误: {response.status} - {result}")
-                return result
+        session = await self._get_session()
+        default_headers = {"Authorization": f"Bearer {self.api_token}"}
+        if headers:
+            default_headers.update(headers)
+        
+        kwargs = {
+            "headers": default_headers,
+            "timeout": aiohttp.ClientTimeout(total=timeout or HTTP_REQUEST_TIMEOUT)
+        }
+        
+        self._requests_total += 1
+        self._requests_in_flight += 1
+        try:
+            with contextlib.ExitStack() as stack:
+                if files:
+                    # 文件上传：文件对象按块流式发送，请求结束后关闭
+                    form_data = aiohttp.FormData()
+                    for key, value in (data or {}).items():
+                        form_data.add_field(key, value)
+                    for file_key, file_path in files.items():
+                        form_data.add_field(file_key, stack.enter_context(open(file_path, 'rb')),
+                                            filename=os.path.basename(file_path))
+                    kwargs["data"] = form_data
+                    # 大文件上传只限制连接和读取超时，不限制总时长
+                    kwargs["timeout"] = aiohttp.ClientTimeout(
+                        total=None, sock_connect=HTTP_REQUEST_TIMEOUT, sock_read=HTTP_REQUEST_TIMEOUT
+                    )
+                elif data:
+                    kwargs["json"] = data
+                
+                async with session.request(method, url, **kwargs) as response:
+                    result = await response.json(content_type=None)
+                    if response.status >= 400:
+                        raise MCPAPIError(response.status, result)
+                    return result
+        finally:
+            self._requests_in_flight -= 1
+    
+    async def _post_dingtalk(self, webhook: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """分发器实际发送钉钉消息"""
+        return await self._make_request(webhook, method="POST", data=payload)
     
     async def send_dingtalk_notification(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        """发送钉钉通知"""
+        """
+        发送钉钉通知：消息进入分发队列，默认等待实际投递结果，投递失败时步骤失败；
+        wait_for_delivery 为 false 时入队后立即返回 message_id
+        """
         try:
-            message = params.get("message", "")
-            at_mobiles = params.get("at_mobiles", [])
-            is_at_all = params.get("is_at_all", False)
-            
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                },
-                "at": {
-                    "atMobiles": at_mobiles,
-                    "isAtAll": is_at_all
-                }
-            }
+            webhook = params.get("webhook") or self.dingtalk_webhook
+            if not webhook:
+                raise ValueError("未配置钉钉 Webhook（DINGTALK_WEBHOOK_URL）")
             
-            result = await self._make_request(
-                self.dingtalk_webhook,
-                method="POST",
-                data=data
+            pending = self.dingtalk.submit(
+                webhook,
+                params.get("message", ""),
+                at_mobiles=params.get("at_mobiles", []),
+                is_at_all=params.get("is_at_all", False)
             )
             
+            if not params.get("wait_for_delivery", True):
+                return {
+                    "status": "success",
+                    "message_id": pending.message_id,
+                    "queued": True,
+                    "message": "钉钉通知已加入发送队列"
+                }
+            
+            # 步骤超时取消的是等待，不影响消息继续投递
+            delivery = await asyncio.shield(pending.future)
+            if delivery["status"] != "delivered":
+                return {
+                    "status": "error",
+                    "message_id": pending.message_id,
+                    "delivery": delivery,
+                    "error": delivery.get("error"),
+                    "message": "钉钉通知发送失败"
+                }
             return {
                 "status": "success",
-                "result": result,
+                "message_id": pending.message_id,
+                "queued": False,
+                "delivery": delivery,
+                "result": delivery.get("response"),
                 "message": "钉钉通知发送成功"
             }
         except Exception as e:
@@ -86,8 +328,12 @@ class MCPClient:
                 "message": "钉钉通知发送失败"
             }
     
-    async def deploy_to_environment(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        """部署到指定环境"""
+    async def deploy_to_environment(self, params: Dict[str, Any],
+                                    progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """
+        部署到指定环境：提交后按 deployment_id 轮询部署状态，直到部署结束才返回。
+        等待期间只占用一个协程，其他步骤照常执行；"wait": false 时提交后立即返回
+        """
         try:
             environment = params.get("environment", "dev")
             project_name = params.get("project_name")
@@ -99,7 +345,7 @@ class MCPClient:
                 "project": project_name,
                 "version": version,
                 "config": config,
-                "timestamp": os.popen("date").read().strip()
+                "timestamp": datetime.now(timezone.utc).isoformat()
             }
             
             result = await self._make_request(
@@ -107,11 +353,49 @@ class MCPClient:
                 method="POST",
                 data=deploy_data
             )
+            deployment_id = result.get("deployment_id")
+            state = str(result.get("status") or "submitted").lower()
             
+            if (not params.get("wait", True) or not deployment_id
+                    or state in DEPLOY_SUCCESS_STATES | DEPLOY_FAILURE_STATES):
+                if state in DEPLOY_FAILURE_STATES:
+                    raise ValueError(f"部署失败，状态: {state}")
+                return {
+                    "status": "success",
+                    "result": result,
+                    "deployment_id": deployment_id,
+                    "deployment_status": state,
+                    "message": f"已提交部署到 {environment} 环境" if state not in DEPLOY_SUCCESS_STATES
+                               else f"成功部署到 {environment} 环境"
+                }
+            
+            final = await self._wait_for_deployment(deployment_id, result, progress)
+            state = str(final.get("status") or "").lower()
+            if final.get("tracked") is False:
+                # 部署服务不支持状态查询，提交成功即视为成功
+                return {
+                    "status": "success",
+                    "result": final,
+                    "deployment_id": deployment_id,
+                    "deployment_status": state,
+                    "tracked": False,
+                    "message": f"已提交部署到 {environment} 环境，部署服务不支持状态查询"
+                }
+            if state not in DEPLOY_SUCCESS_STATES:
+                return {
+                    "status": "error",
+                    "result": final,
+                    "deployment_id": deployment_id,
+                    "deployment_status": state,
+                    "error": final.get("error") or final.get("message") or f"部署状态: {state}",
+                    "message": "部署失败"
+                }
             return {
                 "status": "success",
-                "result": result,
-                "deployment_id": result.get("deployment_id"),
+                "result": final,
+                "deployment_id": deployment_id,
+                "deployment_status": state,
+                "polls": final.get("polls"),
                 "message": f"成功部署到 {environment} 环境"
             }
         except Exception as e:
@@ -121,8 +405,243 @@ class MCPClient:
                 "message": "部署失败"
             }
     
-    async def upload_file_to_service(self, params: Dict[str, Any]) -> Dict[str, Any]:
-        """上传文件到服务API"""
+    async def _wait_for_deployment(self, deployment_id: str, submitted: Dict[str, Any],
+                                   progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """轮询部署状态直到结束；服务端没有状态接口时把提交结果视为成功"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        url = f"{self.deploy_api_url}/deployments/{deployment_id}"
+        if DEPLOY_LONG_POLL_WAIT > 0:
+            url += f"?wait={DEPLOY_LONG_POLL_WAIT:g}"
+        delay = DEPLOY_POLL_INITIAL_DELAY
+        status = submitted
+        last_seen = None
+        polls = 0
+        errors = 0
+        # 长轮询请求提前返回且状态没有变化时，说明服务端没有挂起请求，需要客户端等待
+        throttle = False
+        
+        def _report(current: Dict[str, Any]):
+            if progress is not None:
+                progress({
+                    "action": "deploy",
+                    "phase": "deploy",
+                    "deployment_id": deployment_id,
+                    "state": current.get("status"),
+                    "progress": current.get("progress"),
+                    "stage": current.get("stage"),
+                    "elapsed": loop.time() - started
+                })
+        _report(status)
+        
+        while True:
+            if DEPLOY_TIMEOUT and loop.time() - started >= DEPLOY_TIMEOUT:
+                raise TimeoutError(f"等待部署 {deployment_id} 完成超时（{DEPLOY_TIMEOUT:g} 秒）")
+            # 长轮询由服务端挂起请求，不需要客户端等待
+            if DEPLOY_LONG_POLL_WAIT <= 0 or errors or throttle:
+                await asyncio.sleep(delay)
+            try:
+                polls += 1
+                requested_at = loop.time()
+                status = await self._make_request(
+                    url, method="GET",
+                    timeout=HTTP_REQUEST_TIMEOUT + DEPLOY_LONG_POLL_WAIT
+                )
+                errors = 0
+            except MCPAPIError as e:
+                if e.status in (404, 405, 501) and polls == 1:
+                    # 部署服务不支持状态查询
+                    return dict(submitted, status="submitted", polls=polls, tracked=False)
+                if e.status < 500 and e.status != 429:
+                    raise
+                errors += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                errors += 1
+            if errors:
+                if errors >= DEPLOY_POLL_MAX_ERRORS:
+                    raise RuntimeError(f"部署 {deployment_id} 状态查询连续失败 {errors} 次")
+                delay = min(delay * DEPLOY_POLL_BACKOFF, DEPLOY_POLL_MAX_DELAY)
+                continue
+            
+            state = str(status.get("status") or "").lower()
+            seen = (state, status.get("stage"), status.get("progress"))
+            if state in DEPLOY_SUCCESS_STATES | DEPLOY_FAILURE_STATES:
+                _report(status)
+                return dict(status, polls=polls)
+            if seen != last_seen:
+                _report(status)
+                last_seen = seen
+                delay = DEPLOY_POLL_INITIAL_DELAY
+                throttle = False
+            else:
+                delay = min(delay * DEPLOY_POLL_BACKOFF, DEPLOY_POLL_MAX_DELAY)
+                throttle = loop.time() - requested_at < DEPLOY_LONG_POLL_WAIT / 2
+    
+    @property
+    def upload_index(self) -> UploadIndex:
+        return self._upload_index or get_upload_index()
+    
+    async def _check_existing_upload(self, service_name: str, sha256: str) -> Optional[Dict[str, Any]]:
+        """询问上传服务是否已有这份内容，服务端不支持或不存在时返回 None"""
+        session = await self._get_session()
+        try:
+            async with session.get(
+                f"{self.file_upload_api_url}/files/{sha256}",
+                params={"service": service_name},
+                headers={"Authorization": f"Bearer {self.api_token}"},
+                timeout=aiohttp.ClientTimeout(total=HTTP_REQUEST_TIMEOUT)
+            ) as response:
+                if response.status != 200:
+                    return None
+                result = await response.json()
+                return result if result.get("file_id") or result.get("url") else None
+        except Exception as e:
+            print(f"查询已上传文件失败，继续上传: {str(e)}")
+            return None
+    
+    async def _put_part(self, url: str, data: bytes) -> Dict[str, Any]:
+        """上传单个分片，网络错误、429 和 5xx 按指数退避重试"""
+        session = await self._get_session()
+        headers = {"Authorization": f"Bearer {self.api_token}", "Content-Type": "application/octet-stream"}
+        attempt = 0
+        while True:
+            try:
+                self._requests_total += 1
+                self._requests_in_flight += 1
+                try:
+                    async with session.put(
+                        url, data=data, headers=headers,
+                        timeout=aiohttp.ClientTimeout(total=None, sock_connect=HTTP_REQUEST_TIMEOUT,
+                                                      sock_read=HTTP_REQUEST_TIMEOUT)
+                    ) as response:
+                        result = await response.json(content_type=None)
+                        if response.status >= 400:
+                            raise MCPAPIError(response.status, result)
+                        return result
+                finally:
+                    self._requests_in_flight -= 1
+            except (aiohttp.ClientError, asyncio.TimeoutError, MCPAPIError) as e:
+                retryable = not isinstance(e, MCPAPIError) or e.status == 429 or e.status >= 500
+                if not retryable or attempt >= FILE_UPLOAD_PART_RETRIES:
+                    raise
+                ceiling = min(FILE_UPLOAD_RETRY_MAX_DELAY, FILE_UPLOAD_RETRY_BASE_DELAY * (2 ** attempt))
+                await asyncio.sleep(random.uniform(0, ceiling))
+                attempt += 1
+    
+    async def _upload_chunked(self, file_path: str, service_name: str, metadata: Dict[str, Any],
+                              sha256: str, size: int,
+                              progress: Optional[ProgressCallback] = None) -> Optional[Dict[str, Any]]:
+        """
+        分片上传：创建（或续传）上传会话，只发送服务端尚未收到的分片，全部完成后合并。
+        内存占用不超过 并发数 × 分片大小。服务端没有分片上传接口时返回 None。
+        """
+        base_url = self.file_upload_api_url
+        chunk_size = FILE_UPLOAD_CHUNK_SIZE
+        parts_total = max(1, math.ceil(size / chunk_size))
+        pending_key = (service_name, sha256)
+        
+        try:
+            session_info = await self._make_request(f"{base_url}/uploads", method="POST", data={
+                "service": service_name,
+                "filename": os.path.basename(file_path),
+                "size": size,
+                "sha256": sha256,
+                "chunk_size": chunk_size,
+                "metadata": metadata,
+                "upload_id": self._pending_uploads.get(pending_key)
+            })
+        except MCPAPIError as e:
+            if e.status in (404, 405, 501):
+                return None
+            raise
+        upload_id = session_info["upload_id"]
+        self._pending_uploads[pending_key] = upload_id
+        
+        def _part_length(index: int) -> int:
+            return min(chunk_size, size - index * chunk_size) if size else 0
+        
+        received = {int(i) for i in session_info.get("received_parts", []) if 0 <= int(i) < parts_total}
+        state = {"bytes_sent": sum(_part_length(i) for i in received), "parts_done": len(received)}
+        
+        def _report():
+            if progress is not None:
+                progress({
+                    "action": "upload_file",
+                    "phase": "upload",
+                    "mode": "chunked",
+                    "upload_id": upload_id,
+                    "bytes_sent": state["bytes_sent"],
+                    "total_bytes": size,
+                    "parts_done": state["parts_done"],
+                    "parts_total": parts_total,
+                    "resumed_parts": len(received)
+                })
+        _report()
+        
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(FILE_UPLOAD_CONCURRENCY)
+        
+        async def _send(index: int):
+            async with semaphore:
+                data = await loop.run_in_executor(None, _read_part, file_path, index * chunk_size, chunk_size)
+                await self._put_part(f"{base_url}/uploads/{upload_id}/parts/{index}", data)
+                state["bytes_sent"] += len(data)
+                state["parts_done"] += 1
+                _report()
+        
+        tasks = [asyncio.ensure_future(_send(i)) for i in range(parts_total) if i not in received]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # 一个分片最终失败时停止其余分片，已上传的分片留给下次续传
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        
+        result = await self._make_request(f"{base_url}/uploads/{upload_id}/complete", method="POST", data={
+            "sha256": sha256
+        })
+        self._pending_uploads.pop(pending_key, None)
+        return result
+    
+    async def _upload_multipart(self, file_path: str, service_name: str, metadata: Dict[str, Any],
+                                sha256: str, size: int,
+                                progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """单个 multipart 请求上传，文件按块流式读取"""
+        def _report(bytes_sent: int):
+            if progress is not None:
+                progress({
+                    "action": "upload_file",
+                    "phase": "upload",
+                    "mode": "multipart",
+                    "bytes_sent": bytes_sent,
+                    "total_bytes": size
+                })
+        _report(0)
+        result = await self._make_request(
+            f"{self.file_upload_api_url}/upload",
+            method="POST",
+            data={
+                "service": service_name,
+                "metadata": json.dumps(metadata),
+                "sha256": sha256
+            },
+            files={"file": file_path}
+        )
+        _report(size)
+        return result
+    
+    def _use_chunked(self, size: int) -> bool:
+        if FILE_UPLOAD_MODE == "chunked":
+            return True
+        if FILE_UPLOAD_MODE == "multipart" or self._chunked_supported is False:
+            return False
+        return size >= FILE_UPLOAD_CHUNKED_THRESHOLD
+    
+    async def upload_file_to_service(self, params: Dict[str, Any],
+                                     progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """上传文件到服务API，同一份内容已上传到该服务时直接返回之前的 file_id"""
         try:
             file_path = params.get("file_path")
             service_name = params.get("service_name", "default")
@@ -131,23 +650,48 @@ class MCPClient:
             if not file_path or not os.path.exists(file_path):
                 raise ValueError(f"文件不存在: {file_path}")
             
-            upload_data = {
-                "service": service_name,
-                "metadata": json.dumps(metadata)
-            }
+            # 分块计算内容哈希，不阻塞事件循环
+            loop = asyncio.get_running_loop()
+            sha256 = await loop.run_in_executor(None, cached_file_sha256, file_path)
+            size = os.path.getsize(file_path)
             
-            result = await self._make_request(
-                f"{self.file_upload_api_url}/upload",
-                method="POST",
-                data=upload_data,
-                files={"file": file_path}
-            )
+            if params.get("dedup", True):
+                existing = await self.upload_index.lookup(service_name, sha256)
+                if existing is None and FILE_UPLOAD_CHECK_ENABLED:
+                    remote = await self._check_existing_upload(service_name, sha256)
+                    if remote is not None:
+                        await self.upload_index.record(service_name, sha256, remote.get("file_id"),
+                                                       remote.get("url"), size, remote=True)
+                        existing = {"file_id": remote.get("file_id"), "url": remote.get("url")}
+                if existing is not None:
+                    return {
+                        "status": "success",
+                        "result": existing,
+                        "file_id": existing.get("file_id"),
+                        "file_url": existing.get("url"),
+                        "sha256": sha256,
+                        "deduplicated": True,
+                        "message": "文件内容已存在，跳过上传"
+                    }
+            
+            result = None
+            if self._use_chunked(size):
+                result = await self._upload_chunked(file_path, service_name, metadata, sha256, size, progress)
+                # 服务端没有分片上传接口时回退到 multipart
+                self._chunked_supported = result is not None
+                if result is None and FILE_UPLOAD_MODE == "chunked":
+                    raise ValueError("上传服务不支持分片上传")
+            if result is None:
+                result = await self._upload_multipart(file_path, service_name, metadata, sha256, size, progress)
+            await self.upload_index.record(service_name, sha256, result.get("file_id"), result.get("url"), size)
             
             return {
                 "status": "success",
                 "result": result,
                 "file_id": result.get("file_id"),
                 "file_url": result.get("url"),
+                "sha256": sha256,
+                "deduplicated": False,
                 "message": "文件上传成功"
             }
         except Exception as e:
@@ -157,15 +701,145 @@ class MCPClient:
                 "message": "文件上传失败"
             }
     
-    async def execute_action(self, action: str, params: Dict[str, Any]) -> Dict[str, Any]:
-        """执行具体的 MCP 动作"""
+    async def _read_api_body(self, response: aiohttp.ClientResponse, stream: bool,
+                             progress: Optional[ProgressCallback] = None) -> Tuple[Any, Optional[str], int]:
+        """
+        读取响应体，返回 (内容, 临时文件路径, 字节数)。
+        请求 stream 或响应体超过 API_CALL_MAX_BODY_BYTES 时边读边写入临时文件，内存占用有上限。
+        """
+        total = response.content_length
+        to_file = stream or (total is not None and total > API_CALL_MAX_BODY_BYTES)
+        buffer = bytearray()
+        loop = asyncio.get_running_loop()
+        file_obj = None
+        size = 0
+        try:
+            async for chunk in response.content.iter_chunked(API_CALL_CHUNK_SIZE):
+                size += len(chunk)
+                if not to_file and size > API_CALL_MAX_BODY_BYTES:
+                    to_file = True
+                if to_file:
+                    if file_obj is None:
+                        file_obj = await loop.run_in_executor(None, lambda: tempfile.NamedTemporaryFile(
+                            dir=API_CALL_DOWNLOAD_DIR, prefix="api-call-", delete=False))
+                        if buffer:
+                            await loop.run_in_executor(None, file_obj.write, bytes(buffer))
+                            buffer.clear()
+                    await loop.run_in_executor(None, file_obj.write, chunk)
+                    if progress is not None:
+                        progress({"action": "api_call", "phase": "download", "bytes_received": size, "total_bytes": total})
+                else:
+                    buffer.extend(chunk)
+        finally:
+            if file_obj is not None:
+                await loop.run_in_executor(None, file_obj.close)
+
+        if file_obj is not None:
+            return None, file_obj.name, size
+        text = bytes(buffer).decode(response.charset or "utf-8", errors="replace")
+        if "json" in (response.content_type or ""):
+            try:
+                return json.loads(text), None, size
+            except ValueError:
+                pass
+        return text, None, size
+    
+    async def call_external_api(self, params: Dict[str, Any],
+                                progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """
+        调用外部 HTTP API（共享连接池）。
+        GET/HEAD 响应按 Cache-Control、ETag、Last-Modified 缓存，过期后发起条件请求，304 时复用缓存内容。
+        """
+        try:
+            url = params.get("url")
+            if not url:
+                raise ValueError("缺少 url")
+            method = str(params.get("method") or "GET").upper()
+            headers = {str(k): str(v) for k, v in (params.get("headers") or {}).items()}
+            query = params.get("query") or params.get("params")
+            body = params.get("body")
+            stream = bool(params.get("stream", False))
+            timeout = float(params.get("timeout") or HTTP_REQUEST_TIMEOUT)
+            
+            cached = None if stream else self.http_cache.lookup(method, url, query, headers)
+            if cached is not None and cached["fresh"]:
+                return self._api_result(cached["status"], cached["headers"], cached["body"], None, "hit")
+            request_headers = dict(headers)
+            if cached is not None:
+                request_headers.update(self.http_cache.conditional_headers(cached))
+            
+            kwargs: Dict[str, Any] = {
+                "headers": request_headers,
+                "params": query,
+                "timeout": aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+            }
+            if body is not None:
+                if isinstance(body, (dict, list)):
+                    kwargs["json"] = body
+                else:
+                    kwargs["data"] = str(body)
+            
+            session = await self._get_session()
+            self._requests_total += 1
+            self._requests_in_flight += 1
+            try:
+                async with session.request(method, url, **kwargs) as response:
+                    response_headers = dict(response.headers)
+                    if response.status == 304 and cached is not None:
+                        entry = self.http_cache.refresh(method, url, query, cached, response_headers)
+                        return self._api_result(entry["status"], entry["headers"], entry["body"], None, "revalidated")
+                    content, body_file, size = await self._read_api_body(response, stream, progress)
+                    status = response.status
+            finally:
+                self._requests_in_flight -= 1
+            
+            stored = body_file is None and self.http_cache.store(
+                method, url, query, headers, status, response_headers, content, size
+            )
+            return self._api_result(status, response_headers, content, body_file, "stored" if stored else "miss", size)
+        except Exception as e:
+            return {
+                "status": "error",
+                "error": str(e),
+                "message": "API 调用失败"
+            }
+    
+    @staticmethod
+    def _api_result(status: int, headers: Dict[str, str], body: Any, body_file: Optional[str],
+                    cache_status: str, size: Optional[int] = None) -> Dict[str, Any]:
+        result = {
+            "status": "success" if status < 400 else "error",
+            "status_code": status,
+            "headers": {k.lower(): v for k, v in headers.items() if k.lower() in API_CALL_RESPONSE_HEADERS},
+            "http_cache": cache_status,
+            "message": "API 调用成功" if status < 400 else f"API 返回错误状态: {status}"
+        }
+        if body_file is not None:
+            result["body_file"] = body_file
+            result["body_size"] = size
+        else:
+            result["body"] = body
+        if status >= 400:
+            result["error"] = f"HTTP {status}"
+        return result
+    
+    async def execute_action(self, action: str, params: Dict[str, Any],
+                             progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """执行具体的 MCP 动作，progress 接收长时间运行动作的进度事件"""
         action_map = {
             "dingtalk_notify": self.send_dingtalk_notification,
             "deploy": self.deploy_to_environment,
             "upload_file": self.upload_file_to_service,
+            "api_call": self.call_external_api,
+            "data_process": process_data,
         }
         
+        if action in FILE_ACTIONS:
+            # 本地文件动作在 I/O 线程池中执行
+            return await run_file_action(action, params)
         if action in action_map:
+            if progress is not None and action in PROGRESS_ACTIONS:
+                return await action_map[action](params, progress=progress)
             return await action_map[action](params)
         else:
             # 处理其他通用动作
@@ -184,13 +858,16 @@ class MCPClient:
 # 全局客户端实例
 _client = MCPClient()
 
+def get_client() -> MCPClient:
+    """获取全局共享的 MCP 客户端"""
+    return _client
+
 def call_mcp_api(action: str, params: dict) -> Any:
     """
     同步接口，用于兼容现有代码
+    在常驻后台事件循环上执行，连接池在多次调用之间复用
     """
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(_client.execute_action(action, params))
-    finally:
-        loop.close() 
\ No newline at end of file
+    return run_sync(_client.execute_action(action, params))
+
+# 进程退出时释放连接池
+register_shutdown(_client.close) 
\ No newline at end of file
@@ -0,0 +1,281 @@
+# mock_services.py
+"""
+本地模拟服务
+在没有真实上传服务时用于开发和测试，实现了 mcp_client 使用的上传接口：
+- POST /upload                         multipart 上传
+- GET  /files/{sha256}                 按内容哈希查询已上传的文件
+- POST /uploads                        创建或续传分片上传会话
+- GET  /uploads/{upload_id}            查看会话和已收到的分片
+- PUT  /uploads/{upload_id}/parts/{n}  上传分片
+- POST /uploads/{upload_id}/complete   合并分片
+- POST /dingtalk/robot/send            钉钉机器人（每分钟 20 条，超出返回 errcode 130101）
+- GET  /dingtalk/messages              查看机器人收到的消息
+- POST /deploy                         提交部署，返回 deployment_id
+- GET  /deployments/{deployment_id}    部署状态，支持 ?wait=N 长轮询
+
+启动方式：
+    uvicorn mock_services:app --port 9000
+然后在 .env 中设置 FILE_UPLOAD_API_URL=http://localhost:9000、DEPLOY_API_URL=http://localhost:9000，
+DINGTALK_WEBHOOK_URL=http://localhost:9000/dingtalk/robot/send
+"""
+
+import os
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import tempfile
+from typing import Any, Dict, List, Optional
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from pydantic import BaseModel
+
+MOCK_STORAGE_DIR = os.getenv("MOCK_STORAGE_DIR") or tempfile.mkdtemp(prefix="mcp-mock-")
+# 分片上传的随机失败率，用于验证客户端重试
+MOCK_PART_FAILURE_RATE = float(os.getenv("MOCK_PART_FAILURE_RATE", "0"))
+MOCK_BASE_URL = os.getenv("MOCK_BASE_URL", "http://localhost:9000")
+# 模拟部署的耗时（秒）和失败率；config 中 "fail": true 的部署必定失败
+MOCK_DEPLOY_DURATION = float(os.getenv("MOCK_DEPLOY_DURATION", "10"))
+MOCK_DEPLOY_FAILURE_RATE = float(os.getenv("MOCK_DEPLOY_FAILURE_RATE", "0"))
+# 模拟没有状态接口的部署服务，以及不支持长轮询（忽略 ?wait）的部署服务
+MOCK_DEPLOY_STATUS_ENABLED = os.getenv("MOCK_DEPLOY_STATUS_ENABLED", "true").lower() == "true"
+MOCK_DEPLOY_LONG_POLL = os.getenv("MOCK_DEPLOY_LONG_POLL", "true").lower() == "true"
+DEPLOY_STAGES = ("build", "push", "rollout", "health_check")
+
+app = FastAPI(title="MCP 模拟服务", version="1.0.0")
+
+# 已完成的文件：(服务, sha256) -> 文件信息
+_files: Dict[str, Dict[str, Any]] = {}
+# 分片上传会话
+_uploads: Dict[str, Dict[str, Any]] = {}
+_stats = {"uploads": 0, "parts": 0, "part_failures": 0, "bytes_received": 0,
+          "dingtalk_messages": 0, "dingtalk_throttled": 0, "deployments": 0, "deployment_polls": 0}
+# 钉钉机器人收到的消息和最近一分钟的发送时间
+_dingtalk_messages: List[Dict[str, Any]] = []
+_dingtalk_sent_at: List[float] = []
+# 部署记录，状态按提交后经过的时间计算
+_deployments: Dict[str, Dict[str, Any]] = {}
+
+
+class UploadSessionRequest(BaseModel):
+    service: str = "default"
+    filename: str
+    size: int
+    sha256: str
+    chunk_size: int
+    metadata: Optional[Dict[str, Any]] = None
+    upload_id: Optional[str] = None
+
+
+def _file_key(service: str, sha256: str) -> str:
+    return f"{service}:{sha256}"
+
+
+def _register_file(service: str, sha256: str, path: str, size: int) -> Dict[str, Any]:
+    file_id = uuid.uuid4().hex
+    info = {"file_id": file_id, "url": f"{MOCK_BASE_URL}/files/{sha256}", "size": size,
+            "sha256": sha256, "service": service, "path": path}
+    _files[_file_key(service, sha256)] = info
+    _stats["uploads"] += 1
+    return info
+
+
+def _public(info: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in info.items() if k != "path"}
+
+
+@app.post("/upload")
+async def upload(file: UploadFile = File(...), service: str = Form("default"),
+                 metadata: str = Form("{}"), sha256: Optional[str] = Form(None)):
+    """multipart 上传，按块写盘"""
+    path = os.path.join(MOCK_STORAGE_DIR, uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as f:
+        while True:
+            chunk = await file.read(1024 * 1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+            size += len(chunk)
+    _stats["bytes_received"] += size
+    actual = digest.hexdigest()
+    if sha256 and sha256 != actual:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail="sha256 不匹配")
+    return _public(_register_file(service, actual, path, size))
+
+
+@app.get("/files/{sha256}")
+def get_file(sha256: str, service: str = "default"):
+    info = _files.get(_file_key(service, sha256))
+    if info is None:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return _public(info)
+
+
+@app.post("/uploads")
+def create_upload(req: UploadSessionRequest):
+    """创建分片上传会话；带上未完成会话的 upload_id 时续传"""
+    session = _uploads.get(req.upload_id) if req.upload_id else None
+    if session is None or session["sha256"] != req.sha256 or session["chunk_size"] != req.chunk_size:
+        upload_id = uuid.uuid4().hex
+        session = {
+            "upload_id": upload_id,
+            "service": req.service,
+            "filename": req.filename,
+            "size": req.size,
+            "sha256": req.sha256,
+            "chunk_size": req.chunk_size,
+            "dir": os.path.join(MOCK_STORAGE_DIR, upload_id),
+            "parts": {}
+        }
+        os.makedirs(session["dir"], exist_ok=True)
+        _uploads[upload_id] = session
+    return {"upload_id": session["upload_id"], "received_parts": sorted(session["parts"])}
+
+
+@app.get("/uploads/{upload_id}")
+def get_upload(upload_id: str):
+    session = _uploads.get(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    return {"upload_id": upload_id, "size": session["size"], "received_parts": sorted(session["parts"])}
+
+
+@app.put("/uploads/{upload_id}/parts/{index}")
+async def put_part(upload_id: str, index: int, request: Request):
+    session = _uploads.get(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    if MOCK_PART_FAILURE_RATE and random.random() < MOCK_PART_FAILURE_RATE:
+        _stats["part_failures"] += 1
+        raise HTTPException(status_code=503, detail="模拟的分片上传失败")
+    path = os.path.join(session["dir"], f"{index:08d}")
+    size = 0
+    with open(path, "wb") as f:
+        async for chunk in request.stream():
+            f.write(chunk)
+            size += len(chunk)
+    session["parts"][index] = size
+    _stats["parts"] += 1
+    _stats["bytes_received"] += size
+    return {"part": index, "size": size}
+
+
+@app.post("/uploads/{upload_id}/complete")
+def complete_upload(upload_id: str):
+    """按顺序合并分片并校验大小和哈希"""
+    session = _uploads.get(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    parts_total = max(1, -(-session["size"] // session["chunk_size"]))
+    missing = [i for i in range(parts_total) if i not in session["parts"]]
+    if missing:
+        raise HTTPException(status_code=409, detail=f"缺少分片: {missing}")
+
+    path = os.path.join(MOCK_STORAGE_DIR, uuid.uuid4().hex)
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "wb") as out:
+        for i in range(parts_total):
+            part_path = os.path.join(session["dir"], f"{i:08d}")
+            with open(part_path, "rb") as part:
+                for chunk in iter(lambda: part.read(1024 * 1024), b""):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            os.remove(part_path)
+    os.rmdir(session["dir"])
+    del _uploads[upload_id]
+
+    if size != session["size"] or digest.hexdigest() != session["sha256"]:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail="合并后的文件大小或 sha256 不匹配")
+    return _public(_register_file(session["service"], session["sha256"], path, size))
+
+
+@app.post("/dingtalk/robot/send")
+def dingtalk_send(payload: Dict[str, Any]):
+    """模拟钉钉机器人的限流行为"""
+    now = time.time()
+    _dingtalk_sent_at[:] = [t for t in _dingtalk_sent_at if now - t < 60]
+    if len(_dingtalk_sent_at) >= 20:
+        _stats["dingtalk_throttled"] += 1
+        return {"errcode": 130101, "errmsg": "send too fast, exceed 20 times per minute"}
+    _dingtalk_sent_at.append(now)
+    _dingtalk_messages.append(payload)
+    _stats["dingtalk_messages"] += 1
+    return {"errcode": 0, "errmsg": "ok"}
+
+
+@app.get("/dingtalk/messages")
+def dingtalk_messages(limit: int = 50):
+    return {"messages": _dingtalk_messages[-limit:]}
+
+
+def _deployment_status(deployment: Dict[str, Any]) -> Dict[str, Any]:
+    """queued -> running（依次经过各阶段）-> succeeded / failed"""
+    elapsed = time.time() - deployment["submitted_at"]
+    duration = deployment["duration"]
+    info = {k: deployment[k] for k in ("deployment_id", "environment", "project", "version")}
+    if elapsed < duration * 0.1:
+        return dict(info, status="queued", stage=None, progress=0)
+    if elapsed < duration:
+        fraction = (elapsed - duration * 0.1) / (duration * 0.9)
+        stage = DEPLOY_STAGES[min(int(fraction * len(DEPLOY_STAGES)), len(DEPLOY_STAGES) - 1)]
+        if deployment["fail"] and stage == "health_check":
+            return dict(info, status="failed", stage=stage, progress=int(fraction * 100),
+                        error="健康检查失败")
+        return dict(info, status="running", stage=stage, progress=int(fraction * 100))
+    if deployment["fail"]:
+        return dict(info, status="failed", stage="health_check", progress=100, error="健康检查失败")
+    return dict(info, status="succeeded", stage=None, progress=100,
+                finished_at=deployment["submitted_at"] + duration)
+
+
+@app.post("/deploy")
+def deploy(payload: Dict[str, Any]):
+    deployment_id = uuid.uuid4().hex
+    config = payload.get("config") or {}
+    _deployments[deployment_id] = {
+        "deployment_id": deployment_id,
+        "environment": payload.get("environment"),
+        "project": payload.get("project"),
+        "version": payload.get("version"),
+        "submitted_at": time.time(),
+        "duration": float(config.get("duration", MOCK_DEPLOY_DURATION)),
+        "fail": bool(config.get("fail")) or random.random() < MOCK_DEPLOY_FAILURE_RATE
+    }
+    _stats["deployments"] += 1
+    return {"deployment_id": deployment_id, "status": "queued"}
+
+
+@app.get("/deployments/{deployment_id}")
+async def deployment_status(deployment_id: str, wait: float = 0):
+    """wait > 0 时挂起请求，直到状态变化或等待超时"""
+    if not MOCK_DEPLOY_STATUS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    deployment = _deployments.get(deployment_id)
+    if deployment is None:
+        raise HTTPException(status_code=404, detail="部署不存在")
+    _stats["deployment_polls"] += 1
+    status = _deployment_status(deployment)
+    deadline = time.time() + (min(wait, 60) if MOCK_DEPLOY_LONG_POLL else 0)
+    while time.time() < deadline and status["status"] in ("queued", "running"):
+        await asyncio.sleep(0.2)
+        current = _deployment_status(deployment)
+        if (current["status"], current["stage"]) != (status["status"], status["stage"]):
+            return current
+    return status
+
+
+@app.get("/stats")
+def stats():
+    return {**_stats, "files": len(_files), "pending_uploads": len(_uploads)}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("MOCK_PORT", "9000")))
@@ -0,0 +1,160 @@
+# parse_cache.py
+"""
+工作流解析缓存
+以归一化查询和可用动作定义为键缓存大模型的解析结果，避免重复调用 DeepSeek
+"""
+
+import os
+import copy
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+from dotenv import load_dotenv
+from cache_utils import TTLCache, SQLiteCacheStore, SingleFlight, normalize_query, stable_hash
+
+# 加载环境变量
+load_dotenv()
+
+WORKFLOW_CACHE_ENABLED = os.getenv("WORKFLOW_CACHE_ENABLED", "true").lower() == "true"
+WORKFLOW_CACHE_SIZE = int(os.getenv("WORKFLOW_CACHE_SIZE", "512"))
+WORKFLOW_CACHE_TTL = float(os.getenv("WORKFLOW_CACHE_TTL", "86400"))
+# 持久化缓存文件路径，为空时只使用内存缓存
+WORKFLOW_CACHE_DB = os.getenv("WORKFLOW_CACHE_DB", "")
+
+
+class WorkflowParseCache:
+    """工作流解析缓存（内存 LRU + 可选 SQLite 持久层 + single-flight）"""
+
+    def __init__(self, maxsize: int = WORKFLOW_CACHE_SIZE,
+                 ttl: float = WORKFLOW_CACHE_TTL,
+                 db_path: Optional[str] = None,
+                 enabled: bool = WORKFLOW_CACHE_ENABLED):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        db_path = WORKFLOW_CACHE_DB if db_path is None else db_path
+        self.disk: Optional[SQLiteCacheStore] = None
+        if db_path:
+            try:
+                self.disk = SQLiteCacheStore(db_path, table="workflow_parse_cache")
+            except Exception as e:
+                print(f"工作流解析缓存持久层初始化失败，仅使用内存缓存: {str(e)}")
+        self._single_flight = SingleFlight()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    @staticmethod
+    def make_key(natural_language: str, actions: Dict[str, Any]) -> str:
+        """
+        缓存键：归一化查询 + 可用动作定义的哈希。
+        查询中的项目名、路径等会原样进入解析出的参数，键保留大小写，不同大小写的查询不共用结果
+        """
+        return stable_hash(stable_hash(actions), normalize_query(natural_language, casefold=False))
+
+    async def _disk_get(self, key: str) -> Any:
+        if self.disk is None:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, self.disk.get, key)
+        except Exception as e:
+            print(f"读取工作流解析缓存失败: {str(e)}")
+            return None
+
+    async def _disk_set(self, key: str, workflow: Dict[str, Any]) -> None:
+        if self.disk is None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.disk.set, key, workflow, self.ttl)
+        except Exception as e:
+            print(f"写入工作流解析缓存失败: {str(e)}")
+
+    async def get(self, natural_language: str, actions: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """只查缓存，不触发解析"""
+        if not self.enabled:
+            return None
+        key = self.make_key(natural_language, actions)
+        workflow = self.memory.get(key)
+        if workflow is None:
+            workflow = await self._disk_get(key)
+            if workflow is None:
+                return None
+            self.memory.set(key, workflow)
+            self.disk_hits += 1
+        else:
+            self.hits += 1
+        return copy.deepcopy(workflow)
+
+    async def put(self, natural_language: str, actions: Dict[str, Any], workflow: Dict[str, Any]) -> None:
+        """写入成功解析的工作流，失败结果不缓存"""
+        if not self.enabled or workflow.get("error"):
+            return
+        key = self.make_key(natural_language, actions)
+        workflow = copy.deepcopy(workflow)
+        self.memory.set(key, workflow)
+        await self._disk_set(key, workflow)
+
+    async def get_or_parse(self, natural_language: str, actions: Dict[str, Any],
+                           parse: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        优先返回缓存结果；未命中时调用 parse，相同查询的并发请求只解析一次
+        """
+        if not self.enabled:
+            return await parse()
+
+        cached = await self.get(natural_language, actions)
+        if cached is not None:
+            return cached
+
+        key = self.make_key(natural_language, actions)
+
+        async def _parse_and_store() -> Dict[str, Any]:
+            self.misses += 1
+            workflow = await parse()
+            if workflow.get("error"):
+                self.failures += 1
+            else:
+                await self.put(natural_language, actions, workflow)
+            return workflow
+
+        workflow, _ = await self._single_flight.do(key, _parse_and_store)
+        return copy.deepcopy(workflow)
+
+    def invalidate(self, natural_language: str, actions: Dict[str, Any]) -> None:
+        """删除单条缓存"""
+        key = self.make_key(natural_language, actions)
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def clear(self) -> None:
+        """清空全部缓存"""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中率统计"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self._single_flight.coalesced,
+            "failures": self.failures,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "size": len(self.memory),
+            "evictions": self.memory.evictions,
+            "persistent": self.disk is not None
+        }
+
+
+# 全局缓存实例
+_parse_cache = WorkflowParseCache()
+
+def get_parse_cache() -> WorkflowParseCache:
+    """获取全局工作流解析缓存"""
+    return _parse_cache
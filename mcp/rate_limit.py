@@ -0,0 +1,157 @@
+# rate_limit.py
+"""
+限流与调度原语
+按优先级发放令牌的令牌桶限速器和按优先级唤醒的信号量
+"""
+
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
+
+def parse_rate(spec: str) -> Tuple[float, float]:
+    """解析 "20/60" 格式的速率（20 次 / 60 秒），返回 (每秒令牌数, 桶容量)"""
+    count, _, period = spec.partition("/")
+    count = float(count)
+    period = float(period) if period else 1.0
+    if count <= 0 or period <= 0:
+        raise ValueError(f"无效的速率配置: {spec}")
+    return count / period, count
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """解析 "action=20/60,action=5/1" 格式的限速配置"""
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, rate = item.split("=", 1)
+        try:
+            limits[name.strip()] = parse_rate(rate.strip())
+        except ValueError:
+            print(f"忽略无效的限速配置: {item}")
+    return limits
+
+
+class TokenBucket:
+    """令牌桶限速器，等待者按 priority 从高到低获得令牌，同优先级先到先得"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        # 等待者堆：(-priority, 到达序号, 唤醒事件)，只有堆顶的等待者会取令牌
+        self._waiters: List[Tuple[int, int, asyncio.Event]] = []
+        self._counter = itertools.count()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """不等待地尝试获取令牌"""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def delay_until_available(self, tokens: float = 1) -> float:
+        """距离有足够令牌还需等待的秒数"""
+        self._refill()
+        if self._tokens >= tokens:
+            return 0.0
+        return (tokens - self._tokens) / self.rate
+
+    def _wake_head(self) -> None:
+        if self._waiters:
+            self._waiters[0][2].set()
+
+    async def acquire(self, tokens: float = 1, priority: int = 0) -> float:
+        """获取令牌，必要时等待，返回等待的秒数"""
+        start = time.monotonic()
+        if not self._waiters and self.try_acquire(tokens):
+            return 0.0
+        waiter = (-priority, next(self._counter), asyncio.Event())
+        heapq.heappush(self._waiters, waiter)
+        try:
+            while True:
+                event = waiter[2]
+                if self._waiters[0] is waiter:
+                    if self.try_acquire(tokens):
+                        break
+                    # 等到令牌补足；期间有更高优先级的等待者到达时，醒来后让出堆顶
+                    event.clear()
+                    try:
+                        await asyncio.wait_for(event.wait(), self.delay_until_available(tokens))
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    event.clear()
+                    await event.wait()
+        finally:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            self._wake_head()
+        return time.monotonic() - start
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+
+class PrioritySemaphore:
+    """优先级信号量：名额释放时优先唤醒 priority 最高的等待者，同优先级先到先得"""
+
+    def __init__(self, value: int):
+        self.limit = value
+        self._value = value
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    @property
+    def in_use(self) -> int:
+        return self.limit - self._value
+
+    @property
+    def waiting(self) -> int:
+        return len([w for w in self._waiters if not w[2].done()])
+
+    async def acquire(self, priority: int = 0) -> None:
+        if self._value > 0 and not self.waiting:
+            self._value -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (-priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已经分配到名额但调用方被取消，交还给下一个等待者
+                self.release()
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: int = 0):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
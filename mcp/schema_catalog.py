@@ -0,0 +1,165 @@
+# schema_catalog.py
+"""
+表结构目录
+启动时用每种数据库一条批量查询加载所有已配置表的字段，之后从内存读取；
+超过 TTL 后在下次访问时重新加载，数据库迁移后可调用 invalidate() 立即失效。
+加载时同时读取库中的表名列表，只有实际存在的表才会加入加载范围，
+查询不存在的表直接返回空列表，不会触发重新加载。
+version 是表结构内容的哈希，依赖表结构的缓存（例如 SQL 翻译缓存）可以把它放进缓存键。
+"""
+
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+from dotenv import load_dotenv
+from sqlalchemy import bindparam, text
+from cache_utils import SingleFlight, stable_hash
+from database_config import TABLE_CONFIGS
+from db_engines import EngineRegistry, get_engine_registry
+
+# 加载环境变量
+load_dotenv()
+
+# 表结构在内存中的有效期（秒），0 表示只在 invalidate() 后重新加载
+SCHEMA_CATALOG_TTL = float(os.getenv("SCHEMA_CATALOG_TTL", "600"))
+
+# 每种数据库的批量字段查询，表名通过绑定参数传入
+SCHEMA_QUERIES = {
+    "postgresql": """
+        SELECT table_name, column_name, data_type, is_nullable, column_default
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name IN :tables
+        ORDER BY table_name, ordinal_position
+    """,
+    "mysql": """
+        SELECT table_name AS table_name, column_name AS column_name, column_type AS data_type,
+               is_nullable AS is_nullable, column_default AS column_default
+        FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name IN :tables
+        ORDER BY table_name, ordinal_position
+    """,
+    "sqlite": """
+        SELECT m.name AS table_name, p.name AS column_name, p.type AS data_type,
+               CASE WHEN p."notnull" THEN 'NO' ELSE 'YES' END AS is_nullable,
+               p.dflt_value AS column_default
+        FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+        WHERE m.type IN ('table', 'view') AND m.name IN :tables
+        ORDER BY m.name, p.cid
+    """,
+}
+
+# 每种数据库的表名列表查询
+TABLE_LIST_QUERIES = {
+    "postgresql": "SELECT table_name FROM information_schema.tables WHERE table_schema = current_schema()",
+    "mysql": "SELECT table_name AS table_name FROM information_schema.tables WHERE table_schema = DATABASE()",
+    "sqlite": "SELECT name AS table_name FROM sqlite_master WHERE type IN ('table', 'view')",
+}
+
+
+class SchemaCatalog:
+    """按数据库缓存的表结构"""
+
+    def __init__(self, dsn: str, db_type: str,
+                 tables: Optional[Iterable[str]] = None,
+                 ttl: float = SCHEMA_CATALOG_TTL,
+                 registry: Optional[EngineRegistry] = None):
+        if db_type not in SCHEMA_QUERIES:
+            raise ValueError(f"不支持的数据库类型: {db_type}")
+        self.dsn = dsn
+        self.db_type = db_type
+        self.ttl = ttl
+        self.registry = registry or get_engine_registry()
+        # 需要加载的表：已配置的表和访问过的、库中实际存在的表
+        self._tracked = set(tables if tables is not None else TABLE_CONFIGS)
+        # 上次加载时库中存在的表
+        self._existing: Set[str] = set()
+        self._columns: Dict[str, List[Dict[str, Any]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._flight = SingleFlight()
+        self.version: Optional[str] = None
+        self.loads = 0
+        self.hits = 0
+        self.unknown = 0
+
+    def _stale(self) -> bool:
+        if self._loaded_at is None:
+            return True
+        return bool(self.ttl) and time.monotonic() - self._loaded_at >= self.ttl
+
+    async def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        tables = sorted(self._tracked)
+        statement = text(SCHEMA_QUERIES[self.db_type]).bindparams(bindparam("tables", expanding=True))
+        columns: Dict[str, List[Dict[str, Any]]] = {name: [] for name in tables}
+        async with self.registry.begin(self.dsn) as conn:
+            existing = await conn.execute(text(TABLE_LIST_QUERIES[self.db_type]))
+            self._existing = {row["table_name"] for row in existing.mappings()}
+            result = await conn.execute(statement, {"tables": tables})
+            for row in result.mappings():
+                columns.setdefault(row["table_name"], []).append({
+                    "name": row["column_name"],
+                    "type": row["data_type"],
+                    "nullable": str(row["is_nullable"]).upper() != "NO",
+                    "default": row["column_default"],
+                })
+        self._columns = columns
+        self._loaded_at = time.monotonic()
+        # 只按实际存在的表计算版本，查询不存在的表不会改变版本
+        self.version = stable_hash(self.db_type, {name: cols for name, cols in columns.items() if cols})[:16]
+        self.loads += 1
+        return columns
+
+    async def load(self) -> Dict[str, List[Dict[str, Any]]]:
+        """重新加载所有表的字段（并发调用只查询一次）"""
+        columns, _ = await self._flight.do("load", self._load)
+        return columns
+
+    async def get_columns(self, table_name: str) -> List[Dict[str, Any]]:
+        """表的字段列表，表不存在时返回空列表"""
+        if self._stale():
+            await self.load()
+        elif table_name in self._tracked:
+            self.hits += 1
+        if table_name not in self._tracked:
+            if table_name not in self._existing:
+                # 库中没有这张表（例如从问题中猜测的表名），不加入加载范围
+                self.unknown += 1
+                return []
+            self._tracked.add(table_name)
+            await self.load()
+        return self._columns.get(table_name, [])
+
+    async def get_version(self) -> str:
+        if self._stale():
+            await self.load()
+        return self.version
+
+    async def describe(self, table_name: str) -> str:
+        """格式化的表结构，用于 SQL 生成的提示词"""
+        columns = await self.get_columns(table_name)
+        if not columns:
+            return ""
+        lines = [f"表名: {table_name}"]
+        for column in columns:
+            lines.append(f"- {column['name']}: {column['type']} {'NULL' if column['nullable'] else 'NOT NULL'}")
+        return "\n".join(lines) + "\n"
+
+    def invalidate(self, table_name: Optional[str] = None) -> None:
+        """
+        让表结构在下次访问时重新加载（例如数据库迁移之后）；
+        重新加载时刷新表名列表，迁移新增的表在下次访问时加入加载范围
+        """
+        self._loaded_at = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "db_type": self.db_type,
+            "version": self.version,
+            "tables": len(self._tracked),
+            "loaded_tables": sum(1 for cols in self._columns.values() if cols),
+            "existing_tables": len(self._existing),
+            "unknown_lookups": self.unknown,
+            "loads": self.loads,
+            "hits": self.hits,
+            "age": time.monotonic() - self._loaded_at if self._loaded_at is not None else None,
+            "ttl": self.ttl,
+        }
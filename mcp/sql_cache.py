@@ -0,0 +1,148 @@
+# sql_cache.py
+"""
+自然语言到 SQL 的翻译缓存
+以归一化问题、数据库类型、表名和表结构版本为键缓存生成的 SQL，避免重复调用 DeepSeek。
+生成的 SQL 只有在成功执行过之后才写入缓存；缓存的 SQL 执行失败时删除对应条目。
+"""
+
+import os
+import copy
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from cache_utils import TTLCache, SQLiteCacheStore, SingleFlight, normalize_query, stable_hash
+
+# 加载环境变量
+load_dotenv()
+
+SQL_CACHE_ENABLED = os.getenv("SQL_CACHE_ENABLED", "true").lower() == "true"
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "1024"))
+SQL_CACHE_TTL = float(os.getenv("SQL_CACHE_TTL", "86400"))
+# 持久化缓存文件路径，为空时只使用内存缓存
+SQL_CACHE_DB = os.getenv("SQL_CACHE_DB", "")
+
+# 由模型选择表时键中的表名
+AUTO_TABLE = "*"
+
+
+class SQLTranslationCache:
+    """SQL 翻译缓存（内存 LRU + 可选 SQLite 持久层 + single-flight）"""
+
+    def __init__(self, maxsize: int = SQL_CACHE_SIZE,
+                 ttl: float = SQL_CACHE_TTL,
+                 db_path: Optional[str] = None,
+                 enabled: bool = SQL_CACHE_ENABLED):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        db_path = SQL_CACHE_DB if db_path is None else db_path
+        self.disk: Optional[SQLiteCacheStore] = None
+        if db_path:
+            try:
+                self.disk = SQLiteCacheStore(db_path, table="sql_translation_cache")
+            except Exception as e:
+                print(f"SQL 翻译缓存持久层初始化失败，仅使用内存缓存: {str(e)}")
+        self._single_flight = SingleFlight()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(natural_language: str, db_type: str, table_name: Optional[str],
+                 schema_version: Optional[str]) -> str:
+        """缓存键：归一化问题 + 数据库类型 + 表名 + 表结构版本"""
+        return stable_hash(normalize_query(natural_language), db_type, table_name or AUTO_TABLE, schema_version)
+
+    async def _disk_call(self, func: Callable, *args) -> Any:
+        if self.disk is None:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, func, *args)
+        except Exception as e:
+            print(f"访问 SQL 翻译缓存持久层失败: {str(e)}")
+            return None
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """只查缓存，条目为 {"table_name": ..., "sql": ...}"""
+        if not self.enabled:
+            return None
+        entry = self.memory.get(key)
+        if entry is None:
+            entry = await self._disk_call(self.disk.get, key) if self.disk is not None else None
+            if entry is None:
+                return None
+            self.memory.set(key, entry)
+            self.disk_hits += 1
+        else:
+            self.hits += 1
+        return copy.deepcopy(entry)
+
+    async def put(self, key: str, entry: Dict[str, Any]) -> None:
+        """写入执行成功的 SQL"""
+        # 合并到同一次生成的并发请求只需写入一次
+        if not self.enabled or not entry.get("sql") or key in self.memory:
+            return
+        entry = copy.deepcopy(entry)
+        self.memory.set(key, entry)
+        self.stores += 1
+        if self.disk is not None:
+            await self._disk_call(self.disk.set, key, entry, self.ttl)
+
+    async def invalidate(self, key: str) -> None:
+        """删除单条缓存（缓存的 SQL 执行失败时调用）"""
+        if self.memory.delete(key):
+            self.evictions += 1
+        if self.disk is not None:
+            await self._disk_call(self.disk.delete, key)
+
+    async def translate(self, key: str,
+                        generate: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """
+        返回 (条目, 是否来自缓存)；未命中时调用 generate，相同问题的并发请求只生成一次。
+        生成结果不在这里写入，调用方执行成功后再调用 put
+        """
+        if not self.enabled:
+            return await generate(), False
+        cached = await self.get(key)
+        if cached is not None:
+            return cached, True
+
+        async def _generate() -> Dict[str, Any]:
+            self.misses += 1
+            return await generate()
+
+        entry, _ = await self._single_flight.do(key, _generate)
+        return copy.deepcopy(entry), False
+
+    def clear(self) -> None:
+        """清空全部缓存"""
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """命中率统计"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self._single_flight.coalesced,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "size": len(self.memory),
+            "persistent": self.disk is not None
+        }
+
+
+# 全局缓存实例
+_sql_cache = SQLTranslationCache()
+
+def get_sql_cache() -> SQLTranslationCache:
+    """获取全局 SQL 翻译缓存"""
+    return _sql_cache
@@ -0,0 +1,161 @@
+# sql_rules.py
+"""
+基于规则的自然语言转 SQL
+「统计<时间范围><表>数量」「查询<时间范围>的<表>」「<字段>最高的前 N 个<表>」这类问题
+用表关键词映射、时间表达式解析和表配置中的时间字段直接生成 SQL，
+只有规则无法完整覆盖整个问题时才交给大模型。
+时间范围作为绑定参数传入，同一类问题生成的 SQL 文本相同
+"""
+
+import os
+import re
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from dotenv import load_dotenv
+from database_config import NATURAL_LANGUAGE_TABLE_MAPPING, TABLE_CONFIGS, TableConfig
+from time_ranges import TimeRange, find_time_ranges, parse_number
+
+# 加载环境变量
+load_dotenv()
+
+SQL_RULES_ENABLED = os.getenv("SQL_RULES_ENABLED", "true").lower() == "true"
+# 列表查询默认返回的最大行数
+SQL_RULES_LIST_LIMIT = int(os.getenv("SQL_RULES_LIST_LIMIT", "1000"))
+
+_NUMBER = r"\d+|[一二两三四五六七八九十百]+"
+
+COUNT_RE = re.compile(r"统计|多少|数量|总数|总量|几个|几条|计数|count", re.IGNORECASE)
+LIST_RE = re.compile(r"查询|列出|查看|显示|获取|找出|查一下|看看|查")
+# 最新/最早的 N 条
+LATEST_RE = re.compile(rf"(?:前)?(?P<order>最新|最近|最早)的?(?:前)?(?P<n>{_NUMBER})(?:个|条|名|位|笔)?")
+# <字段>最高/最低的前 N 个
+SUPERLATIVE_RE = re.compile(rf"(?:按)?(?P<field>[^\s,的]+?)(?P<order>最高|最大|最多|最低|最小|最少)的?(?:前)?(?P<n>{_NUMBER})(?:个|条|名|位|笔)?")
+# 不影响查询含义的词
+FILLER_RE = re.compile(r"请|帮我|帮忙|给我|一下|新增|新|注册|创建|产生|的|有|是|了|共|一共|总共|所有|全部|"
+                       r"在|之内|以内|以来|期间|内|里|中|为|吗|呢|数据|记录|信息|列表|个|条|名|位|笔|[\s,.?!:]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# 规则命中统计
+_stats = {"matches": 0, "declined": 0}
+
+
+def _prepare(text: str) -> str:
+    text = unicodedata.normalize("NFKC", text or "")
+    text = text.replace("。", ".").replace("、", ",")
+    return _WHITESPACE_RE.sub(" ", text).strip().rstrip(".!?")
+
+
+def _take(text: str, phrase: str) -> str:
+    """从文本中移除一次短语，用空格占位避免前后文字拼接成新词"""
+    return text.replace(phrase, " ", 1)
+
+
+def _match_table(text: str, table_name: Optional[str]) -> Tuple[Optional[str], str]:
+    """按最长关键词匹配表；出现多个不同的表时返回 None"""
+    keywords = dict(NATURAL_LANGUAGE_TABLE_MAPPING)
+    for name in TABLE_CONFIGS:
+        keywords.setdefault(name, name)
+    found = set()
+    for keyword in sorted(keywords, key=len, reverse=True):
+        while keyword in text:
+            found.add(keywords[keyword])
+            text = _take(text, keyword)
+    if table_name is not None:
+        found.add(table_name)
+    if len(found) != 1:
+        return None, text
+    return found.pop(), text
+
+
+def _match_time(text: str, now: Optional[datetime]) -> Tuple[Optional[TimeRange], str, bool]:
+    """匹配最多一个时间范围，返回 (时间范围, 剩余文本, 是否有歧义)"""
+    ranges = find_time_ranges(text, now)
+    if len(ranges) > 1:
+        return None, text, True
+    if not ranges:
+        return None, text, False
+    start, end = ranges[0].span
+    return ranges[0], text[:start] + " " + text[end:], False
+
+
+def _match_field(phrase: str, config: TableConfig) -> Optional[str]:
+    """
+    字段名或完整的字段描述 -> 字段名；部分匹配（如「ID」同时是「订单ID」「用户ID」的后缀）
+    有歧义，返回 None 交给大模型
+    """
+    if phrase in config.fields:
+        return phrase
+    for name, description in config.fields.items():
+        if phrase == description:
+            return name
+    return None
+
+
+def compile_sql(natural_language: str, db_type: str, table_name: Optional[str] = None,
+                now: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """
+    用规则把问题编译为 SQL，返回 {"table_name", "sql", "params", "intent", "source"}；
+    问题中有规则无法解释的内容时返回 None
+    """
+    if not SQL_RULES_ENABLED:
+        return None
+    text = _prepare(natural_language)
+    # 「订单数量」这类表关键词本身带有计数含义，先在原文上判断
+    is_count = COUNT_RE.search(text) is not None
+    table_name, text = _match_table(text, table_name)
+    config = TABLE_CONFIGS.get(table_name) if table_name else None
+    if config is None:
+        _stats["declined"] += 1
+        return None
+
+    time_range, text, ambiguous = _match_time(text, now)
+    if ambiguous:
+        _stats["declined"] += 1
+        return None
+
+    order_by = None
+    limit = None
+    ranked = SUPERLATIVE_RE.search(text) or LATEST_RE.search(text)
+    if ranked is not None:
+        limit = parse_number(ranked.group("n"))
+        if "field" in ranked.groupdict():
+            field = _match_field(ranked.group("field"), config)
+            descending = ranked.group("order") in ("最高", "最大", "最多")
+        else:
+            field = config.time_field
+            descending = ranked.group("order") != "最早"
+        if not limit or field is None:
+            _stats["declined"] += 1
+            return None
+        order_by = f"{field} {'DESC' if descending else 'ASC'}"
+        text = _take(text, ranked.group(0))
+
+    text = COUNT_RE.sub(" ", text)
+    is_list = LIST_RE.search(text) is not None
+    text = LIST_RE.sub(" ", text)
+    # 剩余内容必须都是无关紧要的词
+    if FILLER_RE.sub("", text) or (is_count and ranked is not None) or not (is_count or is_list or ranked):
+        _stats["declined"] += 1
+        return None
+
+    where = f" WHERE {time_range.condition(config.time_field)}" if time_range else ""
+    params = time_range.to_params(db_type) if time_range else {}
+    if is_count:
+        intent = "count"
+        sql = f"SELECT COUNT(*) AS count FROM {config.table_name}{where}"
+    elif ranked is not None:
+        intent = "top_n"
+        sql = f"SELECT * FROM {config.table_name}{where} ORDER BY {order_by} LIMIT {limit}"
+    else:
+        intent = "list"
+        sql = (f"SELECT * FROM {config.table_name}{where} "
+               f"ORDER BY {config.time_field} DESC LIMIT {SQL_RULES_LIST_LIMIT}")
+
+    _stats["matches"] += 1
+    return {"table_name": config.table_name, "sql": sql, "params": params, "intent": intent, "source": "rules"}
+
+
+def get_sql_rule_stats() -> Dict[str, Any]:
+    """规则编译统计"""
+    return {"enabled": SQL_RULES_ENABLED, **_stats}
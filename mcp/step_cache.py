@@ -0,0 +1,190 @@
+# step_cache.py
+"""
+步骤结果缓存
+幂等动作（重复上传同一文件、重复查询同一接口等）的结果按 (动作, 解析后参数) 缓存，
+只有声明了缓存策略的动作才会被缓存，并发的相同调用合并为一次
+"""
+
+import os
+import copy
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from cache_utils import TTLCache, SingleFlight, cached_file_sha256, stable_hash
+
+# 加载环境变量
+load_dotenv()
+
+STEP_CACHE_ENABLED = os.getenv("STEP_CACHE_ENABLED", "true").lower() == "true"
+STEP_CACHE_SIZE = int(os.getenv("STEP_CACHE_SIZE", "512"))
+# 覆盖默认 TTL，格式 "action=秒数,action=秒数"，秒数为 0 表示不缓存该动作
+STEP_CACHE_TTLS = os.getenv("STEP_CACHE_TTLS", "")
+
+
+# 可缓存的动作：TTL（秒）和可选的参数条件，未列出的动作从不缓存。
+# api_call 不在此列，其 GET 响应由 http_cache 按服务端的缓存头处理
+ACTION_CACHE_POLICIES: Dict[str, Dict[str, Any]] = {
+    "upload_file": {"ttl": 3600},
+    "web_search": {"ttl": 300},
+}
+
+
+def _parse_ttls(spec: str) -> Dict[str, float]:
+    """解析 "action=ttl,action=ttl" 格式的 TTL 配置"""
+    ttls = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        action, ttl = item.split("=", 1)
+        try:
+            ttls[action.strip()] = float(ttl)
+        except ValueError:
+            print(f"忽略无效的步骤缓存配置: {item}")
+    return ttls
+
+
+class StepResultCache:
+    """步骤结果缓存（内存 LRU + single-flight）"""
+
+    def __init__(self, maxsize: int = STEP_CACHE_SIZE,
+                 policies: Optional[Dict[str, Dict[str, Any]]] = None,
+                 enabled: bool = STEP_CACHE_ENABLED):
+        self.enabled = enabled
+        self.policies = copy.deepcopy(policies if policies is not None else ACTION_CACHE_POLICIES)
+        for action, ttl in _parse_ttls(STEP_CACHE_TTLS).items():
+            self.policies.setdefault(action, {})["ttl"] = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=None)
+        self._single_flight = SingleFlight()
+        # 合并到同一次调用的各个调用方的进度回调
+        self._listeners: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def policy_for(self, action: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """动作在这组参数下的缓存策略，不可缓存时返回 None"""
+        if not self.enabled:
+            return None
+        policy = self.policies.get(action)
+        if not policy or not policy.get("ttl"):
+            return None
+        condition = policy.get("condition")
+        if condition is not None and not condition(params):
+            return None
+        return policy
+
+    async def make_key(self, action: str, params: Dict[str, Any]) -> Optional[str]:
+        """
+        缓存键：动作 + 解析后参数；上传文件时加入文件内容的哈希，文件变化后不会命中旧结果
+        """
+        if action == "upload_file":
+            file_path = params.get("file_path")
+            if not file_path or not os.path.isfile(file_path):
+                return None
+            loop = asyncio.get_running_loop()
+            digest = await loop.run_in_executor(None, cached_file_sha256, file_path)
+            return f"{action}:{stable_hash(action, params, digest)}"
+        return f"{action}:{stable_hash(action, params)}"
+
+    def _info(self, key: str, action: str, policy: Dict[str, Any], hit: bool) -> Dict[str, Any]:
+        return {"key": key[:len(action) + 17], "ttl": policy["ttl"], "hit": hit, "shared": False}
+
+    async def lookup(self, action: str, params: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """只查缓存，命中时返回 (结果, 缓存信息)，用于在排队限速之前短路"""
+        policy = self.policy_for(action, params)
+        if policy is None:
+            return None
+        key = await self.make_key(action, params)
+        if key is None:
+            return None
+        cached = self.memory.get(key)
+        if cached is None:
+            return None
+        self.hits += 1
+        return copy.deepcopy(cached), self._info(key, action, policy, hit=True)
+
+    def _broadcast(self, key: str, event: Dict[str, Any]) -> None:
+        for listener in list(self._listeners.get(key, ())):
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"进度回调失败: {str(e)}")
+
+    async def execute(self, action: str, params: Dict[str, Any],
+                      call: Callable[[Optional[Callable[[Dict[str, Any]], None]]], Awaitable[Dict[str, Any]]],
+                      bypass: bool = False,
+                      progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        执行动作，可缓存时优先返回缓存结果。call 接收进度回调。
+        返回 (结果, 缓存信息)，动作不可缓存时缓存信息为 None。
+        bypass 为 True 时跳过读取缓存，但成功的结果仍会刷新缓存。
+        合并到同一次调用的每个调用方都会收到进度事件。
+        """
+        policy = self.policy_for(action, params)
+        if policy is None:
+            return await call(progress), None
+        key = await self.make_key(action, params)
+        if key is None:
+            return await call(progress), None
+
+        info = self._info(key, action, policy, hit=False)
+        if bypass:
+            self.bypassed += 1
+            info["bypass"] = True
+        else:
+            cached = self.memory.get(key)
+            if cached is not None:
+                self.hits += 1
+                info["hit"] = True
+                return copy.deepcopy(cached), info
+
+        async def _call_and_store() -> Dict[str, Any]:
+            self.misses += 1
+            result = await call(lambda event: self._broadcast(key, event))
+            if result.get("status", "success") == "success":
+                self.memory.set(key, copy.deepcopy(result), ttl=policy["ttl"])
+            return result
+
+        listeners = self._listeners.setdefault(key, [])
+        if progress is not None:
+            listeners.append(progress)
+        try:
+            result, shared = await self._single_flight.do(key, _call_and_store)
+        finally:
+            if progress is not None:
+                listeners.remove(progress)
+            if not listeners and self._listeners.get(key) is listeners:
+                del self._listeners[key]
+        info["shared"] = shared
+        return copy.deepcopy(result), info
+
+    def invalidate(self, action: Optional[str] = None) -> int:
+        """删除指定动作（为空时为全部）的缓存结果，返回删除数量"""
+        if action is None:
+            removed = len(self.memory)
+            self.memory.clear()
+            return removed
+        prefix = f"{action}:"
+        return len([key for key in self.memory.keys() if key.startswith(prefix) and self.memory.delete(key)])
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "policies": {action: policy.get("ttl") for action, policy in self.policies.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "coalesced": self._single_flight.coalesced,
+            "cancelled": self._single_flight.cancelled,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory": self.memory.get_stats()
+        }
+
+
+# 全局步骤结果缓存
+_step_cache = StepResultCache()
+
+def get_step_cache() -> StepResultCache:
+    """获取全局步骤结果缓存"""
+    return _step_cache
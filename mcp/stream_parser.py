@@ -0,0 +1,77 @@
+# stream_parser.py
+"""
+增量 JSON 解析
+在大模型流式输出工作流 JSON 的过程中，每当 "steps" 数组里的一个步骤对象闭合就立即产出
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+
+class IncrementalStepParser:
+    """从流式文本中逐个提取顶层 "steps" 数组中的步骤对象"""
+
+    def __init__(self, array_key: str = "steps"):
+        self.array_key = array_key
+        # 扫描状态
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start: Optional[int] = None
+        self._last_key: Optional[str] = None
+        self._in_steps = False
+        self._steps_depth = 0
+        self._item_start: Optional[int] = None
+        self._text = ""
+
+    @property
+    def text(self) -> str:
+        """目前收到的全部文本"""
+        return self._text
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """输入一段文本，返回本段中新闭合的步骤对象"""
+        steps = []
+        offset = len(self._text)
+        self._text += chunk
+        for i in range(offset, len(self._text)):
+            ch = self._text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    # 记录顶层对象中的最后一个字符串，用于识别 "steps" 键
+                    if len(self._stack) == 1 and self._stack[0] == "{":
+                        try:
+                            self._last_key = json.loads(self._text[self._string_start:i + 1])
+                        except ValueError:
+                            self._last_key = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if ch == "[" and len(self._stack) == 1 and self._last_key == self.array_key:
+                    self._in_steps = True
+                    self._steps_depth = len(self._stack) + 1
+                elif ch == "{" and self._in_steps and len(self._stack) == self._steps_depth:
+                    self._item_start = i
+                self._stack.append(ch)
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if ch == "}" and self._in_steps and self._item_start is not None \
+                        and len(self._stack) == self._steps_depth:
+                    steps.append(json.loads(self._text[self._item_start:i + 1]))
+                    self._item_start = None
+                elif ch == "]" and self._in_steps and len(self._stack) == self._steps_depth - 1:
+                    self._in_steps = False
+        return steps
+
+    def finish(self) -> Dict[str, Any]:
+        """流结束后解析完整 JSON"""
+        return json.loads(self._text)
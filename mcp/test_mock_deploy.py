@@ -0,0 +1,131 @@
+# test_mock_deploy.py
+"""
+deploy_to_environment 对模拟部署服务的测试：状态轮询、终止状态、超时、退避、长轮询和没有状态接口的服务
+"""
+
+import pytest
+
+import mcp_client
+import mock_services
+
+
+@pytest.fixture(autouse=True)
+def fast_polling(monkeypatch):
+    """缩短轮询间隔，部署时长由请求的 config.duration 控制"""
+    monkeypatch.setattr(mcp_client, "DEPLOY_POLL_INITIAL_DELAY", 0.02)
+    monkeypatch.setattr(mcp_client, "DEPLOY_POLL_MAX_DELAY", 0.1)
+    monkeypatch.setattr(mcp_client, "DEPLOY_POLL_BACKOFF", 2)
+    monkeypatch.setattr(mcp_client, "DEPLOY_LONG_POLL_WAIT", 0)
+    monkeypatch.setattr(mcp_client, "DEPLOY_TIMEOUT", 10)
+    monkeypatch.setattr(mock_services, "MOCK_DEPLOY_FAILURE_RATE", 0)
+
+
+def _deploy(run_with_client, config, events=None, **params):
+    def scenario(client):
+        return client.deploy_to_environment(
+            dict({"environment": "staging", "project_name": "demo", "version": "1.2.3", "config": config}, **params),
+            progress=None if events is None else events.append)
+    return run_with_client(scenario)
+
+
+def _count_polls(run_with_client, config, events=None, **params):
+    polls_before = mock_services._stats["deployment_polls"]
+    result = _deploy(run_with_client, config, events, **params)
+    return result, mock_services._stats["deployment_polls"] - polls_before
+
+
+def test_polls_until_succeeded(run_with_client):
+    events = []
+
+    result, polls = _count_polls(run_with_client, {"duration": 0.6}, events)
+
+    assert result["status"] == "success", result
+    assert result["deployment_status"] == "succeeded"
+    assert result["polls"] == polls > 1
+    states = [event["state"] for event in events]
+    assert states[0] == "queued"
+    assert "running" in states
+    assert states[-1] == "succeeded"
+    assert {event["stage"] for event in events} - {None} <= set(mock_services.DEPLOY_STAGES)
+    assert all(event["deployment_id"] == result["deployment_id"] for event in events)
+
+
+def test_failed_deployment_is_an_error(run_with_client):
+    events = []
+
+    result = _deploy(run_with_client, {"duration": 0.6, "fail": True}, events)
+
+    assert result["status"] == "error"
+    assert result["deployment_status"] == "failed"
+    assert result["error"] == "健康检查失败"
+    assert events[-1]["state"] == "failed"
+    assert events[-1]["stage"] == "health_check"
+
+
+def test_times_out_while_deployment_is_running(run_with_client, monkeypatch):
+    monkeypatch.setattr(mcp_client, "DEPLOY_TIMEOUT", 0.5)
+
+    result = _deploy(run_with_client, {"duration": 100})
+
+    assert result["status"] == "error"
+    assert "超时" in result["error"]
+
+
+def test_unchanged_status_backs_off(run_with_client, monkeypatch):
+    # 部署在前 10 秒一直处于 queued，状态不变时轮询间隔按 2 倍增长到 0.5 秒
+    monkeypatch.setattr(mcp_client, "DEPLOY_POLL_MAX_DELAY", 0.5)
+    monkeypatch.setattr(mcp_client, "DEPLOY_TIMEOUT", 1.5)
+
+    result, polls = _count_polls(run_with_client, {"duration": 100})
+
+    assert "超时" in result["error"]
+    # 固定 0.02 秒间隔约为 75 次；退避后为 0.02、0.04、0.08、0.16、0.32 再加每 0.5 秒一次
+    assert 4 <= polls <= 9
+
+
+def test_long_poll_needs_fewer_requests(run_with_client, monkeypatch):
+    _, short_polls = _count_polls(run_with_client, {"duration": 1.0})
+    monkeypatch.setattr(mcp_client, "DEPLOY_LONG_POLL_WAIT", 5)
+    events = []
+
+    result, long_polls = _count_polls(run_with_client, {"duration": 1.0}, events)
+
+    assert result["status"] == "success", result
+    assert result["polls"] == long_polls
+    # 服务端只在状态或阶段变化时返回：queued、四个阶段和 succeeded
+    assert long_polls <= len(mock_services.DEPLOY_STAGES) + 2
+    assert long_polls < short_polls
+
+
+def test_ignored_long_poll_still_backs_off(run_with_client, monkeypatch):
+    # 服务端忽略 ?wait 立即返回时，客户端不能无间隔地连续查询
+    monkeypatch.setattr(mock_services, "MOCK_DEPLOY_LONG_POLL", False)
+    monkeypatch.setattr(mcp_client, "DEPLOY_LONG_POLL_WAIT", 5)
+    monkeypatch.setattr(mcp_client, "DEPLOY_POLL_MAX_DELAY", 0.5)
+    monkeypatch.setattr(mcp_client, "DEPLOY_TIMEOUT", 1.5)
+
+    result, polls = _count_polls(run_with_client, {"duration": 100})
+
+    assert "超时" in result["error"]
+    assert polls <= 10
+
+
+def test_server_without_status_endpoint(run_with_client, monkeypatch):
+    monkeypatch.setattr(mock_services, "MOCK_DEPLOY_STATUS_ENABLED", False)
+
+    result, polls = _count_polls(run_with_client, {"duration": 100})
+
+    assert result["status"] == "success", result
+    assert result["tracked"] is False
+    assert result["deployment_status"] == "submitted"
+    assert result["deployment_id"]
+    assert polls == 0
+
+
+def test_wait_false_returns_after_submit(run_with_client):
+    result, polls = _count_polls(run_with_client, {"duration": 100}, wait=False)
+
+    assert result["status"] == "success"
+    assert result["deployment_status"] == "queued"
+    assert result["deployment_id"]
+    assert polls == 0
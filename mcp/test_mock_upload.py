@@ -0,0 +1,132 @@
+# test_mock_upload.py
+"""
+upload_file 对模拟上传服务的测试：multipart 流式上传、分片上传、分片重试、断点续传和内容去重
+"""
+
+import hashlib
+import math
+
+import pytest
+
+import mcp_client
+import mock_services
+
+CHUNK_SIZE = 16 * 1024
+THRESHOLD = 64 * 1024
+
+
+@pytest.fixture(autouse=True)
+def small_parts(monkeypatch):
+    """用较小的分片和阈值，让测试文件保持在几百 KB 以内"""
+    monkeypatch.setattr(mcp_client, "FILE_UPLOAD_MODE", "auto")
+    monkeypatch.setattr(mcp_client, "FILE_UPLOAD_CHUNK_SIZE", CHUNK_SIZE)
+    monkeypatch.setattr(mcp_client, "FILE_UPLOAD_CHUNKED_THRESHOLD", THRESHOLD)
+    monkeypatch.setattr(mcp_client, "FILE_UPLOAD_RETRY_BASE_DELAY", 0.01)
+
+
+def _make_file(tmp_path, size: int, name: str = "artifact.bin"):
+    path = tmp_path / name
+    # 每个文件内容不同，避免不同用例之间互相去重
+    seed = hashlib.sha256(f"{name}:{size}:{tmp_path}".encode()).digest()
+    data = (seed * (size // len(seed) + 1))[:size]
+    path.write_bytes(data)
+    return str(path), data
+
+
+def _stored_bytes(sha256: str, service: str) -> bytes:
+    info = mock_services._files[mock_services._file_key(service, sha256)]
+    with open(info["path"], "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("size, mode", [
+    (THRESHOLD - 1, "multipart"),
+    (THRESHOLD, "chunked"),
+    (THRESHOLD * 2 + 123, "chunked"),
+])
+def test_threshold_selects_stream_or_chunked(tmp_path, run_with_client, size, mode):
+    file_path, data = _make_file(tmp_path, size)
+    events = []
+
+    result = run_with_client(lambda client: client.upload_file_to_service(
+        {"file_path": file_path, "service_name": "reports"}, progress=events.append))
+
+    assert result["status"] == "success", result
+    assert result["sha256"] == hashlib.sha256(data).hexdigest()
+    assert {event["mode"] for event in events} == {mode}
+    assert events[-1]["bytes_sent"] == size
+    if mode == "chunked":
+        assert events[-1]["parts_done"] == events[-1]["parts_total"] == math.ceil(size / CHUNK_SIZE)
+    assert _stored_bytes(result["sha256"], "reports") == data
+
+
+def test_part_failures_are_retried(tmp_path, run_with_client, monkeypatch):
+    file_path, data = _make_file(tmp_path, THRESHOLD + 1)
+    # 前两次分片请求返回 503
+    draws = iter([0.0, 0.0])
+    monkeypatch.setattr(mock_services, "MOCK_PART_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(mock_services.random, "random", lambda: next(draws, 1.0))
+    failures_before = mock_services._stats["part_failures"]
+
+    result = run_with_client(lambda client: client.upload_file_to_service(
+        {"file_path": file_path, "service_name": "reports"}))
+
+    assert result["status"] == "success", result
+    assert mock_services._stats["part_failures"] - failures_before == 2
+    assert _stored_bytes(result["sha256"], "reports") == data
+
+
+def test_resume_after_partial_upload(tmp_path, run_with_client, monkeypatch):
+    size = CHUNK_SIZE * 6 + 10
+    parts_total = math.ceil(size / CHUNK_SIZE)
+    file_path, data = _make_file(tmp_path, size)
+    # 按顺序逐个上传分片，序号为 3 的分片失败且不重试
+    monkeypatch.setattr(mcp_client, "FILE_UPLOAD_CONCURRENCY", 1)
+    monkeypatch.setattr(mcp_client, "FILE_UPLOAD_PART_RETRIES", 0)
+
+    async def scenario(client):
+        put_part = client._put_part
+        failed = []
+
+        async def flaky_put_part(url, chunk):
+            if url.endswith("/parts/3") and not failed:
+                failed.append(url)
+                raise mcp_client.MCPAPIError(503, {"detail": "连接中断"})
+            return await put_part(url, chunk)
+
+        client._put_part = flaky_put_part
+        parts_before = mock_services._stats["parts"]
+        first = await client.upload_file_to_service({"file_path": file_path, "service_name": "reports"})
+        received_after_failure = mock_services._stats["parts"] - parts_before
+
+        events = []
+        second = await client.upload_file_to_service(
+            {"file_path": file_path, "service_name": "reports"}, progress=events.append)
+        return first, received_after_failure, second, events, mock_services._stats["parts"] - parts_before
+
+    first, received_after_failure, second, events, parts_sent = run_with_client(scenario)
+
+    assert first["status"] == "error"
+    assert received_after_failure == 3
+    assert second["status"] == "success", second
+    # 续传只发送服务端没有的分片
+    assert events[0]["resumed_parts"] == 3
+    assert parts_sent == parts_total
+    assert _stored_bytes(second["sha256"], "reports") == data
+
+
+def test_same_content_is_not_uploaded_twice(tmp_path, run_with_client):
+    file_path, _ = _make_file(tmp_path, 1024)
+
+    async def scenario(client):
+        uploads_before = mock_services._stats["uploads"]
+        first = await client.upload_file_to_service({"file_path": file_path, "service_name": "reports"})
+        second = await client.upload_file_to_service({"file_path": file_path, "service_name": "reports"})
+        return first, second, mock_services._stats["uploads"] - uploads_before
+
+    first, second, uploads = run_with_client(scenario)
+
+    assert first["deduplicated"] is False
+    assert second["deduplicated"] is True
+    assert second["file_id"] == first["file_id"]
+    assert uploads == 1
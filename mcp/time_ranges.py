@@ -0,0 +1,205 @@
+# time_ranges.py
+"""
+中文时间表达式解析
+把「近45天」「过去3个季度」「上个月」「去年」「2024年3月」「2024-03-01到2024-03-15」这类表达式
+解析为左闭右开的时间范围 [start, end)，滚动窗口（近N天）没有上界。
+范围以绑定参数 :start / :end 传给固定的查询条件模板，SQL 文本不随日期变化，
+数据库驱动和数据库可以复用预编译语句和执行计划。边界按服务进程的本地时间计算。
+"""
+
+import re
+import calendar
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+_NUMBER = r"\d+|[一二两三四五六七八九十百]+"
+_UNIT = r"天|日|周|星期|礼拜|季度|季|月|年"
+
+_FULL_DATE = r"\d{4}[-/.]\d{1,2}[-/.]\d{1,2}|\d{4}年\d{1,2}月\d{1,2}[日号]?"
+_YEAR_MONTH = r"\d{4}[-/.]\d{1,2}(?![-/.\d])|\d{4}年\d{1,2}月(?!\d)"
+_YEAR = r"\d{4}年(?!\d)"
+_MONTH_DAY = r"(?<!\d)\d{1,2}月\d{1,2}[日号]"
+_MONTH = r"(?<!\d)\d{1,2}月(?!\d)"
+_DATE = rf"(?:{_FULL_DATE}|{_YEAR_MONTH}|{_YEAR}|{_MONTH_DAY}|{_MONTH})"
+
+# 日历周期：短语 -> (单位, 相对当前周期的偏移)
+CALENDAR_PHRASES = {
+    "今天": ("day", 0), "今日": ("day", 0),
+    "昨天": ("day", -1), "昨日": ("day", -1),
+    "前天": ("day", -2),
+    "本周": ("week", 0), "这周": ("week", 0), "本星期": ("week", 0), "这个星期": ("week", 0),
+    "上周": ("week", -1), "上星期": ("week", -1), "上个星期": ("week", -1),
+    "本月": ("month", 0), "这个月": ("month", 0), "当月": ("month", 0),
+    "上月": ("month", -1), "上个月": ("month", -1),
+    "本季度": ("quarter", 0), "这个季度": ("quarter", 0), "本季": ("quarter", 0),
+    "上季度": ("quarter", -1), "上个季度": ("quarter", -1), "上季": ("quarter", -1),
+    "今年": ("year", 0), "本年": ("year", 0), "当年": ("year", 0),
+    "去年": ("year", -1),
+    "前年": ("year", -2),
+}
+
+_UNITS = {
+    "天": "day", "日": "day",
+    "周": "week", "星期": "week", "礼拜": "week",
+    "月": "month",
+    "季度": "quarter", "季": "quarter",
+    "年": "year",
+}
+
+# 按位置从左到右匹配，同一位置按分组顺序优先
+TIME_EXPRESSION_RE = re.compile(
+    rf"(?P<range>(?:从)?(?P<from>{_DATE})(?:起)?\s*(?:到|至|~|—|-)\s*(?P<to>{_DATE})(?:之间|为止|止)?)"
+    rf"|(?P<date>{_DATE})"
+    rf"|(?P<recent>(?:最近|近|过去|前)(?P<recent_n>{_NUMBER}|半)(?:个)?(?P<recent_unit>{_UNIT}))"
+    rf"|(?P<within>(?P<within_n>{_NUMBER}|半)(?:个)?(?P<within_unit>{_UNIT})(?:以内|之内|内))"
+    rf"|(?P<calendar>{'|'.join(sorted(CALENDAR_PHRASES, key=len, reverse=True))})"
+)
+
+# 查询条件模板，SQL 文本与具体日期无关
+TIME_CONDITION_TEMPLATES = {
+    "range": "{time_field} >= :start AND {time_field} < :end",
+    "since": "{time_field} >= :start",
+}
+
+# SQLite 没有日期类型，时间按文本比较
+SQLITE_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_CN_DIGITS = {"零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+
+
+def parse_number(text: str) -> Optional[int]:
+    """解析阿拉伯数字或一百以内的中文数字"""
+    if text.isdigit():
+        return int(text)
+    if text == "百" or text == "一百":
+        return 100
+    if "十" in text:
+        tens, _, ones = text.partition("十")
+        if tens and tens not in _CN_DIGITS or ones and ones not in _CN_DIGITS:
+            return None
+        return _CN_DIGITS.get(tens, 1) * 10 + _CN_DIGITS.get(ones, 0)
+    return _CN_DIGITS.get(text)
+
+
+@dataclass
+class TimeRange:
+    """左闭右开的时间范围，end 为 None 时没有上界"""
+    phrase: str
+    start: datetime
+    end: Optional[datetime]
+    span: Tuple[int, int] = (0, 0)
+
+    def condition(self, time_field: str) -> str:
+        """时间条件的 SQL 模板"""
+        template = TIME_CONDITION_TEMPLATES["since" if self.end is None else "range"]
+        return template.format(time_field=time_field)
+
+    def to_params(self, db_type: str) -> Dict[str, Any]:
+        """绑定参数；SQLite 使用与 CURRENT_TIMESTAMP 相同格式的文本"""
+        values = {"start": self.start}
+        if self.end is not None:
+            values["end"] = self.end
+        if db_type == "sqlite":
+            return {name: value.strftime(SQLITE_DATETIME_FORMAT) for name, value in values.items()}
+        return values
+
+
+def _add_months(value: datetime, months: int) -> datetime:
+    month_index = value.year * 12 + value.month - 1 + months
+    year, month = divmod(month_index, 12)
+    day = min(value.day, calendar.monthrange(year, month + 1)[1])
+    return value.replace(year=year, month=month + 1, day=day)
+
+
+def _shift(value: datetime, unit: str, amount: int) -> datetime:
+    if unit == "day":
+        return value + timedelta(days=amount)
+    if unit == "week":
+        return value + timedelta(weeks=amount)
+    months = {"month": 1, "quarter": 3, "year": 12}[unit]
+    return _add_months(value, months * amount)
+
+
+def _period_start(now: datetime, unit: str) -> datetime:
+    """当前日历周期的开始时间（周从周一开始）"""
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == "day":
+        return today
+    if unit == "week":
+        return today - timedelta(days=today.weekday())
+    if unit == "month":
+        return today.replace(day=1)
+    if unit == "quarter":
+        return today.replace(month=(today.month - 1) // 3 * 3 + 1, day=1)
+    return today.replace(month=1, day=1)
+
+
+def _parse_date(text: str, default_year: int) -> Tuple[datetime, datetime, int]:
+    """日期、年月或年份 -> (start, end, 年份)，没有年份时使用 default_year"""
+    parts = [int(p) for p in re.findall(r"\d+", text)]
+    if parts[0] >= 1000:
+        year, rest = parts[0], parts[1:]
+    else:
+        year, rest = default_year, parts
+    if not rest:
+        start = datetime(year, 1, 1)
+        return start, _shift(start, "year", 1), year
+    if len(rest) == 1:
+        start = datetime(year, rest[0], 1)
+        return start, _shift(start, "month", 1), year
+    start = datetime(year, rest[0], rest[1])
+    return start, start + timedelta(days=1), year
+
+
+def _relative(now: datetime, count: str, unit: str) -> Optional[Tuple[datetime, None]]:
+    unit = _UNITS[unit]
+    if count == "半":
+        if unit != "year":
+            return None
+        return _shift(now, "month", -6), None
+    amount = parse_number(count)
+    if not amount:
+        return None
+    return _shift(now, unit, -amount), None
+
+
+def _resolve(match: "re.Match", now: datetime) -> Optional[Tuple[datetime, Optional[datetime]]]:
+    kind = match.lastgroup
+    if kind == "range":
+        start, _, year = _parse_date(match.group("from"), now.year)
+        _, end, _ = _parse_date(match.group("to"), year)
+        return (start, end) if start < end else None
+    if kind == "date":
+        start, end, _ = _parse_date(match.group("date"), now.year)
+        return start, end
+    if kind == "recent":
+        return _relative(now, match.group("recent_n"), match.group("recent_unit"))
+    if kind == "within":
+        return _relative(now, match.group("within_n"), match.group("within_unit"))
+    unit, offset = CALENDAR_PHRASES[match.group("calendar")]
+    start = _shift(_period_start(now, unit), unit, offset)
+    return start, _shift(start, unit, 1)
+
+
+def find_time_ranges(text: str, now: Optional[datetime] = None) -> List[TimeRange]:
+    """
+    找出文本中的所有时间表达式（文本应先做 NFKC 归一化）。
+    无法解析的表达式（例如 2024-13-01）不会返回，调用方可以据此判断文本是否被完整解释
+    """
+    now = now or datetime.now()
+    ranges = []
+    for match in TIME_EXPRESSION_RE.finditer(text):
+        try:
+            bounds = _resolve(match, now)
+        except ValueError:
+            bounds = None
+        if bounds is not None:
+            ranges.append(TimeRange(match.group(0), bounds[0], bounds[1], match.span()))
+    return ranges
+
+
+def parse_time_range(text: str, now: Optional[datetime] = None) -> Optional[TimeRange]:
+    """文本中唯一的时间范围；没有或有多个时返回 None"""
+    ranges = find_time_ranges(text, now)
+    return ranges[0] if len(ranges) == 1 else None
@@ -0,0 +1,117 @@
+# upload_index.py
+"""
+上传内容索引
+记录 (服务, 文件 sha256) -> 已上传的 file_id/url，同一份内容再次上传到同一服务时直接复用
+"""
+
+import os
+import time
+import asyncio
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from cache_utils import TTLCache, SQLiteCacheStore, data_path
+
+# 加载环境变量
+load_dotenv()
+
+UPLOAD_DEDUP_ENABLED = os.getenv("UPLOAD_DEDUP_ENABLED", "true").lower() == "true"
+UPLOAD_INDEX_SIZE = int(os.getenv("UPLOAD_INDEX_SIZE", "4096"))
+# 索引条目的有效期（秒），0 表示永久有效
+UPLOAD_INDEX_TTL = float(os.getenv("UPLOAD_INDEX_TTL", "0"))
+# 持久化索引文件路径，为空时只使用内存索引
+UPLOAD_INDEX_DB = os.getenv("UPLOAD_INDEX_DB", data_path("upload_index.db"))
+
+
+class UploadIndex:
+    """内容寻址的上传索引（内存 LRU + 可选 SQLite 持久层）"""
+
+    def __init__(self, maxsize: int = UPLOAD_INDEX_SIZE,
+                 ttl: float = UPLOAD_INDEX_TTL,
+                 db_path: Optional[str] = None,
+                 enabled: bool = UPLOAD_DEDUP_ENABLED):
+        self.enabled = enabled
+        self.ttl = ttl or None
+        self.memory = TTLCache(maxsize=maxsize, ttl=self.ttl)
+        db_path = UPLOAD_INDEX_DB if db_path is None else db_path
+        self.disk: Optional[SQLiteCacheStore] = None
+        if enabled and db_path:
+            try:
+                self.disk = SQLiteCacheStore(db_path, table="upload_index")
+            except Exception as e:
+                print(f"上传索引持久层初始化失败，仅使用内存索引: {str(e)}")
+        self.hits = 0
+        self.misses = 0
+        self.remote_hits = 0
+        self.bytes_saved = 0
+
+    @staticmethod
+    def make_key(service: str, sha256: str) -> str:
+        return f"{service}:{sha256}"
+
+    async def lookup(self, service: str, sha256: str) -> Optional[Dict[str, Any]]:
+        """查找这份内容在该服务上的上传记录"""
+        if not self.enabled:
+            return None
+        key = self.make_key(service, sha256)
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                entry = await loop.run_in_executor(None, self.disk.get, key)
+            except Exception as e:
+                print(f"读取上传索引失败: {str(e)}")
+            if entry is not None:
+                self.memory.set(key, entry)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_saved += entry.get("size", 0)
+        return dict(entry)
+
+    async def record(self, service: str, sha256: str, file_id: Any, url: Any,
+                     size: int = 0, remote: bool = False) -> None:
+        """记录一次成功的上传（或服务端确认已存在的文件）"""
+        if not self.enabled or not (file_id or url):
+            return
+        if remote:
+            self.remote_hits += 1
+            self.bytes_saved += size
+        key = self.make_key(service, sha256)
+        entry = {"file_id": file_id, "url": url, "size": size, "uploaded_at": time.time()}
+        self.memory.set(key, entry)
+        if self.disk is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.disk.set, key, entry, self.ttl)
+            except Exception as e:
+                print(f"写入上传索引失败: {str(e)}")
+
+    def forget(self, service: str, sha256: str) -> None:
+        """删除记录，例如服务端文件已被清理"""
+        key = self.make_key(service, sha256)
+        self.memory.delete(key)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "persistent": self.disk is not None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "remote_hits": self.remote_hits,
+            "bytes_saved": self.bytes_saved,
+            "memory": self.memory.get_stats()
+        }
+
+
+# 全局上传索引
+_upload_index: Optional[UploadIndex] = None
+
+def get_upload_index() -> UploadIndex:
+    """获取全局上传索引，首次使用时创建"""
+    global _upload_index
+    if _upload_index is None:
+        _upload_index = UploadIndex()
+    return _upload_index
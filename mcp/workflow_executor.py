@@ -1,18 +1,145 @@
 # workflow_executor.py
+import os
+import re
+import time
 import asyncio
 import json
-from typing import Any, Dict, List, Tuple
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
 from datetime import datetime
-from mcp_client import call_mcp_api, MCPClient
+from mcp_client import call_mcp_api, MCPClient, get_client
+from async_runner import run_sync
+from rate_limit import TokenBucket, PrioritySemaphore, parse_rate_limits
+from step_cache import StepResultCache, get_step_cache
+from checkpoint_store import (
+    CheckpointStore, get_checkpoint_store, new_run_id,
+    EVENT_WORKFLOW, EVENT_STEP, EVENT_FINISH,
+)
 import llm_parser as Parser
+
+# 执行器级别的全局并发上限（所有工作流共享）
+WORKFLOW_MAX_CONCURRENCY = int(os.getenv("WORKFLOW_MAX_CONCURRENCY", "10"))
+# 按动作的令牌桶限速，格式 "action=次数/秒数"；
+# 钉钉通知由分发器按 webhook 合并和限速，这里不再限制，避免步骤排队等待
+ACTION_RATE_LIMITS = os.getenv(
+    "ACTION_RATE_LIMITS",
+    "deploy=10/60,upload_file=60/60"
+)
+
+# 参数中的上下文引用，例如 ${step_deploy_result}
+CONTEXT_REF_RE = re.compile(r"\$\{(step_[^}.]+?_result)(?:\.[^}]*)?\}")
+# 参数替换时识别的引用，${key} 或 ${key.field.0}
+PARAM_REF_RE = re.compile(r"\$\{([^}.]+)((?:\.[^}.]+)*)\}")
+# 失败状态与未执行状态
+FAILED_STATUSES = {"error", "timeout"}
+NOT_RUN_STATUSES = {"skipped", "cancelled"}
+# 默认的步骤超时和工作流超时（秒），0 表示不限制
+WORKFLOW_STEP_TIMEOUT = float(os.getenv("WORKFLOW_STEP_TIMEOUT", "0"))
+WORKFLOW_TIMEOUT = float(os.getenv("WORKFLOW_TIMEOUT", "0"))
+
 class WorkflowExecutor:
     """工作流执行器"""
 
-    def __init__(self):
-        self.client = MCPClient()
+    def __init__(self, client: Optional[MCPClient] = None,
+                 max_concurrency: Optional[int] = None,
+                 rate_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 checkpoints: Optional[CheckpointStore] = None,
+                 step_cache: Optional[StepResultCache] = None,
+                 progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None):
+        # 默认复用全局客户端及其连接池
+        self.client = client or get_client()
+        # 检查点存储，未启用时为 None
+        self.checkpoints = checkpoints if checkpoints is not None else get_checkpoint_store()
+        # 幂等步骤的结果缓存
+        self.step_cache = step_cache or get_step_cache()
+        # 长时间运行的动作（上传等）的进度事件
+        self.progress_callback = progress_callback
+        
+        # 并发名额按步骤优先级分配，priority 越大越先执行
+        self._slots = PrioritySemaphore(max_concurrency or WORKFLOW_MAX_CONCURRENCY)
+        rate_limits = rate_limits if rate_limits is not None else parse_rate_limits(ACTION_RATE_LIMITS)
+        self._rate_limiters = {
+            action: TokenBucket(rate, capacity) for action, (rate, capacity) in rate_limits.items()
+        }
 
-    async def execute_step(self, step: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
-        """执行单个工作流步骤"""
+    async def _execute_scheduled(self, step: Dict[str, Any], context: Dict[str, Any],
+                                 timeout: Optional[float] = None,
+                                 timing: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """
+        排队获取限速令牌和并发名额后执行步骤，排队时间单独记录。
+        令牌和名额都按步骤优先级发放；等待令牌时不占用并发名额。
+        timing 用于在外层取消时仍能得到排队时间
+        """
+        queued_at = time.perf_counter()
+        timing = timing if timing is not None else {}
+        timing["queued_at"] = queued_at
+        priority = int(step.get("priority", 0))
+        # 缓存命中的步骤不调用服务，不占用限速令牌和并发名额
+        if step.get("cache") is not False:
+            cached = await self.step_cache.lookup(step.get("action"), self._resolve_params(step.get("params", {}), context))
+            if cached is not None:
+                timing["queue_delay"] = 0.0
+                execution_info = await self.execute_step(step, context, cached=cached)
+                execution_info["queue_delay"] = 0.0
+                execution_info["priority"] = priority
+                return execution_info
+        limiter = self._rate_limiters.get(step.get("action"))
+        if limiter is not None:
+            await limiter.acquire(priority=priority)
+        async with self._slots.slot(priority):
+            queue_delay = time.perf_counter() - queued_at
+            timing["queue_delay"] = queue_delay
+            if timeout:
+                start_time = datetime.now()
+                try:
+                    execution_info = await asyncio.wait_for(self.execute_step(step, context), timeout)
+                except asyncio.TimeoutError:
+                    execution_info = _timeout_info(step, start_time, f"步骤执行超时（{timeout} 秒）")
+            else:
+                execution_info = await self.execute_step(step, context)
+        execution_info["queue_delay"] = queue_delay
+        execution_info["priority"] = priority
+        return execution_info
+
+    async def _execute_guarded(self, step: Dict[str, Any], context: Dict[str, Any],
+                               workflow: Dict[str, Any], deadline: Optional[float]) -> Dict[str, Any]:
+        """在步骤超时和工作流截止时间的约束下执行步骤"""
+        step_timeout = step.get("timeout", workflow.get("step_timeout", WORKFLOW_STEP_TIMEOUT))
+        if deadline is None:
+            return await self._execute_scheduled(step, context, step_timeout)
+
+        priority = int(step.get("priority", 0))
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return dict(_not_run_info(step, "cancelled", "工作流已超时"), queue_delay=0.0, priority=priority)
+        start_time = datetime.now()
+        timing: Dict[str, float] = {}
+        try:
+            return await asyncio.wait_for(self._execute_scheduled(step, context, step_timeout, timing), remaining)
+        except asyncio.TimeoutError:
+            # 截止时仍在排队时，排队时间为等待到截止的全部时间
+            queue_delay = timing.get("queue_delay")
+            if queue_delay is None:
+                queue_delay = time.perf_counter() - timing["queued_at"] if "queued_at" in timing else 0.0
+            return dict(_timeout_info(step, start_time, "超过工作流截止时间"),
+                        queue_delay=queue_delay, priority=priority)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """调度器状态"""
+        return {
+            "max_concurrency": self._slots.limit,
+            "running": self._slots.in_use,
+            "waiting": self._slots.waiting,
+            "rate_limits": {
+                action: {"rate_per_second": bucket.rate, "burst": bucket.capacity,
+                         "available": bucket.available, "waiting": bucket.waiting}
+                for action, bucket in self._rate_limiters.items()
+            }
+        }
+
+    async def execute_step(self, step: Dict[str, Any], context: Dict[str, Any],
+                           cached: Optional[Tuple[Dict[str, Any], Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """执行单个工作流步骤，cached 为已查到的缓存结果 (结果, 缓存信息)"""
         action = step.get("action")
         params = step.get("params", {})
         description = step.get("description", f"执行 {action}")
@@ -21,9 +148,29 @@ class WorkflowExecutor:
         resolved_params = self._resolve_params(params, context)
 
         start_time = datetime.now()
+        progress_state: Dict[str, Any] = {}
+
+        def _on_progress(event: Dict[str, Any]) -> None:
+            """记录最近一次进度并转发给执行器的监听者"""
+            event = dict(event, description=description, step_id=step.get("id"))
+            progress_state["last"] = event
+            if self.progress_callback is not None:
+                try:
+                    self.progress_callback(event)
+                except Exception as e:
+                    print(f"进度回调失败: {str(e)}")
+
         try:
-            # 执行动作
-            result = await self.client.execute_action(action, resolved_params)
+            # 执行动作；可缓存的动作优先复用结果，步骤设置 "cache": false 时跳过缓存
+            if cached is not None:
+                result, cache_info = cached
+            else:
+                result, cache_info = await self.step_cache.execute(
+                    action, resolved_params,
+                    lambda progress: self.client.execute_action(action, resolved_params, progress=progress),
+                    bypass=step.get("cache") is False,
+                    progress=_on_progress
+                )
 
             # 记录执行结果
             execution_info = {
@@ -36,10 +183,14 @@ class WorkflowExecutor:
                 "end_time": datetime.now().isoformat(),
                 "duration": (datetime.now() - start_time).total_seconds()
             }
+            if cache_info is not None:
+                execution_info["cache"] = cache_info
+            if "last" in progress_state:
+                execution_info["progress"] = progress_state["last"]
 
             # 更新上下文
             if result.get("status") == "success":
-                context[f"step_{action}_result"] = result
+                _store_result(context, step, result)
 
             return execution_info
 
@@ -57,68 +208,391 @@ class WorkflowExecutor:
             }
 
     def _resolve_params(self, params: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
-        """解析参数中的上下文引用"""
-        resolved = {}
-        for key, value in params.items():
-            if isinstance(value, str) and value.startswith("${") and value.endswith("}"):
-                # 从上下文中获取值
-                context_key = value[2:-1]
-                resolved[key] = context.get(context_key, value)
-            elif isinstance(value, dict):
-                resolved[key] = self._resolve_params(value, context)
-            else:
-                resolved[key] = value
-        return resolved
+        """解析参数中的上下文引用（支持 ${key.field} 路径、字符串中嵌入的引用和列表）"""
+        return {key: _resolve_value(value, context) for key, value in params.items()}
 
     async def execute_workflow_async(self, workflow: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
         """异步执行工作流"""
-        steps = workflow.get("steps", [])
+        return await self._run(workflow, _iterate_steps(workflow.get("steps", [])))
+
+    async def resume_workflow_async(self, run_id: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        从检查点恢复一次运行：已成功的步骤直接复用其结果，其余步骤重新执行，不再调用大模型
+        """
+        if self.checkpoints is None:
+            raise RuntimeError("未启用工作流检查点")
+        loop = asyncio.get_running_loop()
+        run = await loop.run_in_executor(None, self.checkpoints.load_run, run_id)
+        if run is None:
+            raise KeyError(run_id)
+
+        workflow = dict(run["workflow"] or {})
+        steps = list(workflow.get("steps") or [])
+        # 流式解析中途中断时，工作流定义里可能缺少后面的步骤
+        for index in sorted(run["steps"]):
+            if index >= len(steps):
+                steps.append(run["steps"][index]["step"])
+        if not steps:
+            raise ValueError(f"运行 {run_id} 没有可恢复的步骤")
+        workflow["steps"] = steps
+        workflow.pop("error", None)
+
+        completed = {
+            index: data["info"] for index, data in run["steps"].items()
+            if data["info"].get("status") == "success"
+        }
+        return await self._run(workflow, _iterate_steps(steps), run_id=run_id, completed=completed)
+
+    async def execute_workflow_stream(self, steps: AsyncIterator[Dict[str, Any]],
+                                      workflow: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        执行流式到达的工作流步骤，步骤一到达就开始执行，与解析过程重叠。
+        workflow 提供执行选项（parallel、stop_on_error），并在流结束后提供描述信息。
+        """
+        workflow = workflow if workflow is not None else {}
+        return await self._run(workflow, _prefetch(steps))
+
+    def _checkpoint(self, run_id: str, kind: str, payload: Dict[str, Any],
+                    step_index: Optional[int] = None) -> None:
+        """记录检查点事件（只入队，由后台线程批量写入）"""
+        if self.checkpoints is not None:
+            self.checkpoints.record(run_id, kind, payload, step_index)
+
+    def _checkpoint_step(self, run_id: str, index: int, step: Dict[str, Any],
+                         execution_info: Dict[str, Any]) -> None:
+        self._checkpoint(run_id, EVENT_STEP, {"step": step, "info": dict(execution_info)}, index)
+
+    async def _run(self, workflow: Dict[str, Any],
+                   step_source: AsyncIterator[Dict[str, Any]],
+                   run_id: Optional[str] = None,
+                   completed: Optional[Dict[int, Dict[str, Any]]] = None) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """
+        按顺序或并行方式执行步骤来源中的所有步骤。
+        completed 为恢复运行时已成功的步骤（序号 -> 执行信息），这些步骤不再执行。
+        """
+        run_id = run_id or new_run_id()
+        completed = completed or {}
+        self._checkpoint(run_id, EVENT_WORKFLOW, dict(workflow))
         context = {"workflow": workflow}
         steps_result = []
+        total_steps = 0
+        started = time.perf_counter()
+        workflow_timeout = workflow.get("timeout", WORKFLOW_TIMEOUT)
+        deadline = time.monotonic() + workflow_timeout if workflow_timeout else None
 
         # 判断是否可以并行执行
         can_parallel = workflow.get("parallel", False)
 
-        if can_parallel:
-            # 并行执行所有步骤
-            tasks = [self.execute_step(step, context) for step in steps]
-            steps_result = await asyncio.gather(*tasks)
-        else:
-            # 顺序执行步骤
-            for step in steps:
-                step_result = await self.execute_step(step, context)
-                steps_result.append(step_result)
+        try:
+            if can_parallel:
+                # 按依赖关系调度，互不依赖的分支并行执行
+                steps_result, total_steps = await self._run_dag(
+                    workflow, step_source, context, deadline, run_id, completed
+                )
+            else:
+                # 顺序执行步骤
+                async for step in step_source:
+                    index = total_steps
+                    total_steps += 1
+                    if index in completed:
+                        steps_result.append(_resumed_info(completed[index]))
+                        _store_result(context, step, completed[index].get("result", {}))
+                        continue
+                    step_result = await self._execute_guarded(step, context, workflow, deadline)
+                    self._checkpoint_step(run_id, index, step, step_result)
+                    steps_result.append(step_result)
 
-                # 如果步骤失败且设置了停止标志，则停止执行
-                if step_result.get("status") == "error" and workflow.get("stop_on_error", True):
-                    break
+                    # 如果步骤失败且设置了停止标志，则停止执行；工作流超时后不再执行后续步骤
+                    if step_result.get("status") in FAILED_STATUSES and workflow.get("stop_on_error", True):
+                        break
+                    if deadline is not None and time.monotonic() >= deadline:
+                        break
+        finally:
+            await step_source.aclose()
+
+        # 流式解析时以解析出的步骤总数为准
+        total_steps = max(total_steps, len(workflow.get("steps", [])))
 
         # 汇总结果
+        statuses = [s.get("status") for s in steps_result]
+        failed = len([st for st in statuses if st in FAILED_STATUSES])
+        skipped = statuses.count("skipped")
+        cancelled = statuses.count("cancelled")
         summary = {
+            "run_id": run_id,
             "workflow_description": workflow.get("description", "未命名工作流"),
-            "total_steps": len(steps),
-            "completed_steps": len([s for s in steps_result if s.get("status") != "error"]),
-            "failed_steps": len([s for s in steps_result if s.get("status") == "error"]),
-            "total_duration": sum(s.get("duration", 0) for s in steps_result),
-            "status": "success" if all(s.get("status") != "error" for s in steps_result) else "partial_failure"
+            "total_steps": total_steps,
+            "completed_steps": len(statuses) - failed - skipped - cancelled,
+            "failed_steps": failed,
+            "skipped_steps": skipped,
+            "cancelled_steps": cancelled,
+            # 实际墙钟耗时，并行执行时小于各步骤耗时之和
+            "total_duration": time.perf_counter() - started,
+            "status": "success" if failed == skipped == cancelled == 0 else "partial_failure"
         }
+        if deadline is not None and time.monotonic() >= deadline and summary["status"] != "success":
+            summary["status"] = "timeout"
+        if workflow.get("error"):
+            summary["status"] = "partial_failure" if steps_result else "error"
+            summary["error"] = workflow["error"]
+        if completed:
+            summary["resumed_steps"] = len([s for s in steps_result if s.get("resumed")])
 
+        # 流式解析的步骤在运行结束后才完整，随汇总一起记录
+        self._checkpoint(run_id, EVENT_FINISH, {"summary": summary, "workflow": dict(workflow)})
         return summary, steps_result
 
+    async def _run_dag(self, workflow: Dict[str, Any], step_source: AsyncIterator[Dict[str, Any]],
+                       context: Dict[str, Any], deadline: Optional[float] = None,
+                       run_id: Optional[str] = None,
+                       completed: Optional[Dict[int, Dict[str, Any]]] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        依赖感知的调度：依赖从 ${step_<action>_result} 引用和显式的 depends_on 推断，
+        每个步骤在其依赖全部完成后立即启动，依赖失败的步骤被跳过。
+        设置 stop_on_error 时，任一步骤失败或超时都会立即取消仍在执行的兄弟步骤。
+        """
+        stop_on_error = workflow.get("stop_on_error", True)
+        completed = completed or {}
+        steps: List[Dict[str, Any]] = []
+        results: List[Optional[Dict[str, Any]]] = []
+        finished: List[asyncio.Future] = []
+        tasks: List[asyncio.Task] = []
+        running: Dict[int, asyncio.Task] = {}
+        state = {"abort_reason": None}
+        loop = asyncio.get_running_loop()
+
+        def _abort(reason: str, source: int):
+            """取消所有仍在执行的步骤，释放其连接"""
+            if state["abort_reason"] is None:
+                state["abort_reason"] = reason
+            for index, task in list(running.items()):
+                if index != source:
+                    task.cancel()
+
+        async def _run_one(index: int, step: Dict[str, Any], deps: List[int]):
+            try:
+                if deps:
+                    await asyncio.gather(*(finished[d] for d in deps))
+                blocked = [d for d in deps if results[d].get("status") != "success"]
+                if index in completed:
+                    # 恢复运行：复用检查点中的结果
+                    results[index] = _resumed_info(completed[index])
+                    _store_result(context, step, results[index].get("result", {}))
+                elif state["abort_reason"] is not None:
+                    results[index] = _not_run_info(step, "cancelled", state["abort_reason"])
+                elif blocked:
+                    results[index] = _not_run_info(step, "skipped", f"依赖的步骤未成功: {blocked}")
+                else:
+                    # 引用解析为所依赖步骤的结果
+                    local_context = dict(context)
+                    for d in deps:
+                        _store_result(local_context, steps[d], results[d].get("result", {}))
+                    started_at = datetime.now()
+                    running[index] = asyncio.ensure_future(
+                        self._execute_guarded(step, local_context, workflow, deadline)
+                    )
+                    try:
+                        results[index] = await running[index]
+                    except asyncio.CancelledError:
+                        if state["abort_reason"] is None or not running[index].cancelled():
+                            raise
+                        results[index] = _not_run_info(step, "cancelled", state["abort_reason"])
+                        results[index]["start_time"] = started_at.isoformat()
+                    finally:
+                        running.pop(index, None)
+
+                    status = results[index].get("status")
+                    if status == "success":
+                        _store_result(context, step, results[index].get("result", {}))
+                    elif status in FAILED_STATUSES:
+                        if deadline is not None and time.monotonic() >= deadline:
+                            _abort("工作流已超时", index)
+                        elif stop_on_error:
+                            _abort(f"步骤 {index} ({step.get('action')}) 失败，取消其余步骤", index)
+                results[index]["depends_on"] = deps
+                if index not in completed:
+                    self._checkpoint_step(run_id, index, step, results[index])
+            finally:
+                finished[index].set_result(None)
+
+        async for step in step_source:
+            index = len(steps)
+            deps = _infer_dependencies(step, index, steps)
+            steps.append(step)
+            results.append(None)
+            finished.append(loop.create_future())
+            tasks.append(asyncio.ensure_future(_run_one(index, step, deps)))
+
+        await asyncio.gather(*tasks)
+        return results, len(steps)
+
+def _store_result(context: Dict[str, Any], step: Dict[str, Any], result: Any) -> None:
+    """把步骤结果写入上下文，可按动作名或步骤 id 引用"""
+    context[f"step_{step.get('action')}_result"] = result
+    if step.get("id"):
+        context[f"step_{step['id']}_result"] = result
+
+def _find_refs(value: Any) -> Set[str]:
+    """收集参数中引用的上下文键"""
+    if isinstance(value, str):
+        return set(CONTEXT_REF_RE.findall(value))
+    if isinstance(value, dict):
+        return set().union(*(_find_refs(v) for v in value.values())) if value else set()
+    if isinstance(value, list):
+        return set().union(*(_find_refs(v) for v in value)) if value else set()
+    return set()
+
+_MISSING = object()
+
+def _lookup_ref(context: Dict[str, Any], key: str, path: str) -> Any:
+    """按 ${key.field.0} 的路径取值，找不到时返回 _MISSING"""
+    value = context.get(key, _MISSING)
+    for part in filter(None, path.split(".")):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+    return value
+
+def _resolve_value(value: Any, context: Dict[str, Any]) -> Any:
+    """
+    替换值中的上下文引用：整个字符串就是一个引用时保留原始类型，
+    嵌入在字符串中的引用替换为文本，无法解析的引用保持原样
+    """
+    if isinstance(value, dict):
+        return {k: _resolve_value(v, context) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_resolve_value(v, context) for v in value]
+    if not isinstance(value, str) or "${" not in value:
+        return value
+
+    whole = PARAM_REF_RE.fullmatch(value)
+    if whole is not None:
+        found = _lookup_ref(context, whole.group(1), whole.group(2))
+        return value if found is _MISSING else found
+
+    def _substitute(match: "re.Match") -> str:
+        found = _lookup_ref(context, match.group(1), match.group(2))
+        if found is _MISSING:
+            return match.group(0)
+        if isinstance(found, (dict, list)):
+            return json.dumps(found, ensure_ascii=False, default=str)
+        return str(found)
+
+    return PARAM_REF_RE.sub(_substitute, value)
+
+def _infer_dependencies(step: Dict[str, Any], index: int, previous: List[Dict[str, Any]]) -> List[int]:
+    """
+    推断步骤依赖的前序步骤：
+    - 参数中的 ${step_<action|id>_result} 引用，指向最近一个匹配的前序步骤
+    - 显式的 depends_on，可以是步骤序号（从 0 开始）或步骤 id
+    """
+    deps = set()
+    for ref in _find_refs(step.get("params", {})):
+        name = ref[len("step_"):-len("_result")]
+        for i in range(index - 1, -1, -1):
+            if previous[i].get("id") == name or previous[i].get("action") == name:
+                deps.add(i)
+                break
+
+    explicit = step.get("depends_on", [])
+    if not isinstance(explicit, list):
+        explicit = [explicit]
+    for item in explicit:
+        if isinstance(item, int) and 0 <= item < index:
+            deps.add(item)
+        elif isinstance(item, str):
+            for i in range(index - 1, -1, -1):
+                if previous[i].get("id") == item:
+                    deps.add(i)
+                    break
+    return sorted(deps)
+
+def _not_run_info(step: Dict[str, Any], status: str, reason: str) -> Dict[str, Any]:
+    """未执行步骤的执行信息"""
+    now = datetime.now().isoformat()
+    return {
+        "action": step.get("action"),
+        "params": step.get("params", {}),
+        "description": step.get("description", f"执行 {step.get('action')}"),
+        "status": status,
+        "error": reason,
+        "start_time": now,
+        "end_time": now,
+        "duration": 0
+    }
+
+def _resumed_info(execution_info: Dict[str, Any]) -> Dict[str, Any]:
+    """从检查点复用的步骤执行信息"""
+    info = dict(execution_info)
+    info["resumed"] = True
+    return info
+
+def _timeout_info(step: Dict[str, Any], start_time: datetime, reason: str) -> Dict[str, Any]:
+    """超时步骤的执行信息"""
+    info = _not_run_info(step, "timeout", reason)
+    info["start_time"] = start_time.isoformat()
+    info["duration"] = (datetime.now() - start_time).total_seconds()
+    return info
+
+async def _iterate_steps(steps: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """把步骤列表包装为异步迭代器"""
+    for step in steps:
+        yield step
+
+async def _prefetch(steps: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    在后台持续消费步骤流，使解析不会因执行慢而停顿
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    async def _produce():
+        try:
+            async for step in steps:
+                await queue.put(step)
+        finally:
+            await queue.put(done)
+
+    producer = asyncio.ensure_future(_produce())
+    try:
+        while True:
+            step = await queue.get()
+            if step is done:
+                break
+            yield step
+        # 传递解析过程中的异常
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+
+# 进程级共享的执行器
+_default_executor: Optional[WorkflowExecutor] = None
+_default_executor_lock = threading.Lock()
+
+def get_executor() -> WorkflowExecutor:
+    """获取进程级共享的工作流执行器"""
+    global _default_executor
+    if _default_executor is None:
+        with _default_executor_lock:
+            if _default_executor is None:
+                _default_executor = WorkflowExecutor()
+    return _default_executor
+
 def execute_workflow(workflow: Any) -> Tuple[dict, List[dict]]:
     """
     执行结构化工作流，依次调用 mcp API。
     返回最终结果和每一步的执行信息。
     """
-    executor = WorkflowExecutor()
+    # 共享执行器，同步入口之间同样受全局并发上限和动作限速约束
+    executor = get_executor()
 
-    # 创建新的事件循环来执行异步代码
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(executor.execute_workflow_async(workflow))
-    finally:
-        loop.close()
+    # 在常驻后台事件循环上执行异步代码，复用连接池
+    return run_sync(executor.execute_workflow_async(workflow))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,298 @@
+# workflow_templates.py
+"""
+工作流模板
+从大模型的成功解析中学习"查询骨架 -> 工作流骨架"，之后实体值不同的同类查询可以直接在本地填充，无需调用大模型
+"""
+
+import os
+import re
+import copy
+import time
+import unicodedata
+from dataclasses import dataclass, field, asdict
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from cache_utils import stable_hash
+
+# 加载环境变量
+load_dotenv()
+
+WORKFLOW_TEMPLATES_ENABLED = os.getenv("WORKFLOW_TEMPLATES_ENABLED", "true").lower() == "true"
+WORKFLOW_TEMPLATE_MAX = int(os.getenv("WORKFLOW_TEMPLATE_MAX", "256"))
+# 查询中字面量（非槽位）字符所占比例的下限
+WORKFLOW_TEMPLATE_MIN_CONFIDENCE = float(os.getenv("WORKFLOW_TEMPLATE_MIN_CONFIDENCE", "0.4"))
+# 模板至少需要的字面量字符数，过短的骨架太宽泛
+WORKFLOW_TEMPLATE_MIN_LITERAL = int(os.getenv("WORKFLOW_TEMPLATE_MIN_LITERAL", "4"))
+# 槽位值的最短长度
+MIN_SLOT_LENGTH = 2
+
+# 标识符类槽位（项目名、版本、路径等）
+_TOKEN_VALUE_RE = re.compile(r"^[A-Za-z0-9_.\-/:@]+$")
+_TOKEN_SLOT = r"[A-Za-z0-9_.\-/:@]+"
+_TEXT_SLOT = r".+?"
+# 槽位值中出现这些连接词，说明查询比模板多出了步骤
+_CHAIN_CONNECTOR_RE = re.compile(r"然后|并且|接着|随后|之后|同时|最后")
+_PLACEHOLDER_RE = re.compile(r"\{\{(slot_\d+)\}\}")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _prepare(text: str) -> str:
+    """模板匹配用的轻量归一化：全角转半角、合并空白，保留大小写以便回填"""
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+@dataclass
+class WorkflowTemplate:
+    """学习到的工作流模板"""
+    template_id: str
+    pattern: str
+    slots: Dict[str, str]  # 槽位名 -> 类型（token/text）
+    skeleton: Dict[str, Any]
+    source_query: str
+    actions_hash: str
+    literal_length: int
+    hits: int = 0
+    created_at: float = field(default_factory=time.time)
+    last_used: Optional[float] = None
+
+    def __post_init__(self):
+        self._regex = re.compile(self.pattern, re.IGNORECASE)
+
+    def match(self, query: str) -> Optional[Tuple[Dict[str, str], float]]:
+        """匹配查询，返回 (槽位值, 置信度)"""
+        m = self._regex.match(query)
+        if m is None:
+            return None
+        values = m.groupdict()
+        for value in values.values():
+            if len(value.strip()) < 1 or _CHAIN_CONNECTOR_RE.search(value):
+                return None
+        confidence = self.literal_length / max(len(query), 1)
+        return values, confidence
+
+    def fill(self, values: Dict[str, str]) -> Dict[str, Any]:
+        """用槽位值填充工作流骨架"""
+        def _fill(node):
+            if isinstance(node, str):
+                return _PLACEHOLDER_RE.sub(lambda m: values[m.group(1)], node)
+            if isinstance(node, dict):
+                return {k: _fill(v) for k, v in node.items()}
+            if isinstance(node, list):
+                return [_fill(v) for v in node]
+            return node
+        return _fill(copy.deepcopy(self.skeleton))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _iter_strings(node) -> List[str]:
+    """收集工作流参数中的所有字符串值"""
+    if isinstance(node, str):
+        return [node]
+    if isinstance(node, dict):
+        return [s for v in node.values() for s in _iter_strings(v)]
+    if isinstance(node, list):
+        return [s for v in node for s in _iter_strings(v)]
+    return []
+
+
+class WorkflowTemplateStore:
+    """工作流模板库"""
+
+    def __init__(self, max_templates: int = WORKFLOW_TEMPLATE_MAX,
+                 min_confidence: float = WORKFLOW_TEMPLATE_MIN_CONFIDENCE,
+                 min_literal: int = WORKFLOW_TEMPLATE_MIN_LITERAL,
+                 enabled: bool = WORKFLOW_TEMPLATES_ENABLED):
+        self.enabled = enabled
+        self.max_templates = max_templates
+        self.min_confidence = min_confidence
+        self.min_literal = min_literal
+        self._templates: "OrderedDict[str, WorkflowTemplate]" = OrderedDict()
+        self.matches = 0
+        self.misses = 0
+        self.rejected = 0
+        self.learned = 0
+
+    def learn(self, natural_language: str, workflow: Dict[str, Any],
+              actions: Dict[str, Any]) -> Optional[WorkflowTemplate]:
+        """
+        从一次成功的解析中学习模板。
+        参数值在查询中原样出现的部分被标记为槽位；没有槽位或骨架过于宽泛时放弃学习。
+        """
+        if not self.enabled or workflow.get("error") or not workflow.get("steps"):
+            return None
+        query = _prepare(natural_language)
+        folded = query.casefold()
+
+        # 找出在查询中恰好出现一次的参数值，长的优先
+        candidates = set()
+        for step in workflow["steps"]:
+            for value in _iter_strings(step.get("params", {})):
+                value = _prepare(value)
+                if len(value) >= MIN_SLOT_LENGTH and folded.count(value.casefold()) == 1:
+                    candidates.add(value)
+
+        spans: List[Tuple[int, int, str]] = []
+        for value in sorted(candidates, key=len, reverse=True):
+            start = folded.index(value.casefold())
+            end = start + len(value)
+            if any(start < s_end and s_start < end for s_start, s_end, _ in spans):
+                continue
+            spans.append((start, end, query[start:end]))
+        if not spans:
+            return None
+        spans.sort()
+
+        # 构建正则：字面量转义，槽位按值的形态选择匹配规则
+        pattern_parts = []
+        slots: Dict[str, str] = {}
+        slot_values: Dict[str, str] = {}
+        cursor = 0
+        literal_length = 0
+        for index, (start, end, value) in enumerate(spans):
+            literal = query[cursor:start]
+            if index > 0 and not literal:
+                # 相邻槽位之间没有分隔，无法可靠切分
+                return None
+            pattern_parts.append(re.escape(literal))
+            literal_length += len(literal)
+            name = f"slot_{index}"
+            kind = "token" if _TOKEN_VALUE_RE.match(value) else "text"
+            slots[name] = kind
+            slot_values[name] = value
+            pattern_parts.append(f"(?P<{name}>{_TOKEN_SLOT if kind == 'token' else _TEXT_SLOT})")
+            cursor = end
+        tail = query[cursor:]
+        pattern_parts.append(re.escape(tail))
+        literal_length += len(tail)
+        if literal_length < self.min_literal:
+            return None
+        pattern = "^" + "".join(pattern_parts) + "$"
+
+        # 工作流骨架：参数中出现的槽位值替换为占位符
+        def _templatize(node):
+            if isinstance(node, str):
+                text = _prepare(node)
+                for name, value in sorted(slot_values.items(), key=lambda kv: len(kv[1]), reverse=True):
+                    text = re.sub(re.escape(value), "{{%s}}" % name, text, flags=re.IGNORECASE)
+                return text if text != _prepare(node) else node
+            if isinstance(node, dict):
+                return {k: _templatize(v) for k, v in node.items()}
+            if isinstance(node, list):
+                return [_templatize(v) for v in node]
+            return node
+
+        skeleton = copy.deepcopy(workflow)
+        for step in skeleton["steps"]:
+            step["params"] = _templatize(step.get("params", {}))
+        if "description" in skeleton:
+            skeleton["description"] = _templatize(skeleton["description"])
+
+        actions_hash = stable_hash(actions)
+        template_id = stable_hash(pattern, actions_hash)[:16]
+        existing = self._templates.get(template_id)
+        if existing is not None:
+            # 同一骨架以最新一次解析为准，保留命中统计
+            existing.skeleton = skeleton
+            existing.source_query = natural_language
+            self._templates.move_to_end(template_id)
+            return existing
+
+        template = WorkflowTemplate(
+            template_id=template_id,
+            pattern=pattern,
+            slots=slots,
+            skeleton=skeleton,
+            source_query=natural_language,
+            actions_hash=actions_hash,
+            literal_length=literal_length
+        )
+        self._templates[template_id] = template
+        self.learned += 1
+        while len(self._templates) > self.max_templates:
+            self._templates.popitem(last=False)
+        return template
+
+    def match(self, natural_language: str, actions: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        用已学习的模板解析查询，置信度不足或没有匹配时返回 None（由调用方回退到大模型）
+        """
+        if not self.enabled or not self._templates:
+            return None
+        query = _prepare(natural_language)
+        actions_hash = stable_hash(actions)
+
+        best: Optional[Tuple[float, WorkflowTemplate, Dict[str, str]]] = None
+        for template in self._templates.values():
+            if template.actions_hash != actions_hash:
+                continue
+            result = template.match(query)
+            if result is None:
+                continue
+            values, confidence = result
+            if best is None or confidence > best[0]:
+                best = (confidence, template, values)
+
+        if best is None:
+            self.misses += 1
+            return None
+        confidence, template, values = best
+        if confidence < self.min_confidence:
+            self.rejected += 1
+            return None
+
+        workflow = template.fill(values)
+        if any(step.get("action") not in actions for step in workflow.get("steps", [])):
+            self.rejected += 1
+            return None
+
+        template.hits += 1
+        template.last_used = time.time()
+        self._templates.move_to_end(template.template_id)
+        self.matches += 1
+        return workflow
+
+    def list_templates(self) -> List[Dict[str, Any]]:
+        """列出所有模板"""
+        return [t.to_dict() for t in self._templates.values()]
+
+    def remove(self, template_id: str) -> bool:
+        """删除指定模板"""
+        return self._templates.pop(template_id, None) is not None
+
+    def prune(self, min_hits: int = 0, max_idle_seconds: Optional[float] = None) -> int:
+        """清理命中次数过少或长期未使用的模板，返回删除数量"""
+        now = time.time()
+        removed = 0
+        for template_id, template in list(self._templates.items()):
+            last_active = template.last_used or template.created_at
+            too_few_hits = template.hits < min_hits
+            idle = max_idle_seconds is not None and now - last_active > max_idle_seconds
+            if too_few_hits or idle:
+                del self._templates[template_id]
+                removed += 1
+        return removed
+
+    def clear(self) -> None:
+        self._templates.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "templates": len(self._templates),
+            "learned": self.learned,
+            "matches": self.matches,
+            "misses": self.misses,
+            "rejected": self.rejected
+        }
+
+
+# 全局模板库
+_template_store = WorkflowTemplateStore()
+
+def get_template_store() -> WorkflowTemplateStore:
+    """获取全局工作流模板库"""
+    return _template_store